@@ -0,0 +1,86 @@
+"""
+Hydration benchmark for kemist.database.Database.get_molecules.
+
+Builds a synthetic database and compares get_molecules, with its relations prefetched, left unloaded or loaded on
+first access, against the previous implementation which ran two extra queries per molecule.
+
+    python -m benchmarks.bench_hydration --sizes 10000 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from kemist.core import Molecule
+from kemist.database import Database
+
+
+def make_database(path, size):
+    database = Database(path)
+    database.make_structure()
+    database.connection.executemany(
+        "INSERT INTO molecules (uid, iupac, formula, in_libview, mode) VALUES(?, ?, ?, ?, ?)",
+        ((uid, f"iupac {uid}", f"C{uid}H{uid}", uid % 2, "both") for uid in range(1, size + 1)),
+    )
+    database.connection.executemany(
+        "INSERT INTO molecule_names (name, molecule_uid) VALUES(?, ?)",
+        ((f"{prefix} {uid}", uid) for uid in range(1, size + 1) for prefix in ["name", "synonym"]),
+    )
+    database.connection.executemany(
+        "INSERT INTO molecule_retention_times (molecule_uid, column, retention_time) VALUES(?, ?, ?)",
+        ((uid, column, uid / 1000) for uid in range(1, size + 1) for column in ["RT PFP", "RT Scherzo"]),
+    )
+    database.connection.commit()
+    return database
+
+
+def get_molecules_n_plus_one(database):
+    cursor = database.cursor
+    res = cursor.execute("SELECT uid, iupac, formula, in_libview, mode FROM molecules")
+    molecules = [Molecule(*row) for row in res.fetchall()]
+    for m in molecules:
+        res = cursor.execute("SELECT name FROM molecule_names WHERE molecule_uid=?", [m.uid])
+        for (name,) in res.fetchall():
+            m.known_names.append(name)
+        res = cursor.execute(
+            "SELECT retention_time, column FROM molecule_retention_times WHERE molecule_uid=?", [m.uid]
+        )
+        for rt, column in res.fetchall():
+            m.retention_times[column] = rt
+    return molecules
+
+
+def get_molecules_and_touch(database):
+    molecules = database.get_molecules()
+    for m in molecules:
+        m.known_names, m.retention_times
+    return molecules
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--n-plus-one-limit", type=int, default=20000, help="skip the old implementation above this")
+    args = parser.parse_args()
+
+    print(f"{'molecules':>10} {'prefetch (s)':>13} {'lazy (s)':>9} {'on access (s)':>14} {'N+1 queries (s)':>16}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            database = make_database(os.path.join(folder, f"bench_{size}.db"), size)
+            prefetch = timed(database.get_molecules, prefetch=("names", "rts"))
+            lazy = timed(database.get_molecules)
+            on_access = timed(get_molecules_and_touch, database)
+            n_plus_one = f"{timed(get_molecules_n_plus_one, database):.2f}" if size <= args.n_plus_one_limit else "-"
+            print(f"{size:>10} {prefetch:>13.2f} {lazy:>9.2f} {on_access:>14.2f} {n_plus_one:>16}")
+            database.connection.close()
+
+
+if __name__ == "__main__":
+    main()
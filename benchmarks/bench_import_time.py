@@ -0,0 +1,107 @@
+"""
+Import time budget of the kemist-db and kemist subcommands.
+
+Runs each subcommand in a fresh interpreter with python -X importtime, against a throw-away HOME holding a small
+database, and reports the total import time (best of --repeat runs). Exits with status 1 when a subcommand exceeds
+its budget or imports a module it should not need.
+
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --scale 2    # e.g. on a slow machine
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOLECULES = os.path.join(REPOSITORY, "data", "db1.csv")
+
+RUNNER = """
+import sys
+sys.argv = sys.argv[1:]
+from kemist.apps.entry_points import kemist_db, kemist
+(kemist_db if sys.argv[0] == "kemist-db" else kemist)()
+"""
+
+HEAVY_MODULES = ["cirpy", "fuzzysearch", "numpy", "sqlite3", "argformat"]
+
+# (arguments, budget in ms, modules that must not be imported)
+SUBCOMMANDS = [
+    (["kemist-db", "list"], 100, HEAVY_MODULES),
+    (["kemist-db", "set", "bench"], 100, HEAVY_MODULES),
+    (["kemist-db", "cache", "stats"], 130, ["cirpy", "fuzzysearch", "numpy", "argformat"]),
+    (["kemist-db", "export", os.devnull], 130, ["cirpy", "fuzzysearch", "numpy", "argformat"]),
+    (["kemist-db", "update", "-m", MOLECULES], 130, ["cirpy", "fuzzysearch", "numpy", "argformat"]),
+    (["kemist-db", "update", "-m", MOLECULES, "-R"], 170, ["cirpy", "numpy", "argformat"]),
+    (["kemist", "rt", "2.0", "-C", "RT PFP"], 260, ["cirpy", "fuzzysearch", "argformat"]),
+    (["kemist", "mass", "105.1148"], 260, ["cirpy", "fuzzysearch", "argformat"]),
+    (["kemist-db", "--help"], 130, ["cirpy", "fuzzysearch", "numpy", "sqlite3"]),
+]
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def run(arguments, environment):
+    # Returns the total import time in ms and the imported modules
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER, *arguments],
+        env=environment,
+        cwd=REPOSITORY,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    total = 0
+    modules = set()
+    for line in process.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, module = match.groups()
+        modules.add(module)
+        if not indent:
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this factor")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as home:
+        environment = dict(os.environ, HOME=home, PYTHONPATH=REPOSITORY)
+        environment.pop("XDG_DATA_HOME", None)
+        environment.pop("XDG_CONFIG_HOME", None)
+        subprocess.run(
+            [sys.executable, "-c", RUNNER, "kemist-db", "create", "bench", "-m", MOLECULES, "--make-default"],
+            env=environment,
+            cwd=REPOSITORY,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+        print(f"{'subcommand':<40} {'import (ms)':>12} {'budget (ms)':>12}  unexpected imports")
+        for arguments, budget, forbidden in SUBCOMMANDS:
+            runs = [run(arguments, environment) for _ in range(args.repeat)]
+            total = min(t for t, _ in runs)
+            unexpected = sorted(m for m in forbidden if m in runs[0][1])
+            budget *= args.scale
+            status = "" if total <= budget and not unexpected else "  FAILED"
+            failures += bool(status)
+            label = " ".join(os.path.basename(a) if a.startswith(os.sep) else a for a in arguments)
+            print(f"{label:<40} {total:>12.1f} {budget:>12.0f}  {', '.join(unexpected) or '-'}{status}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
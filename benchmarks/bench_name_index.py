@@ -0,0 +1,56 @@
+"""
+Scaling benchmark for kemist.core.NameIndex.
+
+Compares the time needed to find every name within one edit of a query against the brute force scan
+that are_same_molecules used to perform (one _are_name_close call per known name).
+
+    python -m benchmarks.bench_name_index --sizes 1000 10000 50000
+"""
+
+import argparse
+import random
+import time
+
+import kemist.core as km
+from kemist.core.molecule import _are_name_close
+
+from benchmarks.generator import make_name
+
+
+def time_queries(function, queries):
+    start = time.perf_counter()
+    for query in queries:
+        function(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--brute-force-limit", type=int, default=5000, help="skip brute force above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'build (s)':>10} {'index (ms/query)':>17} {'brute force (ms/query)':>23}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        names = [make_name(rng) for _ in range(size)]
+        queries = [make_name(rng) for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        index = km.NameIndex(names)
+        build = time.perf_counter() - start
+
+        indexed = time_queries(index.close_names, queries)
+        brute_force = "-"
+        if size <= args.brute_force_limit:
+            brute_force_queries = queries[: max(1, args.queries // 10)]
+            per_query = time_queries(lambda q: [n for n in names if _are_name_close(q, n)], brute_force_queries)
+            brute_force = f"{per_query * 1000:.2f}"
+
+        print(f"{size:>8} {build:>10.2f} {indexed * 1000:>17.2f} {brute_force:>23}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+End to end benchmark of the main kemist-db stages on synthetic libraries (see benchmarks.generator).
+
+For every size, times and records the peak traced memory of:
+    load_molecules, merge_strict, merge_relaxed, update_all_molecules, get_molecules, update_all_storage_units,
+    get_storage_units, export, create_strict, update_strict, create_relaxed and update_relaxed
+merge_* merge the whole library in memory, create_* and update_* run kemist-db create and update on batches of
+--batch-size rows, and therefore look up the molecules and close names of every batch in the database. Updates merge a
+second library of a tenth of the size.
+Results are written as JSON and compared with a baseline, the exit status is 1 when a stage got slower or used more
+memory than the baseline allows. Baselines only make sense on the machine that recorded them.
+Synthetic names are built from a few dozen fragments, so the number of close names, and the time of relaxed merging,
+grow quadratically with the size. Relaxed merging, creation and update are only run up to --relaxed-limit rows.
+
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 --baseline benchmarks/baseline.json
+    python -m benchmarks.bench_suite --sizes 1000000 --relaxed-limit 0
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generator import generate_library
+
+STAGES = [
+    "load_molecules",
+    "merge_strict",
+    "merge_relaxed",
+    "update_all_molecules",
+    "get_molecules",
+    "update_all_storage_units",
+    "get_storage_units",
+    "export",
+    "create_strict",
+    "update_strict",
+    "create_relaxed",
+    "update_relaxed",
+]
+
+
+class Recorder(object):
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def measure(self, stage, function, *args, **kwargs):
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        record = {"seconds": round(seconds, 4)}
+        if self.trace_memory:
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            tracemalloc.stop()
+        self.results[stage] = record
+        return result
+
+
+def _load(path):
+    import kemist.apps as kapps
+
+    with open(path) as file:
+        return kapps.load_molecules(file)
+
+
+def _merge(molecules, confirm):
+    import kemist.apps as kapps
+    import kemist.core as km
+
+    kapps.confirm = confirm
+    return kapps.KemistDb._merge_in_existing_molecule_list(molecules, km.MoleculeIndex())
+
+
+def _create(kemist_db, name, path, confirm, batch_size):
+    import kemist.apps as kapps
+
+    kapps.confirm = confirm
+    with open(path) as file:
+        kemist_db.create(name, kapps.iter_molecule_batches(file, batch_size), [], None, False)
+
+
+def _update(kemist_db, name, path, confirm, batch_size):
+    import kemist.apps as kapps
+
+    kapps.confirm = confirm
+    with open(path) as file:
+        kemist_db.update(name, kapps.iter_molecule_batches(file, batch_size), [], None)
+
+
+def _load_storage(path):
+    import kemist.apps as kapps
+
+    with open(path) as file:
+        return kapps.load_storage_areas(file)
+
+
+def run_size(size, seed, folder, relaxed_limit, trace_memory, batch_size):
+    import kemist.apps as kapps
+    import kemist.database
+
+    recorder = Recorder(trace_memory)
+    molecules_path, storage_path = generate_library(folder, size, seed)
+
+    molecules = recorder.measure("load_molecules", _load, molecules_path)
+    merged = recorder.measure("merge_strict", _merge, molecules, kapps.strict_confirm)
+    if size <= relaxed_limit:
+        recorder.measure("merge_relaxed", _merge, _load(molecules_path), kapps.relaxed_confirm)
+
+    kemist_db = kapps.KemistDb()
+    name = f"bench_{size}"
+    path = kemist_db.config.register_database(name)
+    database = kemist.database.Database(path)
+    database.make_structure()
+    recorder.measure("update_all_molecules", database.update_all_molecules, merged)
+    del molecules, merged
+
+    recorder.measure("get_molecules", database.get_molecules, prefetch=("names", "rts"))
+    storage_units = _load_storage(storage_path)
+    recorder.measure("update_all_storage_units", database.update_all_storage_units, storage_units)
+    recorder.measure("get_storage_units", database.get_storage_units, prefetch=("names",))
+    database.close()
+
+    recorder.measure("export", kemist_db.export, name, os.path.join(folder, "export.csv"))
+
+    update_folder = os.path.join(folder, "update")
+    os.makedirs(update_folder)
+    update_path, _ = generate_library(update_folder, max(1, size // 10), seed + 1)
+    confirms = [("strict", kapps.strict_confirm)]
+    if size <= relaxed_limit:
+        confirms.append(("relaxed", kapps.relaxed_confirm))
+    for matching, confirm in confirms:
+        name = f"bench_{size}_{matching}"
+        recorder.measure(f"create_{matching}", _create, kemist_db, name, molecules_path, confirm, batch_size)
+        recorder.measure(f"update_{matching}", _update, kemist_db, name, update_path, confirm, batch_size)
+    return recorder.results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, min_seconds):
+    # Returns the regressions of results against baseline as printable lines
+    regressions = []
+    for size, stages in results.items():
+        for stage, record in stages.items():
+            reference = baseline.get("results", {}).get(size, {}).get(stage)
+            if reference is None:
+                continue
+            seconds, reference_seconds = record["seconds"], reference["seconds"]
+            if seconds > reference_seconds * (1 + time_tolerance) and seconds - reference_seconds > min_seconds:
+                regressions.append(f"{size:>8} {stage:<26} time {reference_seconds:.3f}s -> {seconds:.3f}s")
+            if "peak_mb" in record and "peak_mb" in reference:
+                peak, reference_peak = record["peak_mb"], reference["peak_mb"]
+                if peak > reference_peak * (1 + memory_tolerance) and peak - reference_peak > 1:
+                    regressions.append(f"{size:>8} {stage:<26} memory {reference_peak:.1f}MB -> {peak:.1f}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--relaxed-limit", type=int, default=2000, help="skip relaxed merging above this size")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per batch of the create and update stages")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (tracing slows stages down)")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare with")
+    parser.add_argument("--save-baseline", default=None, help="write the results as a new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="allowed relative slow down")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10, help="allowed relative memory increase")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slow downs smaller than this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Databases are registered in a throw-away configuration
+        os.environ["HOME"] = home
+        os.environ.pop("XDG_DATA_HOME", None)
+        os.environ.pop("XDG_CONFIG_HOME", None)
+        import kemist.core as km
+
+        # Storage rows naming unknown molecules are expected
+        km.logger.setLevel(logging.CRITICAL)
+
+        results = {}
+        print(f"{'rows':>8} {'stage':<26} {'time (s)':>9} {'peak (MB)':>10}")
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as folder:
+                results[str(size)] = run_size(
+                    size, args.seed, folder, args.relaxed_limit, not args.no_memory, args.batch_size
+                )
+            for stage in STAGES:
+                record = results[str(size)].get(stage)
+                if record is not None:
+                    peak = f"{record['peak_mb']:.1f}" if "peak_mb" in record else "-"
+                    print(f"{size:>8} {stage:<26} {record['seconds']:>9.3f} {peak:>10}")
+
+    report = {
+        "meta": {
+            "seed": args.seed,
+            "batch_size": args.batch_size,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "traced_memory": not args.no_memory,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    for path in [args.output, args.save_baseline]:
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["meta"].get("traced_memory") != report["meta"]["traced_memory"]:
+            print("Warning: the baseline was recorded with a different memory tracing setting")
+        regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.min_seconds)
+        if regressions:
+            print("Regressions against the baseline:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
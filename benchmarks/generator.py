@@ -0,0 +1,133 @@
+"""
+Seeded generator of synthetic Kemist libraries.
+
+Writes a molecule CSV (Name;IUPAC name;Formula;MSMS library view;Mode;RT PFP;RT Scherzo) and a storage CSV
+(Name;Storage) with the given number of rows. Names are built from chemical fragments and come with the variants
+found in real libraries: upper case spellings, stereo prefixes, one-edit typos and rows repeating a molecule that
+was already listed (with a typo or more information). The same seed always produces the same files.
+
+    python -m benchmarks.generator --rows 100000 --output /tmp/library
+"""
+
+import argparse
+import os
+import random
+
+PREFIXES = ["", "", "n-", "l-", "d-", "2-", "3-", "4-", "cis-", "trans-"]
+FRAGMENTS = [
+    "methyl", "ethyl", "propyl", "butyl", "amino", "hydroxy", "oxo", "phenyl", "benz", "pyr", "idine", "imid",
+    "azol", "acet", "ate", "ine", "ol", "one", "ic acid", "glut", "aden", "guan", "osine", "threon", "cholin",
+]  # fmt: skip
+ELEMENTS = [("C", 1, 30), ("H", 1, 50), ("N", 0, 5), ("O", 0, 10), ("S", 0, 2), ("P", 0, 2)]
+MODES = ["pos", "neg", "both", ""]
+STORAGE_UNITS = [f"{unit} {i}" for unit in ["Freezer", "Fridge", "Shelf", "Fluidome HILIC"] for i in range(1, 6)]
+
+MOLECULE_HEADERS = ["Name", "IUPAC name", "Formula", "MSMS library view", "Mode", "RT PFP", "RT Scherzo"]
+STORAGE_HEADERS = ["Name", "Storage"]
+
+
+def make_name(rng):
+    name = rng.choice(PREFIXES) + "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(2, 4)))
+    if rng.random() < 0.3:
+        name = make_typo(rng, name)
+    return name
+
+
+def make_typo(rng, name):
+    # One random substitution, insertion or deletion
+    position = rng.randrange(len(name))
+    edit = rng.choice(["substitution", "insertion", "deletion"])
+    if edit == "substitution":
+        return name[:position] + rng.choice("aeiouxyz") + name[position + 1 :]
+    if edit == "insertion":
+        return name[:position] + rng.choice("aeiouxyz") + name[position:]
+    return name[:position] + name[position + 1 :] if len(name) > 1 else name
+
+
+def make_formula(rng):
+    formula = ""
+    for element, minimum, maximum in ELEMENTS:
+        count = rng.randint(minimum, maximum)
+        if count:
+            formula += element + (str(count) if count > 1 else "")
+    return formula
+
+
+def make_spelling(rng, name):
+    return rng.choice([name, name, name, name.capitalize(), name.upper(), f"  {name} "])
+
+
+def iter_molecule_rows(rng, rows):
+    molecules = []
+    for _ in range(rows):
+        if molecules and rng.random() < 0.15:
+            # A molecule listed again, sometimes with a typo or with information the first row lacked
+            name, iupac, formula = rng.choice(molecules)
+            if rng.random() < 0.3:
+                name = make_typo(rng, name)
+            formula = formula if rng.random() < 0.5 else ""
+        else:
+            name = make_name(rng)
+            iupac = name.replace("-", " ") if rng.random() < 0.2 else ""
+            formula = make_formula(rng) if rng.random() < 0.6 else ""
+            molecules.append((name, iupac, formula))
+
+        yield [
+            make_spelling(rng, name),
+            iupac,
+            formula,
+            rng.choice(["yes", "no", "no", ""]),
+            rng.choice(MODES),
+            f"{rng.uniform(0.5, 15):.2f}" if rng.random() < 0.8 else "",
+            f"{rng.uniform(0.5, 15):.2f}" if rng.random() < 0.5 else "",
+        ]
+
+
+def iter_storage_rows(rng, rows, names):
+    for _ in range(rows):
+        # Some stored molecules are not in the library
+        name = rng.choice(names) if names and rng.random() < 0.9 else make_name(rng)
+        yield [make_spelling(rng, name), rng.choice(STORAGE_UNITS)]
+
+
+def _write_rows(path, headers, rows):
+    with open(path, "w", newline="") as file:
+        file.write(";".join(headers) + "\n")
+        for row in rows:
+            file.write(";".join(row) + "\n")
+
+
+def generate_library(folder, rows, seed=0, storage_rows=None):
+    # Writes molecules.csv and storage.csv in folder and returns their paths
+    rng = random.Random(seed)
+    molecules_path = os.path.join(folder, "molecules.csv")
+    storage_path = os.path.join(folder, "storage.csv")
+
+    names = []
+
+    def remember_names(molecule_rows):
+        for row in molecule_rows:
+            names.append(row[0].strip().lower())
+            yield row
+
+    _write_rows(molecules_path, MOLECULE_HEADERS, remember_names(iter_molecule_rows(rng, rows)))
+    storage_rows = storage_rows if storage_rows is not None else max(1, rows // 10)
+    _write_rows(storage_path, STORAGE_HEADERS, iter_storage_rows(rng, storage_rows, names))
+    return molecules_path, storage_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--storage-rows", type=int, default=None, help="defaults to a tenth of --rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=".")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for path in generate_library(args.output, args.rows, args.seed, args.storage_rows):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,35 @@
+import importlib
+
 from .csv_loader import *
 from .arg_parsers import *
-from .kemist_db import *
 from .confirmation_utils import *
+
+# The commands are imported on first access, see kemist.core
+_LAZY_ATTRIBUTES = {
+    "EXPORT_HEADERS": ".kemist_db",
+    "MATCH_DECISION_HEADERS": ".kemist_db",
+    "KemistDb": ".kemist_db",
+    "RT_SEARCH_HEADERS": ".kemist_query",
+    "MASS_SEARCH_HEADERS": ".kemist_query",
+    "LOCATE_HEADERS": ".kemist_query",
+    "NAME_SEARCH_HEADERS": ".kemist_query",
+    "DATABASE_HEADER": ".kemist_query",
+    "KemistQuery": ".kemist_query",
+    "QueryIndexes": ".kemist_query",
+    "KemistClient": ".kemist_client",
+    "connect_to_server": ".kemist_client",
+    "KemistServer": ".kemist_server",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -1,5 +1,25 @@
 import argparse
-from argformat import StructuredFormatter
+
+from kemist.apps.csv_loader import DEFAULT_BATCH_SIZE
+
+
+# Stands for argformat.StructuredFormatter, which is only imported once a help or usage message is formatted.
+# Building the parsers only needs argparse's checks of the arguments metavars.
+class _LazyStructuredFormatter(object):
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._formatter = None
+
+    def _format_args(self, action, default_metavar):
+        return argparse.HelpFormatter(*self._args, **self._kwargs)._format_args(action, default_metavar)
+
+    def __getattr__(self, name):
+        if self._formatter is None:
+            from argformat import StructuredFormatter
+
+            self._formatter = StructuredFormatter(*self._args, **self._kwargs)
+        return getattr(self._formatter, name)
 
 
 def make_kemist_db_parser():
@@ -7,15 +27,15 @@ def make_kemist_db_parser():
         prog="kemist-db",
         description="Database management tool for Kemist",
         epilog="Plz Gib Mony :'(",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
 
-    subparsers = parser.add_subparsers(dest="verb")
+    subparsers = parser.add_subparsers(dest="verb", prog=parser.prog)
     parser_create = subparsers.add_parser(
         "create",
         description="Create a new Kemist database",
         help="create a new database.",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
     parser_create.add_argument(
         "database",
@@ -28,34 +48,66 @@ def make_kemist_db_parser():
     parser_update = subparsers.add_parser(
         "update",
         help="Update an existing database",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
     parser_update.add_argument("--database", help="Database to export", required=False, default=None)
 
     parser_set_default = subparsers.add_parser(
         "set",
         help="Select the default database",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
     parser_set_default.add_argument("database", help="Database name to set as default")
 
     parser_list = subparsers.add_parser(
         "list",
         help="List existing databases",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
 
     parser_export = subparsers.add_parser(
         "export",
         help="Export a database as a CSV file",
-        formatter_class=StructuredFormatter,
+        formatter_class=_LazyStructuredFormatter,
     )
     parser_export.add_argument("output", help="Output file")
     parser_export.add_argument("--database", help="Database to export", required=False, default=None)
+    parser_export.add_argument(
+        "--columns",
+        help="comma separated list of the columns to export, in order\n"
+        "e.g. 'Name,Formula,RT PFP'. All columns are exported if ommited",
+        type=lambda value: [column.strip() for column in value.split(",") if column.strip()],
+        required=False,
+        default=None,
+    )
+    parser_export.add_argument(
+        "--gzip", action="store_true", help="compress the output with gzip (implied by a .gz output file)"
+    )
+
+    parser_cache = subparsers.add_parser(
+        "cache",
+        help="Inspect or clear the CIR resolver cache",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_cache.add_argument("action", choices=["stats", "clear"], help="show cache statistics or empty the cache")
 
-    for p in [parser_create, parser_update, parser_set_default, parser_list, parser_export]:
+    for p in [parser_create, parser_update, parser_set_default, parser_list, parser_export, parser_cache]:
         p.add_argument("-v", "--verbose", action="store_true", help="Enables verbose logging output.")
 
+    for p in [parser_create, parser_update, parser_export]:
+        p.add_argument(
+            "--profile", action="store_true", help="log the time spent in each step and processing counters once done"
+        )
+        p.add_argument(
+            "--profile-json", metavar="PATH", default=None, help="also write the profile as JSON (implies --profile)"
+        )
+        p.add_argument(
+            "--profile-cprofile",
+            metavar="PATH",
+            default=None,
+            help="also record the run with cProfile, the output can be read with pstats (implies --profile)",
+        )
+
     for p in [parser_create, parser_update]:
         p.add_argument(
             "-m",
@@ -80,6 +132,54 @@ def make_kemist_db_parser():
             required=False,
         )
         p.add_argument("-c", "--complete", action="store_true", help="complete molecules information using CIR.")
+        p.add_argument(
+            "--cir-workers", type=int, default=8, help="maximum number of concurrent CIR requests used by --complete"
+        )
+        p.add_argument(
+            "--cir-rate",
+            type=float,
+            default=None,
+            help="maximum number of CIR requests per second used by --complete\nUnlimited if ommited",
+        )
+        p.add_argument(
+            "--cir-retries", type=int, default=3, help="number of retries of a failed CIR request before giving up"
+        )
+        p.add_argument(
+            "--no-cache", action="store_true", help="do not use nor fill the CIR resolver cache used by --complete"
+        )
+        p.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="number of processes comparing names during relaxed or interactive matching\n"
+            "Results and questions are the same whatever the number of processes",
+        )
+        p.add_argument(
+            "--rt-tolerance",
+            type=float,
+            default=None,
+            help="only consider relaxed or interactive matches whose retention times differ by at most this much\n"
+            "Retention times are compared on the columns known for both molecules, "
+            "pairs without such a column are always considered",
+        )
+        p.add_argument(
+            "--decisions",
+            help="answers to matching questions, applied instead of asking them\n"
+            "This must be the path to a CSV file containing the following header:\n"
+            "Name;Other name;Similarity;Same\n"
+            "Where Same is yes or no, other rows are ignored (see --pending)\n"
+            "Decisions are stored in the database and applied to later updates as well\n ",
+            type=argparse.FileType("r"),
+            required=False,
+        )
+        p.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="number of CSV rows read and processed at once\n"
+            "Peak memory grows with the batch size instead of the size of the input files",
+        )
 
         group = p.add_mutually_exclusive_group()
         group.add_argument(
@@ -104,4 +204,147 @@ def make_kemist_db_parser():
             default=False,
         )
 
+    parser_update.add_argument(
+        "--pending",
+        metavar="PATH",
+        default=None,
+        help="write the matching questions without a decision to a CSV file instead of asking them\n"
+        "Nothing is added to the database, the file can be answered and given back with --decisions\n"
+        "Implies -I",
+    )
+
+    return parser
+
+
+def _float_list_file(path):
+    with open(path) as file:
+        return [float(value) for value in file.read().replace(";", " ").replace(",", " ").split()]
+
+
+def _name_list_file(path):
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def make_kemist_parser():
+    parser = argparse.ArgumentParser(
+        prog="kemist",
+        description="Query tool for Kemist databases",
+        epilog="Plz Gib Mony :'(",
+        formatter_class=_LazyStructuredFormatter,
+    )
+
+    subparsers = parser.add_subparsers(dest="verb", prog=parser.prog)
+    parser_rt = subparsers.add_parser(
+        "rt",
+        description="Find the molecules eluting within a retention time window",
+        help="search molecules by retention time.",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_rt.add_argument("retention_times", help="retention times to look up", type=float, nargs="*")
+    parser_rt.add_argument(
+        "-i",
+        "--input",
+        help="file containing retention times to look up\n"
+        "Values can be separated by spaces, new lines, commas or semicolons",
+        type=_float_list_file,
+        required=False,
+        default=[],
+    )
+    parser_rt.add_argument("-C", "--column", help="chromatography column, e.g. 'RT PFP'", required=True)
+    parser_rt.add_argument(
+        "-t", "--tolerance", help="half width of the retention time window", type=float, required=False, default=0.1
+    )
+
+    parser_mass = subparsers.add_parser(
+        "mass",
+        description="Find the molecules whose [M+H]+ or [M-H]- ions match observed m/z values\n"
+        "Adducts are chosen from the ionisation mode of each molecule",
+        help="search molecules by m/z.",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_mass.add_argument("mzs", help="m/z values to look up", type=float, nargs="*")
+    parser_mass.add_argument(
+        "-i",
+        "--input",
+        help="file containing m/z values to look up\n"
+        "Values can be separated by spaces, new lines, commas or semicolons",
+        type=_float_list_file,
+        required=False,
+        default=[],
+    )
+    parser_mass.add_argument(
+        "-p", "--ppm", help="mass tolerance in parts per million", type=float, required=False, default=5.0
+    )
+
+    parser_locate = subparsers.add_parser(
+        "locate",
+        description="Find the storage units holding molecules, given any of their names",
+        help="search storage units by molecule name.",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_locate.add_argument("names", help="molecule names to look up", nargs="*")
+    parser_locate.add_argument(
+        "-i",
+        "--input",
+        help="file containing molecule names to look up, one per line",
+        type=_name_list_file,
+        required=False,
+        default=[],
+    )
+
+    parser_search = subparsers.add_parser(
+        "search",
+        description="Find molecules by part of one of their names, allowing one typo",
+        help="search molecules by name.",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_search.add_argument("queries", help="names or parts of names to look up", nargs="*")
+    parser_search.add_argument(
+        "-i",
+        "--input",
+        help="file containing names to look up, one per line",
+        type=_name_list_file,
+        required=False,
+        default=[],
+    )
+    parser_search.add_argument(
+        "-n", "--limit", help="maximum number of matches per query", type=int, required=False, default=10
+    )
+
+    parser_serve = subparsers.add_parser(
+        "serve",
+        description="Keep a database and its indexes loaded and answer the queries of the other commands\n"
+        "Indexes are reloaded when the database changes",
+        help="serve queries from a long running process.",
+        formatter_class=_LazyStructuredFormatter,
+    )
+    parser_serve.add_argument(
+        "--socket",
+        help="Unix socket to listen on\n"
+        "Other commands only use the server listening on the default socket of the configuration directory",
+        required=False,
+        default=None,
+    )
+    parser_serve.add_argument(
+        "--http", help="also listen on this port of localhost, 0 picks a free port", type=int, required=False
+    )
+
+    for p in [parser_rt, parser_mass, parser_locate, parser_search, parser_serve]:
+        p.add_argument("--database", help="Database to query", required=False, default=None)
+        p.add_argument("-v", "--verbose", action="store_true", help="Enables verbose logging output.")
+
+    for p in [parser_rt, parser_mass, parser_locate, parser_search]:
+        p.add_argument(
+            "--no-server", action="store_true", help="query the database directly even if kemist serve is running"
+        )
+
+    for p in [parser_rt, parser_locate]:
+        p.add_argument(
+            "-A",
+            "--all-databases",
+            action="store_true",
+            help="query every registered database at once, results start with a Database column",
+        )
+
     return parser
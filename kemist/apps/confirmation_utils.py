@@ -1,3 +1,6 @@
+import kemist.core as km
+
+
 def interactive_confirm(s):
     answer = ""
     while answer not in ["y", "n"]:
@@ -13,4 +16,35 @@ def relaxed_confirm(_):
     return True
 
 
+def rank_questions(questions):
+    # (name, other_name, similarity) of each question, the most similar names first
+    import difflib
+
+    ranked = [(name, other, difflib.SequenceMatcher(None, name, other).ratio()) for name, other in questions]
+    return sorted(ranked, key=lambda question: (-question[2], question[0], question[1]))
+
+
+def interactive_review(ranked_questions):
+    # Asks every question in turn and returns {name_pair: same}.
+    # A or R answers yes or no to the current question and to all the following ones.
+    decisions = {}
+    for i, (name, other_name, similarity) in enumerate(ranked_questions):
+        answer = ""
+        while answer not in ["y", "n", "A", "R"]:
+            answer = input(
+                f"[{i + 1}/{len(ranked_questions)}] ({similarity:.0%} similar) "
+                f"Is {name} the same molecule as {other_name}? [y/n/A/R]\n"
+            ).strip()
+            if answer not in ["A", "R"]:
+                # A and R are upper case only, so that a bulk answer is never given by mistake
+                answer = answer.lower()
+        if answer in ["A", "R"]:
+            for remaining_name, remaining_other_name, _ in ranked_questions[i:]:
+                decisions[km.name_pair(remaining_name, remaining_other_name)] = answer == "A"
+            break
+        decisions[km.name_pair(name, other_name)] = answer == "y"
+    return decisions
+
+
 confirm = interactive_confirm
+review = interactive_review
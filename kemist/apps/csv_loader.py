@@ -1,57 +1,127 @@
+import csv
+import itertools
+
 import kemist.core as km
 
+DEFAULT_BATCH_SIZE = 10000
 
-def load_molecules(file):
-    molecules = []
-    # Consume header
-    headers = file.readline().split(";")
 
-    for line in file.readlines():
-        columns = line.split(";")
+def _iter_rows(file, min_columns):
+    reader = csv.reader(file, delimiter=";")
+    headers = next(reader, None)
+    if headers is None:
+        return
+
+    for columns in reader:
+        if not any(cell.strip() for cell in columns):
+            continue
+        if len(columns) < min_columns:
+            km.logger.error(f"Line {reader.line_num}: expected at least {min_columns} cells. Skipping it...")
+            continue
+        yield reader.line_num, headers, columns
+
 
-        name = columns[0].strip().lower()
-        iupac = columns[1].strip()
-        iupac = iupac if iupac != "" else None
+def _molecule_from_row(headers, columns):
+    name = columns[0].strip().lower()
+    iupac = columns[1].strip()
+    iupac = iupac if iupac != "" else None
 
-        formula = columns[2].strip()
-        formula = formula if formula != "" else None
+    formula = columns[2].strip()
+    formula = formula if formula != "" else None
 
-        on_libview = False
-        if columns[3] and columns[3].strip().lower() == "yes":
-            on_libview = True
+    on_libview = False
+    if columns[3] and columns[3].strip().lower() == "yes":
+        on_libview = True
 
-        mode = columns[4].strip().lower()
+    mode = columns[4].strip().lower()
 
-        retention_times = {}
-        for i in range(5, len(headers)):
+    retention_times = {}
+    for i in range(5, min(len(headers), len(columns))):
+        if columns[i].strip() != "":
             retention_times[headers[i].strip()] = float(columns[i])
 
-        molecules.append(
-            km.Molecule(
-                iupac=iupac,
-                formula=formula,
-                is_on_libview=on_libview,
-                mode=mode,
-                known_names=[name],
-                retention_times=retention_times,
-            )
-        )
+    return km.Molecule(
+        iupac=iupac,
+        formula=formula,
+        is_on_libview=on_libview,
+        mode=mode,
+        known_names=[name],
+        retention_times=retention_times,
+    )
+
+
+def iter_molecules(file):
+    for line_num, headers, columns in _iter_rows(file, 5):
+        try:
+            yield _molecule_from_row(headers, columns)
+        except ValueError as e:
+            km.logger.error(f"Line {line_num}: {e}. Skipping it...")
+
+
+def iter_batches(iterable, batch_size=DEFAULT_BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def _iter_profiled_batches(batches, span, counter, size=len):
+    # Rows are parsed while a batch is pulled, the parsing of every batch is recorded as a span of its consumer
+    batches = iter(batches)
+    while True:
+        with km.profiler.span(span):
+            batch = next(batches, None)
+        if batch is None:
+            return
+        km.profiler.count(counter, size(batch))
+        yield batch
+
+
+def iter_molecule_batches(file, batch_size=DEFAULT_BATCH_SIZE):
+    return _iter_profiled_batches(iter_batches(iter_molecules(file), batch_size), "parse molecules", "molecules loaded")
+
+
+def load_molecules(file):
+    with km.profiler.span("parse molecules"):
+        molecules = list(iter_molecules(file))
+    km.profiler.count("molecules loaded", len(molecules))
     return molecules
 
 
-def load_storage_areas(file):
-    storages = {}
-    file.readline()  # Consume header
-    for line in file.readlines():
-        columns = line.split(";")
+def iter_storage_rows(file):
+    for _, _, columns in _iter_rows(file, 2):
+        yield columns[0].strip().lower(), columns[1].strip().lower()
 
-        storage_name = columns[1].strip().lower()
-        molecule_name = columns[0].strip().lower()
 
+def _group_storage_rows(rows):
+    storages = {}
+    for molecule_name, storage_name in rows:
         if storage_name in storages:
             storages[storage_name].append(km.Molecule(known_names=[molecule_name]))
         else:
             storages[storage_name] = [km.Molecule(known_names=[molecule_name])]
 
-    sto = [km.StorageUnit(name, molecules) for name, molecules in storages.items()]
-    return sto
+    return [km.StorageUnit(name, molecules) for name, molecules in storages.items()]
+
+
+def iter_storage_batches(file, batch_size=DEFAULT_BATCH_SIZE):
+    # Each batch groups at most batch_size rows, a storage unit may therefore appear in several batches
+    batches = (_group_storage_rows(rows) for rows in iter_batches(iter_storage_rows(file), batch_size))
+    yield from _iter_profiled_batches(
+        batches, "parse storage", "storage rows loaded", lambda units: sum(len(u.molecules) for u in units)
+    )
+
+
+def load_storage_areas(file):
+    return _group_storage_rows(iter_storage_rows(file))
+
+
+def iter_match_decisions(file):
+    # Rows of a Name;Other name;Similarity;Same file, questions whose last cell is neither yes nor no are undecided
+    for _, _, columns in _iter_rows(file, 3):
+        same = columns[-1].strip().lower()
+        if same in ["yes", "no"]:
+            yield km.name_pair(columns[0].strip().lower(), columns[1].strip().lower()), same == "yes"
+
+
+def load_match_decisions(file):
+    return dict(iter_match_decisions(file))
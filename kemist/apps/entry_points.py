@@ -1,3 +1,5 @@
+import contextlib
+
 import kemist.core as km
 import kemist.apps as kapps
 
@@ -14,32 +16,110 @@ def kemist_db():
 
     molecules = []
     storage_units = []
+    completer = None
     if args.verb in ["create", "update"]:
-        if args.interactive:
+        if args.interactive or getattr(args, "pending", None) is not None:
             kapps.confirm = kapps.interactive_confirm
             km.logger.debug(f"Using interactive matching")
         elif args.relaxed:
             kapps.confirm = kapps.relaxed_confirm
             km.logger.debug(f"Using relaxed matching")
         else:
+            kapps.confirm = kapps.strict_confirm
             km.logger.debug(f"Using strict matching")
 
         if args.molecules is not None:
-            molecules = kapps.load_molecules(args.molecules)
+            molecules = kapps.iter_molecule_batches(args.molecules, args.batch_size)
         if args.storage is not None:
-            storage_units = kapps.load_storage_areas(args.storage)
+            storage_units = kapps.iter_storage_batches(args.storage, args.batch_size)
 
     kemist_core = kapps.KemistDb()
+    if args.verb in ["create", "update"] and args.complete:
+        completer = kemist_core.make_completer(args.cir_workers, args.cir_rate, args.cir_retries, not args.no_cache)
+
+    profiling = contextlib.nullcontext()
+    if args.verb in ["create", "update", "export"] and (args.profile or args.profile_json or args.profile_cprofile):
+        profiling = km.profile_session(args.profile_json, args.profile_cprofile)
+
     if args.verb == "create":
-        kemist_core.create(args.database, molecules, storage_units, args.complete, args.make_default)
+        with profiling:
+            kemist_core.create(
+                args.database,
+                molecules,
+                storage_units,
+                completer,
+                args.make_default,
+                args.jobs,
+                args.rt_tolerance,
+                args.decisions,
+            )
     elif args.verb == "set":
         kemist_core.set_default(args.database)
     elif args.verb == "list":
         kemist_core.list_databases()
     elif args.verb == "export":
-        kemist_core.export(args.database, args.output)
+        with profiling:
+            kemist_core.export(args.database, args.output, args.columns, args.gzip)
     elif args.verb == "update":
-        kemist_core.update(args.database, molecules, storage_units, args.complete)
+        with profiling:
+            kemist_core.update(
+                args.database,
+                molecules,
+                storage_units,
+                completer,
+                args.jobs,
+                args.rt_tolerance,
+                args.decisions,
+                args.pending,
+            )
+    elif args.verb == "cache":
+        if args.action == "stats":
+            kemist_core.cache_stats()
+        elif args.action == "clear":
+            kemist_core.cache_clear()
+
+
+def kemist():
+    parser = kapps.make_kemist_parser()
+    args = parser.parse_args()
+
+    if args.verb is None:
+        parser.print_help()
+        return
+
+    km.set_verbose_logging(args.verbose)
+
+    kemist_query = kapps.KemistQuery()
+    if args.verb == "rt":
+        retention_times = args.retention_times + args.input
+        if not retention_times:
+            parser.error("no retention time to look up")
+        if args.all_databases:
+            kemist_query.search_all_retention_times(args.column, retention_times, args.tolerance)
+        else:
+            kemist_query.search_retention_times(
+                args.database, args.column, retention_times, args.tolerance, use_server=not args.no_server
+            )
+    elif args.verb == "mass":
+        mzs = args.mzs + args.input
+        if not mzs:
+            parser.error("no m/z to look up")
+        kemist_query.search_masses(args.database, mzs, args.ppm, use_server=not args.no_server)
+    elif args.verb == "locate":
+        names = args.names + args.input
+        if not names:
+            parser.error("no molecule name to look up")
+        if args.all_databases:
+            kemist_query.locate_all(names)
+        else:
+            kemist_query.locate(args.database, names, use_server=not args.no_server)
+    elif args.verb == "search":
+        queries = args.queries + args.input
+        if not queries:
+            parser.error("no name to look up")
+        kemist_query.search_names(args.database, queries, args.limit, use_server=not args.no_server)
+    elif args.verb == "serve":
+        kemist_query.serve(args.database, args.socket, args.http)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,4 @@
-def kemist():
-    pass
+from kemist.apps.entry_points import kemist
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import json
+import os
+import socket
+import urllib.request
+
+DEFAULT_TIMEOUT = 60.0
+
+
+# Thin client of KemistServer. A request is a JSON object (see QueryIndexes.answer) or a list of them answered in
+# order, sent as one line over the Unix socket of the server or POSTed to its HTTP endpoint.
+class KemistClient(object):
+    def __init__(self, socket_path=None, url=None, timeout=DEFAULT_TIMEOUT):
+        if (socket_path is None) == (url is None):
+            raise RuntimeError("A client needs either a socket path or a URL")
+        self.socket_path = socket_path
+        self.url = url
+        self.timeout = timeout
+
+    def request(self, request):
+        data = json.dumps(request).encode()
+        if self.url is not None:
+            http_request = urllib.request.Request(self.url, data, {"Content-Type": "application/json"})
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.timeout)
+            connection.connect(self.socket_path)
+            connection.sendall(data + b"\n")
+            with connection.makefile("rb") as file:
+                line = file.readline()
+        if not line:
+            raise RuntimeError(f"The server at {self.socket_path} closed the connection")
+        return json.loads(line)
+
+
+def connect_to_server(socket_path):
+    # A client of the server listening on socket_path, None if there is none
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except OSError:
+            return None
+    return KemistClient(socket_path)
@@ -1,9 +1,17 @@
+from __future__ import annotations
+
+import csv
+import gzip
+
 import kemist.core as km
 import kemist.config
 import kemist.database
 
 import kemist.apps as kapps
-from typing import List
+from typing import Iterable, List, Optional
+
+EXPORT_HEADERS = ["Name", "IUPAC name", "Formula", "MSMS library view", "Mode"]
+MATCH_DECISION_HEADERS = ["Name", "Other name", "Similarity", "Same"]
 
 
 class KemistDb(object):
@@ -20,7 +28,28 @@ class KemistDb(object):
     def list_databases(self):
         km.logger.info(f"Existing databases are :\n{self.config.databases}")
 
-    def export(self, name, dest):
+    def make_completer(self, max_workers, requests_per_second, retries, use_cache=True):
+        cache = km.ResolverCache(self.config.get_resolver_cache_path()) if use_cache else None
+        return km.MoleculeCompleter(
+            max_workers=max_workers, requests_per_second=requests_per_second, retries=retries, cache=cache
+        )
+
+    def cache_stats(self):
+        stats = km.ResolverCache(self.config.get_resolver_cache_path()).stats()
+        km.logger.info(
+            f"Resolver cache {stats['path']}:\n"
+            f"Entries : {stats['entries']} / {stats['max_entries']}\n"
+            f"Unresolvable entries : {stats['negative_entries']}\n"
+            f"Expired entries : {stats['expired_entries']}\n"
+            f"Size : {stats['size_bytes'] / 1024:.1f} KiB"
+        )
+
+    def cache_clear(self):
+        km.ResolverCache(self.config.get_resolver_cache_path()).clear()
+        km.logger.info(f"Cleared resolver cache")
+
+    @km.profiler.timed("export")
+    def export(self, name, dest, columns=None, compress=False):
         if name is None:
             name = self.config.get_default_database_name()
             if name is None:
@@ -33,112 +62,296 @@ class KemistDb(object):
             km.logger.error(f"Could not open database {name}")
             return
 
-        database = kemist.database.Database(path)
-
-        def as_str(mol, rts):
-            res = f"{mol.known_names[0]};"
-            res += f"{mol.iupac};" if mol.iupac is not None else ";"
-            res += f"{mol.formula};" if mol.formula is not None else ";"
-            res += f"yes;" if mol.is_on_libview == 1 else "no;"
-            res += f"{mol.mode}" if mol.mode is not None else ""
-
-            for retention_time in rts:
-                res += f"; {mol.retention_times.get(retention_time, '')}"
-
-            return res
+        database = kemist.database.Database(path, pooled=True)
 
         rt_names = database.get_known_retention_times()
+        headers = EXPORT_HEADERS + rt_names
+        if columns is None:
+            columns = headers
+        unknown_columns = [c for c in columns if c not in headers]
+        if unknown_columns:
+            km.logger.error(f"Unknown columns {unknown_columns}. Available columns are {headers}")
+            return
 
-        with open(dest, "w") as output:
-            output.write("Name; IUPAC name; Formula; MSMS Library view; Mode")
-            for rt in rt_names:
-                output.write(";" + rt)
-            output.write("\n")
+        rt_columns = [c for c in columns if c in rt_names]
+        row_headers = EXPORT_HEADERS + rt_columns
+        positions = [row_headers.index(c) for c in columns]
 
-            for m in database.get_molecules():
-                output.write(as_str(m, rt_names) + "\n")
+        def as_cells(row):
+            name, iupac, formula, on_libview, mode, *rts = row
+            cells = [name, iupac, formula, "yes" if on_libview == 1 else "no", mode, *rts]
+            return [cells[i] for i in positions]
 
+        compress = compress or dest.endswith(".gz")
+        opener = gzip.open if compress else open
+        with opener(dest, "wt", newline="") as output:
+            writer = csv.writer(output, delimiter=";")
+            writer.writerow(columns)
+            writer.writerows(as_cells(row) for row in database.iter_export_rows(rt_columns))
+        database.close()
+
+    @km.profiler.timed("create")
     def create(
         self,
         name: str,
-        new_molecules: List[km.Molecule],
-        storage_units: List[km.StorageUnit],
-        should_complete_molecules: bool,
+        molecule_batches: Iterable[List[km.Molecule]],
+        storage_batches: Iterable[List[km.StorageUnit]],
+        completer: Optional[km.MoleculeCompleter],
         make_default: bool,
+        jobs: int = 1,
+        rt_tolerance: Optional[float] = None,
+        decisions_file=None,
     ):
         km.logger.info("Creating database")
         db_path = self.config.register_database(name, make_default)
         if db_path is None:
             return
-        database = kemist.database.Database(db_path)
+        database = kemist.database.Database(db_path, pooled=True)
         database.make_structure()
+        decisions = KemistDb._load_match_decisions(database, decisions_file)
 
         km.logger.info("Processing molecules")
-        existing_molecules = []
-        KemistDb._merge_in_existing_molecule_list(new_molecules, existing_molecules, should_complete_molecules)
-        database.update_all_molecules(existing_molecules)
+        KemistDb._merge_batches(database, molecule_batches, completer, jobs, rt_tolerance, decisions)
 
         km.logger.info("Processing storage units")
-        db_molecules = database.get_molecules()
-        for su in storage_units:
-            km.logger.debug(f"Processing {su.name}")
-            for new_molecule in su.molecules:
-                if should_complete_molecules:
-                    new_molecule.try_to_complete()
-            KemistDb._merge_in_existing_molecule_list(db_molecules, su.molecules, False, False)
-        # database.update_all_molecules(su.molecules)
-        database.update_all_storage_units(storage_units)
+        for storage_units in storage_batches:
+            # Stored molecules are looked up by name in the database
+            database.update_all_storage_units(storage_units)
 
+        database.close()
         self.config.save()
 
     @staticmethod
+    def _merge_batches(
+        database, molecule_batches, completer, jobs=1, rt_tolerance=None, decisions=None, pending_questions=None
+    ):
+        # Merges each batch with the molecules of the database it may match and writes the result before reading the
+        # next one, memory therefore depends on the batch size rather than on the size of the input or the database.
+        # Relaxed matching looks up the known names close to the names of the batch in the database.
+        # With pending_questions, the questions of interactive matching are collected into it and nothing is written.
+        stored_decisions = dict(decisions or {})
+        finder = KemistDb._make_close_name_finder(jobs)
+        for new_molecules in molecule_batches:
+            if completer is not None:
+                completer.complete(new_molecules)
+
+            relaxed_uids = set()
+            close_names = None
+            if KemistDb._uses_relaxed_matching():
+                with km.profiler.span("close names"):
+                    close_names, relaxed_uids = KemistDb._batch_close_names(
+                        database, new_molecules, finder, rt_tolerance
+                    )
+
+            prefetch = ("names",) if rt_tolerance is None else ("names", "rts")
+            existing_molecules = km.MoleculeIndex(database.find_molecules(new_molecules, relaxed_uids, prefetch))
+            if pending_questions is not None:
+                pending_questions.update(
+                    KemistDb._collect_relaxed_questions(
+                        new_molecules, existing_molecules, decisions, close_names, rt_tolerance
+                    )
+                )
+                continue
+            if KemistDb._uses_interactive_matching():
+                KemistDb._review_relaxed_matches(
+                    new_molecules, existing_molecules, decisions, close_names, rt_tolerance
+                )
+            updated_molecules = KemistDb._merge_in_existing_molecule_list(
+                new_molecules,
+                existing_molecules,
+                close_names=close_names,
+                rt_tolerance=rt_tolerance,
+                decisions=decisions,
+            )
+            database.update_all_molecules(updated_molecules)
+            KemistDb._store_new_decisions(database, decisions, stored_decisions)
+
+        if finder is not None:
+            finder.close()
+
+    @staticmethod
+    def _uses_relaxed_matching():
+        return kapps.confirm is not kapps.strict_confirm
+
+    @staticmethod
+    def _uses_interactive_matching():
+        return kapps.confirm is not kapps.strict_confirm and kapps.confirm is not kapps.relaxed_confirm
+
+    @staticmethod
+    def _load_match_decisions(database, decisions_file=None):
+        # Decisions of previous runs, updated with the ones of decisions_file (see write_pending_questions).
+        # Strict matching never asks anything and gets None.
+        if not KemistDb._uses_relaxed_matching():
+            return None
+        if decisions_file is not None:
+            file_decisions = kapps.load_match_decisions(decisions_file)
+            km.logger.info(f"Loaded {len(file_decisions)} match decisions")
+            database.store_match_decisions(file_decisions)
+        return database.get_match_decisions()
+
+    @staticmethod
+    def _store_new_decisions(database, decisions, stored_decisions):
+        if decisions is None:
+            return
+        new_decisions = {key: same for key, same in decisions.items() if stored_decisions.get(key) != same}
+        if new_decisions:
+            database.store_match_decisions(new_decisions)
+            stored_decisions.update(new_decisions)
+
+    @staticmethod
+    def _make_close_name_finder(jobs):
+        # Names are only compared by relaxed and interactive matching
+        if not KemistDb._uses_relaxed_matching():
+            return None
+        return km.CloseNameFinder(jobs)
+
+    @staticmethod
+    @km.profiler.timed("merge")
     def _merge_in_existing_molecule_list(
-        new_molecules: List[km.Molecule],
-        existing_molecules: List[km.Molecule],
-        should_complete_molecules: bool,
+        new_molecules: Iterable[km.Molecule],
+        existing_molecules: km.MoleculeIndex,
         add_non_existing: bool = True,
+        close_names: Optional[dict] = None,
+        rt_tolerance: Optional[float] = None,
+        decisions: Optional[dict] = None,
+        ask=None,
     ):
+        # Returns the existing molecules modified by the merge and the new molecules that were added.
+        # close_names optionally holds the names close to the names of new_molecules (see CloseNameFinder).
+        # With rt_tolerance, relaxed matches whose retention times differ by more than rt_tolerance are not considered.
+        # decisions optionally holds the match decisions to apply instead of asking, see _confirm_relaxed_match.
+        updated_molecules = {}
         for new_molecule in new_molecules:
-            if should_complete_molecules:
-                new_molecule.try_to_complete()
+            match = existing_molecules.find_strict(new_molecule)
+            if match is None and KemistDb._uses_relaxed_matching():
+                close_pairs = decisions if decisions is not None else ()
+                for relaxed_match in existing_molecules.iter_relaxed(
+                    new_molecule, close_names, rt_tolerance, close_pairs
+                ):
+                    if KemistDb._confirm_relaxed_match(new_molecule, relaxed_match, decisions, ask):
+                        match = relaxed_match
+                        break
 
-            strict_match = next(
-                filter(lambda m: km.are_same_molecules(new_molecule, m) == km.Equivalence.STRICT, existing_molecules),
-                None,
-            )
-            found = False
-            if strict_match is not None:
-                strict_match.merge_with(new_molecule)
-                found = True
-            else:
-                relaxed_match = next(
-                    filter(
-                        lambda m: km.are_same_molecules(new_molecule, m) == km.Equivalence.RELAXED, existing_molecules
-                    ),
-                    None,
+            if match is not None:
+                match.merge_with(new_molecule)
+                existing_molecules.update(match)
+                updated_molecules[id(match)] = match
+            elif add_non_existing:
+                existing_molecules.add(new_molecule)
+                updated_molecules[id(new_molecule)] = new_molecule
+
+        return list(updated_molecules.values())
+
+    @staticmethod
+    def _confirm_relaxed_match(new_molecule, match, decisions=None, ask=None):
+        # A decision taken before is applied, otherwise the question goes to ask(name, other_name) if given or to
+        # kapps.confirm, whose interactive answers are added to decisions.
+        name, other_name = new_molecule.known_names[0], match.known_names[0]
+        key = km.name_pair(name, other_name)
+        if decisions is not None and key in decisions:
+            km.profiler.count("stored decisions applied")
+            return decisions[key]
+        if ask is not None:
+            return ask(name, other_name)
+        same = kapps.confirm(f"Is {name} the same molecule as {other_name}? [y/n]\n")
+        if decisions is not None and KemistDb._uses_interactive_matching():
+            decisions[key] = same
+        return same
+
+    @staticmethod
+    def _batch_close_names(database, new_molecules, finder, rt_tolerance=None):
+        # Names of new_molecules and known names close to each name of new_molecules, and the uids of the molecules
+        # of the database holding such a known name. New molecules may be merged with each other.
+        # With rt_tolerance, candidates whose retention times disagree with every molecule of the batch holding the
+        # name are dropped before any comparison. Retention times are compared as they are before the batch is merged.
+        new_names = [n for m in new_molecules for n in m.known_names]
+        keep = None
+        known_candidates = database.find_name_candidates(new_names)
+        if rt_tolerance is not None:
+            retention_times = {}
+            for m in new_molecules:
+                for n in m.known_names:
+                    retention_times.setdefault(n, []).append(m.retention_times)
+
+            def agree(name, other_retention_times):
+                return any(
+                    km.retention_times_agree(rts, other_retention_times, rt_tolerance) for rts in retention_times[name]
                 )
-                while relaxed_match is not None:
-                    if kapps.confirm(
-                        f"Is {new_molecule.known_names[0]}"
-                        f" the same molecule as {relaxed_match.known_names[0]}? "
-                        f"[y/n]\n"
-                    ):
-                        relaxed_match.merge_with(new_molecule)
-                        found = True
-                        break
 
-                    relaxed_match = next(
-                        filter(
-                            lambda m: km.are_same_molecules(new_molecule, m) == km.Equivalence.RELAXED,
-                            existing_molecules,
-                        ),
-                        None,
-                    )
+            def keep(name, other_name):
+                return any(agree(name, rts) for rts in retention_times[other_name])
 
-            if not found and add_non_existing:
-                existing_molecules.append(new_molecule)
+            known_retention_times = database.get_retention_times(
+                {uid for candidates in known_candidates.values() for uid in candidates.values()}
+            )
+            candidate_count = sum(len(candidates) for candidates in known_candidates.values())
+            known_candidates = {
+                n: {c: uid for c, uid in candidates.items() if agree(n, known_retention_times.get(uid, {}))}
+                for n, candidates in known_candidates.items()
+            }
+            rejected = candidate_count - sum(len(candidates) for candidates in known_candidates.values())
+            km.profiler.count("candidates rejected by retention time", rejected)
 
-    def update(self, name, new_molecules, new_storage_units, should_complete_molecules):
+        close_names = finder.find(new_names, keep)
+        relaxed_uids = set()
+        for n, close in finder.verify(known_candidates).items():
+            close_names[n].update(close)
+            relaxed_uids.update(known_candidates[n][c] for c in close)
+        return close_names, relaxed_uids
+
+    @staticmethod
+    def _collect_relaxed_questions(new_molecules, existing_molecules, decisions, close_names=None, rt_tolerance=None):
+        # Dry run of the merge on copies of the molecules of the batch and of their candidates (see _merge_batches),
+        # answering no to every question without a decision.
+        # Returns {name_pair: (name, other_name)} of these questions. Questions that only come up once some of them
+        # are answered yes are asked during the merge itself.
+        questions = {}
+
+        def collect(name, other_name):
+            questions.setdefault(km.name_pair(name, other_name), (name, other_name))
+            return False
+
+        KemistDb._merge_in_existing_molecule_list(
+            [m.copy() for m in new_molecules],
+            km.MoleculeIndex([m.copy() for m in existing_molecules]),
+            close_names=close_names,
+            rt_tolerance=rt_tolerance,
+            decisions=decisions,
+            ask=collect,
+        )
+        return questions
+
+    @staticmethod
+    def _review_relaxed_matches(new_molecules, existing_molecules, decisions, close_names=None, rt_tolerance=None):
+        # Asks the questions of a whole batch at once, the most similar names first
+        questions = KemistDb._collect_relaxed_questions(
+            new_molecules, existing_molecules, decisions, close_names, rt_tolerance
+        )
+        if questions:
+            km.logger.info(f"{len(questions)} possible matches to review")
+            decisions.update(kapps.review(kapps.rank_questions(questions.values())))
+
+    @staticmethod
+    def write_pending_questions(path, questions):
+        # The Same column is left empty, filled with yes or no the file can be given back with --decisions
+        with open(path, "w", newline="") as output:
+            writer = csv.writer(output, delimiter=";")
+            writer.writerow(MATCH_DECISION_HEADERS)
+            for name, other_name, similarity in kapps.rank_questions(questions):
+                writer.writerow([name, other_name, f"{similarity:.2f}", ""])
+
+    @km.profiler.timed("update")
+    def update(
+        self,
+        name,
+        molecule_batches,
+        storage_batches,
+        completer,
+        jobs=1,
+        rt_tolerance=None,
+        decisions_file=None,
+        pending=None,
+    ):
         if name is None:
             name = self.config.get_default_database_name()
             if name is None:
@@ -150,33 +363,21 @@ class KemistDb(object):
         if path is None:
             km.logger.error(f"Could not open database {name}")
             return
-        database = kemist.database.Database(path)
-
-        if new_molecules:
-            existing_molecules = database.get_molecules()
-            KemistDb._merge_in_existing_molecule_list(new_molecules, existing_molecules, should_complete_molecules)
-            database.update_all_molecules(existing_molecules)
-
-        if new_storage_units:
-            # TODO add smarter update
-            existing_storage_units = database.get_storage_units()
-            existing_molecules = database.get_molecules()
-
-            for new_unit in new_storage_units:
-                for m in new_unit.molecules:
-                    for existing_molecule in existing_molecules:
-                        equi = km.are_same_molecules(m, existing_molecule)
-                        if equi == km.Equivalence.STRICT:
-                            m.merge_with(existing_molecule)
-                            break
-
-                found = False
-                for existing_unit in existing_storage_units:
-                    if new_unit.name == existing_unit.name:
-                        existing_unit.molecules.extend(new_unit.molecules)
-                        break
+        database = kemist.database.Database(path, pooled=True)
+        decisions = KemistDb._load_match_decisions(database, decisions_file)
+        pending_questions = None
+        if pending is not None:
+            # Questions are written to pending instead of being asked, nothing is added to the database
+            pending_questions = {}
+            storage_batches = ()
+
+        KemistDb._merge_batches(database, molecule_batches, completer, jobs, rt_tolerance, decisions, pending_questions)
+
+        for new_storage_units in storage_batches:
+            database.update_all_storage_units(new_storage_units)
 
-                if not found:
-                    existing_storage_units.append(new_unit)
+        if pending is not None:
+            KemistDb.write_pending_questions(pending, pending_questions.values())
+            km.logger.info(f"Wrote {len(pending_questions)} pending questions to {pending}")
 
-            database.update_all_storage_units(existing_storage_units)
+        database.close()
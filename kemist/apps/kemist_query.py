@@ -0,0 +1,265 @@
+import csv
+import os
+import sqlite3
+import sys
+
+import kemist.core as km
+import kemist.config
+import kemist.database
+
+import kemist.apps as kapps
+
+RT_SEARCH_HEADERS = ["Query", "Column", "Name", "Formula", "Mode", "Retention time", "Delta"]
+MASS_SEARCH_HEADERS = ["Query", "Adduct", "Name", "Formula", "Mode", "m/z", "Error (ppm)"]
+LOCATE_HEADERS = ["Name", "Storage"]
+NAME_SEARCH_HEADERS = ["Query", "Match", "Name", "Formula", "Mode", "Similarity"]
+DATABASE_HEADER = "Database"
+
+
+class KemistQuery(object):
+    def __init__(self):
+        self.config = kemist.config.ConfigManager()
+
+    def _find_database(self, name):
+        if name is None:
+            name = self.config.get_default_database_name()
+            if name is None:
+                km.logger.error(f"No database found")
+                return None, None
+            km.logger.debug(f"Using default database {name}")
+
+        path = self.config.get_database_path(name)
+        if path is None:
+            km.logger.error(f"Could not open database {name}")
+            return name, None
+        return name, path
+
+    def _open_database(self, name):
+        _, path = self._find_database(name)
+        if path is None:
+            return None
+        return kemist.database.Database(path, pooled=True)
+
+    def serve(self, name, socket_path=None, port=None):
+        name, path = self._find_database(name)
+        if path is None:
+            return
+        socket_path = socket_path if socket_path is not None else self.config.get_server_socket_path(name)
+        kapps.KemistServer(path).run(socket_path, port)
+
+    def _open_federation(self):
+        databases = [(name, self.config.get_database_path(name)) for name in self.config.databases]
+        databases = [(name, path) for name, path in databases if os.path.exists(path)]
+        if not databases:
+            km.logger.error(f"No database found")
+            return None
+        km.logger.debug(f"Querying databases {[name for name, _ in databases]}")
+        return kemist.database.FederatedDatabase(databases)
+
+    def search_all_retention_times(self, column, retention_times, tolerance, output=None):
+        federation = self._open_federation()
+        if federation is None:
+            return
+
+        writer = csv.writer(output if output is not None else sys.stdout, delimiter=";")
+        writer.writerow([DATABASE_HEADER] + RT_SEARCH_HEADERS)
+        for database, query, _, name, formula, mode, rt in federation.search_retention_times(
+            column, retention_times, tolerance
+        ):
+            query_rt = retention_times[query]
+            writer.writerow([database, query_rt, column, name or "", formula, mode, rt, round(rt - query_rt, 6)])
+        federation.close()
+
+    def query(self, name, request, output=None, use_server=True):
+        # Answers request through the kemist serve daemon of the database when one is running, locally otherwise
+        response = None
+        if use_server:
+            response = self._ask_server(name, request)
+        if response is None:
+            database = self._open_database(name)
+            if database is None:
+                return
+            response = QueryIndexes(database).answer(request)
+            database.close()
+
+        if "error" in response:
+            km.logger.error(response["error"])
+            return
+        for warning in response["warnings"]:
+            km.logger.warning(warning)
+        writer = csv.writer(output if output is not None else sys.stdout, delimiter=";")
+        writer.writerow(response["headers"])
+        writer.writerows(response["rows"])
+
+    def _ask_server(self, name, request):
+        if name is None:
+            name = self.config.get_default_database_name()
+            if name is None:
+                return None
+        client = kapps.connect_to_server(self.config.get_server_socket_path(name))
+        if client is None:
+            return None
+        km.logger.debug(f"Querying the server of {name}")
+        try:
+            return client.request(request)
+        except (OSError, ValueError, RuntimeError) as e:
+            km.logger.warning(f"The server of {name} did not answer, querying the database directly: {e}")
+            return None
+
+    def search_retention_times(self, name, column, retention_times, tolerance, output=None, use_server=True):
+        request = {"verb": "rt", "column": column, "retention_times": retention_times, "tolerance": tolerance}
+        self.query(name, request, output, use_server)
+
+    def search_masses(self, name, mzs, ppm, output=None, use_server=True):
+        self.query(name, {"verb": "mass", "mzs": mzs, "ppm": ppm}, output, use_server)
+
+    def locate(self, name, molecule_names, output=None, use_server=True):
+        self.query(name, {"verb": "locate", "names": molecule_names}, output, use_server)
+
+    def search_names(self, name, queries, limit, output=None, use_server=True):
+        self.query(name, {"verb": "search", "queries": queries, "limit": limit}, output, use_server)
+
+    def locate_all(self, molecule_names, output=None):
+        federation = self._open_federation()
+        if federation is None:
+            return
+
+        molecule_names = [n.strip().lower() for n in molecule_names]
+        located = set()
+        writer = csv.writer(output if output is not None else sys.stdout, delimiter=";")
+        writer.writerow([DATABASE_HEADER] + LOCATE_HEADERS)
+        for database, molecule_name, storage_name in federation.locate(molecule_names):
+            located.add(molecule_name)
+            writer.writerow([database, molecule_name, storage_name])
+        for molecule_name in molecule_names:
+            if molecule_name not in located:
+                km.logger.warning(f"{molecule_name} is not stored anywhere")
+        federation.close()
+
+
+# Answers query requests on a database, the retention time and mass indexes are built on first use and kept until
+# reset (see KemistServer). A request is a dict whose "verb" is rt, mass, locate or search, the response holds the
+# "headers" and "rows" of the result and "warnings" to show, or an "error".
+class QueryIndexes(object):
+    def __init__(self, database):
+        self.database = database
+        self.reset()
+
+    def reset(self):
+        self._rt_indexes = {}
+        self._mass_index = None
+
+    def warm(self):
+        # Builds every index ahead of the first request
+        for column in self.database.get_known_retention_times():
+            self.retention_time_index(column)
+        self.mass_index()
+
+    def retention_time_index(self, column):
+        index = self._rt_indexes.get(column)
+        if index is None:
+            index = self._rt_indexes[column] = km.RetentionTimeIndex(self.database.iter_retention_times([column]))
+        return index
+
+    def mass_index(self):
+        if self._mass_index is None:
+            self._mass_index = km.MassIndex(self.database.iter_masses())
+        return self._mass_index
+
+    def _molecules(self, uids):
+        return {m.uid: m for m in self.database.find_molecules([], set(uids), prefetch=("names",))}
+
+    def answer(self, request):
+        try:
+            verb = request["verb"]
+            if verb == "rt":
+                return self.search_retention_times(request["column"], request["retention_times"], request["tolerance"])
+            if verb == "mass":
+                return self.search_masses(request["mzs"], request["ppm"])
+            if verb == "locate":
+                return self.locate(request["names"])
+            if verb == "search":
+                return self.search_names(request["queries"], request["limit"])
+            raise RuntimeError(f"Unknown request {verb}")
+        except KeyError as e:
+            return {"error": f"Missing request field {e}"}
+        except RuntimeError as e:
+            return {"error": str(e)}
+        except (TypeError, ValueError, AttributeError) as e:
+            # Fields of the wrong type, e.g. a null tolerance or names that are not strings
+            return {"error": f"Invalid request: {e}"}
+        except sqlite3.Error as e:
+            return {"error": f"Database error: {e}"}
+
+    def search_retention_times(self, column, retention_times, tolerance):
+        index = self.retention_time_index(column)
+        if column not in index:
+            known_columns = self.database.get_known_retention_times()
+            raise RuntimeError(f"Unknown column {column}. Known columns are {known_columns}")
+
+        queries, uids, rts = index.search_many(column, retention_times, tolerance)
+        molecules = self._molecules(uids.tolist())
+        km.logger.debug(f"Found {len(uids)} candidates for {len(retention_times)} retention times")
+
+        rows = []
+        for query, uid, rt in zip(queries.tolist(), uids.tolist(), rts.tolist()):
+            m = molecules[uid]
+            query_rt = retention_times[query]
+            rows.append(
+                [
+                    query_rt,
+                    column,
+                    m.known_names[0] if m.known_names else "",
+                    m.formula,
+                    m.mode,
+                    rt,
+                    round(rt - query_rt, 6),
+                ]
+            )
+        return {"headers": RT_SEARCH_HEADERS, "rows": rows, "warnings": []}
+
+    def search_masses(self, mzs, ppm):
+        index = self.mass_index()
+        queries, uids, adducts, found_mzs = index.search_many(mzs, ppm)
+        molecules = self._molecules(uids.tolist())
+        km.logger.debug(f"Found {len(uids)} candidates for {len(mzs)} m/z among {len(index)} adducts")
+
+        rows = []
+        for query, uid, adduct, mz in zip(queries.tolist(), uids.tolist(), adducts.tolist(), found_mzs.tolist()):
+            m = molecules[uid]
+            query_mz = mzs[query]
+            rows.append(
+                [
+                    query_mz,
+                    adduct,
+                    m.known_names[0] if m.known_names else "",
+                    m.formula,
+                    m.mode,
+                    round(mz, 6),
+                    round((query_mz - mz) / mz * 1e6, 3),
+                ]
+            )
+        return {"headers": MASS_SEARCH_HEADERS, "rows": rows, "warnings": []}
+
+    def locate(self, molecule_names):
+        locations = self.database.locate(n.strip().lower() for n in molecule_names)
+        rows, warnings = [], []
+        for molecule_name, storage_names in locations.items():
+            if not storage_names:
+                warnings.append(f"{molecule_name} is not stored anywhere")
+            rows.extend([molecule_name, storage_name] for storage_name in storage_names)
+        return {"headers": LOCATE_HEADERS, "rows": rows, "warnings": warnings}
+
+    def search_names(self, queries, limit):
+        # Names are stored in lower case (see load_molecules)
+        results = [(query, self.database.search_names(query.strip().lower(), limit)) for query in queries]
+        molecules = self._molecules(uid for _, matches in results for _, uid, _ in matches)
+
+        rows, warnings = [], []
+        for query, matches in results:
+            if not matches:
+                warnings.append(f"No name matches {query}")
+            for match, uid, similarity in matches:
+                m = molecules[uid]
+                rows.append([query, match, m.known_names[0], m.formula, m.mode, round(similarity, 3)])
+        return {"headers": NAME_SEARCH_HEADERS, "rows": rows, "warnings": warnings}
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import threading
+
+import kemist.core as km
+import kemist.database
+
+from kemist.apps.kemist_client import connect_to_server
+from kemist.apps.kemist_query import QueryIndexes
+
+RELOAD_INTERVAL = 1.0
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+HTTP_HOST = "127.0.0.1"
+
+
+def _remove_stale_socket(socket_path):
+    if connect_to_server(socket_path) is not None:
+        raise RuntimeError(f"A server is already listening on {socket_path}")
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+
+# Keeps a database and its query indexes opened and answers requests (see QueryIndexes.answer) over a Unix socket,
+# one JSON request per line, and over a localhost HTTP endpoint, one JSON request per POST.
+# Requests are answered one at a time on the event loop. Indexes are rebuilt as soon as the database or its WAL file
+# change, which is checked before every request and every RELOAD_INTERVAL seconds.
+class KemistServer(object):
+    def __init__(self, path):
+        self.path = path
+        self.database = kemist.database.Database(path, pooled=True)
+        self.indexes = QueryIndexes(self.database)
+        self.port = None
+        self.ready = threading.Event()
+        self._version = None
+        self._loop = None
+        self._stopped = None
+        self._refresh()
+
+    def _database_version(self):
+        # Writes go to the -wal file until they are checkpointed into the database file
+        versions = []
+        for path in [self.path, f"{self.path}-wal"]:
+            try:
+                stat = os.stat(path)
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                versions.append(None)
+        return tuple(versions)
+
+    def _refresh(self):
+        version = self._database_version()
+        if version == self._version:
+            return
+        if self._version is not None:
+            km.logger.info(f"{self.path} changed, reloading indexes")
+        self.indexes.reset()
+        self.indexes.warm()
+        self._version = version
+
+    def answer(self, request):
+        self._refresh()
+        if isinstance(request, list):
+            return [self.answer(r) for r in request]
+        if not isinstance(request, dict):
+            return {"error": "Requests must be JSON objects"}
+        return self.indexes.answer(request)
+
+    def _answer_data(self, data):
+        try:
+            request = json.loads(data)
+        except ValueError as e:
+            response = {"error": f"Invalid request: {e}"}
+        else:
+            try:
+                response = self.answer(request)
+            except Exception as e:
+                # A failing request must not take the connection, or the server, down with it
+                km.logger.error(f"Could not answer request: {e}")
+                response = {"error": f"Internal error: {e}"}
+        return json.dumps(response).encode() + b"\n"
+
+    async def _serve_stream(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                writer.write(self._answer_data(line))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            km.logger.debug(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    async def _http_response(self, reader):
+        method, _, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in [b"\r\n", b"\n", b""]:
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if method == "POST":
+            length = int(headers.get("content-length", 0))
+            if length > MAX_REQUEST_SIZE:
+                return "413 Payload Too Large", json.dumps({"error": "Request too large"}).encode()
+            return "200 OK", self._answer_data(await reader.readexactly(length))
+        if method == "GET":
+            return "200 OK", json.dumps({"database": self.path}).encode()
+        return "405 Method Not Allowed", json.dumps({"error": f"Unsupported method {method}"}).encode()
+
+    async def _serve_http(self, reader, writer):
+        try:
+            try:
+                status, body = await self._http_response(reader)
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                status, body = "400 Bad Request", json.dumps({"error": f"Invalid HTTP request: {e}"}).encode()
+            except ConnectionError:
+                raise
+            except Exception as e:
+                km.logger.error(f"Could not answer HTTP request: {e}")
+                status, body = "500 Internal Server Error", json.dumps({"error": f"Internal error: {e}"}).encode()
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except ConnectionError as e:
+            km.logger.debug(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            self._refresh()
+
+    async def serve(self, socket_path=None, port=None):
+        # Serves until stop is called, port 0 picks a free port (see self.port)
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        servers = []
+        try:
+            if socket_path is not None:
+                _remove_stale_socket(socket_path)
+                servers.append(
+                    await asyncio.start_unix_server(self._serve_stream, path=socket_path, limit=MAX_REQUEST_SIZE)
+                )
+                km.logger.info(f"Serving {self.path} on {socket_path}")
+            if port is not None:
+                server = await asyncio.start_server(self._serve_http, host=HTTP_HOST, port=port, limit=MAX_REQUEST_SIZE)
+                servers.append(server)
+                self.port = server.sockets[0].getsockname()[1]
+                km.logger.info(f"Serving {self.path} on http://{HTTP_HOST}:{self.port}")
+
+            watcher = asyncio.create_task(self._watch())
+            self.ready.set()
+            await self._stopped.wait()
+            watcher.cancel()
+        finally:
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def stop(self):
+        # Can be called from any thread
+        self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def run(self, socket_path=None, port=None):
+        try:
+            asyncio.run(self.serve(socket_path, port))
+        except KeyboardInterrupt:
+            km.logger.info("Stopping server")
+        finally:
+            self.database.close()
@@ -45,6 +45,9 @@ class ConfigManager(object):
     def get_default_database_path(self):
         return os.path.join(self.data_dir, self.default_database) if self.default_database else None
 
+    def get_resolver_cache_path(self):
+        return os.path.join(os.path.dirname(self.data_dir), "resolver_cache.sqlite")
+
     def get_database_path(self, name):
         if name not in self.databases:
             logger.error(f"{name} is not a known database.")
@@ -52,6 +55,10 @@ class ConfigManager(object):
             return None
         return os.path.join(self.data_dir, name)
 
+    def get_server_socket_path(self, name):
+        # Unix socket of the kemist serve daemon of a database
+        return os.path.join(self.cfg_dir, f"{name}.sock")
+
     def set_default_database(self, name):
         if name in self.databases:
             self.default_database = name
@@ -1,5 +1,43 @@
+import importlib
+
 from .logging_utils import logger, set_verbose_logging
+from .profiling import profiler, profile_session
+
+# Everything but logging and profiling is imported on first access, some of these modules pull in numpy, cirpy or
+# fuzzysearch
+_LAZY_ATTRIBUTES = {
+    "Molecule": ".molecule",
+    "NameList": ".molecule",
+    "DeferredRelation": ".molecule",
+    "are_same_molecules": ".molecule",
+    "Equivalence": ".molecule",
+    "NameIndex": ".name_index",
+    "halves": ".name_index",
+    "is_near_substring": ".name_index",
+    "MoleculeIndex": ".molecule_index",
+    "name_pair": ".molecule_index",
+    "retention_times_agree": ".molecule_index",
+    "StorageUnit": ".storage_unit",
+    "RetentionTimeIndex": ".rt_index",
+    "parse_formula": ".mass",
+    "monoisotopic_mass": ".mass",
+    "adduct_mzs": ".mass",
+    "MassIndex": ".mass_index",
+    "ResolverCache": ".resolver_cache",
+    "CachedResolver": ".resolver_cache",
+    "MoleculeCompleter": ".completion",
+    "CloseNameFinder": ".parallel_matching",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
 
-from .molecule import Molecule, are_same_molecules, Equivalence
 
-from .storage_unit import StorageUnit
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
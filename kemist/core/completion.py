@@ -0,0 +1,83 @@
+import http.client
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from kemist.core import logger, profiler
+from kemist.core.resolver_cache import CachedResolver
+
+RETRIED_HTTP_CODES = {429, 500, 502, 503, 504}
+
+
+def _is_transient(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRIED_HTTP_CODES
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+class RateLimiter(object):
+    def __init__(self, requests_per_second=None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RetryingResolver(object):
+    def __init__(self, resolve, retries=3, backoff=0.5, rate_limiter=None):
+        self.resolve = resolve
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+
+    def __call__(self, identifier, representation):
+        attempt = 0
+        while True:
+            self.rate_limiter.wait()
+            profiler.count("cir requests")
+            try:
+                return self.resolve(identifier, representation)
+            except Exception as e:
+                if attempt >= self.retries or not _is_transient(e):
+                    raise
+                delay = self.backoff * 2**attempt
+                logger.debug(f"Resolving {identifier} failed ({e}). Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                attempt += 1
+
+
+# Completes many molecules at once. Each molecule is still completed by Molecule.try_to_complete,
+# only the network round trips of different molecules overlap.
+class MoleculeCompleter(object):
+    def __init__(self, resolve=None, max_workers=8, requests_per_second=None, retries=3, backoff=0.5, cache=None):
+        if resolve is None:
+            import cirpy
+
+            resolve = cirpy.resolve
+        self.max_workers = max_workers
+        self.resolve = RetryingResolver(resolve, retries, backoff, RateLimiter(requests_per_second))
+        if cache is not None:
+            # Cache hits never reach the rate limiter
+            self.resolve = CachedResolver(self.resolve, cache)
+
+    @profiler.timed("complete")
+    def complete(self, molecules):
+        molecules = list(molecules)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(m.try_to_complete, self.resolve) for m in molecules]
+            for m, future in zip(molecules, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Could not complete {m.known_names[0]}: {e}")
+        return molecules
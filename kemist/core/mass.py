@@ -0,0 +1,102 @@
+import functools
+import re
+
+ELECTRON_MASS = 0.000548579909
+PROTON_MASS = 1.007276466812
+
+# Monoisotopic masses of the most abundant isotope of each element
+MONOISOTOPIC_MASSES = {
+    "H": 1.00782503207,
+    "D": 2.0141017778,
+    "Li": 7.0160045,
+    "B": 11.0093054,
+    "C": 12.0,
+    "N": 14.0030740048,
+    "O": 15.99491461956,
+    "F": 18.99840322,
+    "Na": 22.9897692809,
+    "Mg": 23.9850417,
+    "Al": 26.98153863,
+    "Si": 27.9769265325,
+    "P": 30.97376163,
+    "S": 31.972071,
+    "Cl": 34.96885268,
+    "K": 38.96370668,
+    "Ca": 39.96259098,
+    "Mn": 54.9380451,
+    "Fe": 55.9349375,
+    "Co": 58.933195,
+    "Ni": 57.9353429,
+    "Cu": 62.9295975,
+    "Zn": 63.9291422,
+    "As": 74.9215965,
+    "Se": 79.9165213,
+    "Br": 78.9183371,
+    "I": 126.904473,
+    "Pt": 194.9647911,
+    "Hg": 201.970643,
+}
+
+# Adducts considered for each ionisation mode as (name, mass shift, charge)
+ADDUCTS = {
+    "pos": [("[M+H]+", PROTON_MASS, 1)],
+    "neg": [("[M-H]-", -PROTON_MASS, -1)],
+}
+ADDUCTS["both"] = ADDUCTS["pos"] + ADDUCTS["neg"]
+
+_TOKEN = re.compile(r"([A-Z][a-z]?)(\d*)|([(\[])|([)\]])(\d*)|([.·*])(\d*)|([+-])(\d*)$")
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_formula(formula):
+    # Returns ({element: count}, charge). Handles groups "(CH3)2", hydrates "CuSO4·5H2O" and trailing charges.
+    stack = [{}]
+    charge = 0
+    hydrate_multiplier = None
+    position = 0
+    compact = formula.replace(" ", "")
+
+    if compact and compact[0].isdigit():
+        raise ValueError(f"Invalid formula {formula}")
+
+    while position < len(compact):
+        match = _TOKEN.match(compact, position)
+        if match is None:
+            raise ValueError(f"Invalid formula {formula} (at '{compact[position:]}')")
+        element, count, opening, closing, group_count, dot, hydrate_count, sign, charge_count = match.groups()
+
+        if element is not None:
+            if element not in MONOISOTOPIC_MASSES:
+                raise ValueError(f"Unknown element {element} in {formula}")
+            multiplier = hydrate_multiplier if hydrate_multiplier is not None else 1
+            stack[-1][element] = stack[-1].get(element, 0) + int(count or 1) * multiplier
+        elif opening is not None:
+            stack.append({})
+        elif closing is not None:
+            if len(stack) == 1:
+                raise ValueError(f"Unbalanced parentheses in {formula}")
+            group = stack.pop()
+            for e, n in group.items():
+                stack[-1][e] = stack[-1].get(e, 0) + n * int(group_count or 1)
+        elif dot is not None:
+            hydrate_multiplier = int(hydrate_count or 1)
+        else:
+            charge = int(charge_count or 1) * (1 if sign == "+" else -1)
+        position = match.end()
+
+    if len(stack) != 1 or not stack[0]:
+        raise ValueError(f"Invalid formula {formula}")
+    return stack[0], charge
+
+
+def monoisotopic_mass(formula):
+    composition, charge = parse_formula(formula)
+    return sum(MONOISOTOPIC_MASSES[e] * n for e, n in composition.items()) - charge * ELECTRON_MASS
+
+
+def adduct_mzs(mass, mode, charge=0):
+    # Returns [(adduct, m/z)] for a molecule of the given monoisotopic mass and ionisation mode.
+    # Molecules that are already charged are observed as they are.
+    if charge:
+        return [(f"[M]{'+' if charge > 0 else '-'}", mass / abs(charge))]
+    return [(name, (mass + shift) / abs(z)) for name, shift, z in ADDUCTS.get(mode, ADDUCTS["both"])]
@@ -0,0 +1,39 @@
+import numpy as np
+
+from kemist.core.mass import adduct_mzs
+
+
+# Sorted m/z values of every adduct of every molecule, searched with a ppm tolerance
+class MassIndex(object):
+    def __init__(self, rows=()):
+        uids = []
+        mzs = []
+        adducts = []
+        for uid, mass, mode, charge in rows:
+            if mass is None:
+                continue
+            for adduct, mz in adduct_mzs(mass, mode, charge):
+                uids.append(uid)
+                mzs.append(mz)
+                adducts.append(adduct)
+
+        mzs = np.asarray(mzs, dtype=np.float64)
+        order = np.argsort(mzs, kind="stable")
+        self.mzs = mzs[order]
+        self.uids = np.asarray(uids, dtype=np.int64)[order]
+        self.adducts = np.asarray(adducts, dtype=object)[order]
+
+    def __len__(self):
+        return len(self.mzs)
+
+    def search_many(self, mzs, ppm):
+        # Returns flat arrays (query indices, uids, adducts, m/z), sorted by query then m/z
+        mzs = np.atleast_1d(np.asarray(mzs, dtype=np.float64))
+        tolerances = mzs * ppm * 1e-6
+        starts = np.searchsorted(self.mzs, mzs - tolerances, side="left")
+        ends = np.searchsorted(self.mzs, mzs + tolerances, side="right")
+        counts = ends - starts
+        queries = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + offsets
+        return queries, self.uids[positions], self.adducts[positions], self.mzs[positions]
@@ -1,10 +1,12 @@
-import fuzzysearch
-import cirpy
 from enum import Enum
-from kemist.core import logger
+from kemist.core import logger, profiler
 
 
 def _are_name_close(a, b):
+    # Imported here as it is only needed by relaxed matching and slow to import
+    import fuzzysearch
+
+    profiler.count("fuzzy comparisons")
     tot = len(fuzzysearch.find_near_matches(a, b, max_l_dist=1)) + len(
         fuzzysearch.find_near_matches(b, a, max_l_dist=1)
     )
@@ -15,7 +17,119 @@ def _is_list_of_strings(lst):
     return bool(lst) and not isinstance(lst, str) and all(isinstance(elem, str) for elem in lst)
 
 
+# A list of names that also answers "name in names" in constant time. Order and duplicates are kept as in a list.
+# Most molecules only have a few names, _counts is only built once a list grows past INDEXED_LENGTH and is then
+# kept in sync by every mutating method.
+class NameList(list):
+    __slots__ = ("_counts",)
+
+    INDEXED_LENGTH = 16
+
+    def __init__(self, names=()):
+        super().__init__(names)
+        self._counts = None
+
+    def _count_in(self, names):
+        if self._counts is not None:
+            for name in names:
+                self._counts[name] = self._counts.get(name, 0) + 1
+
+    def _count_out(self, names):
+        if self._counts is not None:
+            for name in names:
+                if self._counts[name] == 1:
+                    del self._counts[name]
+                else:
+                    self._counts[name] -= 1
+
+    def __contains__(self, name):
+        if self._counts is None:
+            if len(self) <= self.INDEXED_LENGTH:
+                return super().__contains__(name)
+            self._counts = {}
+            self._count_in(self)
+        try:
+            return name in self._counts
+        except TypeError:
+            return False
+
+    def append(self, name):
+        super().append(name)
+        self._count_in([name])
+
+    def extend(self, names):
+        names = list(names)
+        super().extend(names)
+        self._count_in(names)
+
+    def __iadd__(self, names):
+        self.extend(names)
+        return self
+
+    def insert(self, index, name):
+        super().insert(index, name)
+        self._count_in([name])
+
+    def remove(self, name):
+        super().remove(name)
+        self._count_out([name])
+
+    def pop(self, index=-1):
+        name = super().pop(index)
+        self._count_out([name])
+        return name
+
+    def clear(self):
+        super().clear()
+        self._counts = None
+
+    def __setitem__(self, index, value):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__setitem__(index, value)
+        self._count_out(removed)
+        self._count_in(self[index] if isinstance(index, slice) else [value])
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._count_out(removed)
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._counts = None
+        return self
+
+    def __reduce__(self):
+        return (NameList, (list(self),))
+
+    def copy(self):
+        return NameList(self)
+
+
+# Placeholder for a relation ("known_names" or "retention_times") of a batch of molecules, loaded on first access.
+# load(uids) returns {uid: value} and is called once for all the molecules of the batch still waiting for it.
+class DeferredRelation(object):
+    __slots__ = ("relation", "molecules", "load")
+
+    def __init__(self, relation, molecules, load):
+        self.relation = relation
+        self.molecules = molecules
+        self.load = load
+        for m in molecules:
+            setattr(m, relation, self)
+
+    def resolve(self):
+        slot = f"_{self.relation}"
+        pending = [m for m in self.molecules if getattr(m, slot) is self]
+        self.molecules = ()
+        values = self.load([m.uid for m in pending]) if pending else {}
+        for m in pending:
+            setattr(m, self.relation, values.get(m.uid))
+
+
 class Molecule(object):
+    __slots__ = ("uid", "iupac", "formula", "is_on_libview", "mode", "_known_names", "_retention_times")
+
     def __init__(
         self, uid=None, iupac=None, formula=None, is_on_libview=None, mode=None, known_names=None, retention_times=None
     ):
@@ -24,8 +138,43 @@ class Molecule(object):
         self.formula = formula
         self.is_on_libview = is_on_libview
         self.mode = mode
-        self.known_names = known_names if known_names is not None else []
-        self.retention_times = retention_times if retention_times is not None else {}
+        self.known_names = known_names
+        self.retention_times = retention_times
+
+    @property
+    def known_names(self):
+        if type(self._known_names) is DeferredRelation:
+            self._known_names.resolve()
+        return self._known_names
+
+    @known_names.setter
+    def known_names(self, names):
+        if names is None:
+            names = NameList()
+        elif not isinstance(names, (NameList, DeferredRelation)):
+            names = NameList(names)
+        self._known_names = names
+
+    @property
+    def retention_times(self):
+        if type(self._retention_times) is DeferredRelation:
+            self._retention_times.resolve()
+        return self._retention_times
+
+    @retention_times.setter
+    def retention_times(self, retention_times):
+        self._retention_times = retention_times if retention_times is not None else {}
+
+    def __reduce__(self):
+        # Deferred relations are loaded rather than pickled
+        return (
+            Molecule,
+            (self.uid, self.iupac, self.formula, self.is_on_libview, self.mode, self.known_names, self.retention_times),
+        )
+
+    def copy(self):
+        known_names, retention_times = list(self.known_names), dict(self.retention_times)
+        return Molecule(self.uid, self.iupac, self.formula, self.is_on_libview, self.mode, known_names, retention_times)
 
     def merge_with(self, other):
         if self.uid is None:
@@ -39,18 +188,26 @@ class Molecule(object):
         if self.mode is None:
             self.mode = other.mode
 
-        self.known_names.extend(name for name in other.known_names if name not in self.known_names)
+        known_names = self.known_names
+        for name in other.known_names:
+            if name not in known_names:
+                known_names.append(name)
         for key, value in other.retention_times.items():
             self.retention_times[key] = value
 
-    def try_to_complete(self):
+    def try_to_complete(self, resolve=None):
+        if resolve is None:
+            import cirpy
+
+            resolve = cirpy.resolve
+
         logger.info(f"Trying to complete {self.known_names[0]}")
         logger.debug(f"Current IUPAC : {self.iupac}")
         logger.debug(f"Current Formula : {self.formula}")
 
         if self.iupac is None:
             for n in self.known_names:
-                self.iupac = cirpy.resolve(n, "iupac_name")
+                self.iupac = resolve(n, "iupac_name")
                 if self.iupac is not None:
                     if _is_list_of_strings(self.iupac):
                         selected_iupac = self.iupac[0]
@@ -66,7 +223,7 @@ class Molecule(object):
             return
 
         if self.formula is None:
-            self.formula = cirpy.resolve(self.iupac, "formula")
+            self.formula = resolve(self.iupac, "formula")
 
 
 class Equivalence(Enum):
@@ -75,7 +232,8 @@ class Equivalence(Enum):
     NONE = 3
 
 
-def are_same_molecules(m1: Molecule, m2: Molecule):
+def are_same_molecules(m1: Molecule, m2: Molecule, close_names=None):
+    # close_names optionally maps names of m1 to every name close to them (see CloseNameFinder)
     if m1.uid is not None and m2.uid is not None:
         return Equivalence.STRICT if m1.uid == m2.uid else Equivalence.NONE
 
@@ -89,7 +247,9 @@ def are_same_molecules(m1: Molecule, m2: Molecule):
         return Equivalence.STRICT
 
     for name1 in m1.known_names:
+        close = close_names.get(name1) if close_names is not None else None
         for name2 in m2.known_names:
-            if _are_name_close(name1, name2):
+            is_close = name2 in close if close is not None else _are_name_close(name1, name2)
+            if is_close:
                 return Equivalence.RELAXED
     return Equivalence.NONE
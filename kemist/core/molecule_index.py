@@ -0,0 +1,208 @@
+import math
+from array import array
+
+from kemist.core import profiler
+from kemist.core.molecule import Molecule, Equivalence, are_same_molecules
+from kemist.core.name_index import NameIndex, _are_name_close
+
+
+def name_pair(name, other_name):
+    # Key of a question about two names, whatever the order they are asked in
+    return (name, other_name) if name <= other_name else (other_name, name)
+
+
+def retention_times_agree(retention_times, other_retention_times, tolerance):
+    # False when a column is known on both sides with retention times differing by more than tolerance
+    for column, rt in retention_times.items():
+        other_rt = other_retention_times.get(column)
+        if rt is not None and other_rt is not None and abs(rt - other_rt) > tolerance:
+            return False
+    return True
+
+
+def _add_to_bucket(buckets, key, position):
+    if key is None:
+        return
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = {position}
+    else:
+        bucket.add(position)
+
+
+# Hashes a list of molecules by uid, formula, IUPAC name and known names.
+# Lookups follow the precedence rules of are_same_molecules and return matches in insertion order,
+# exactly like a linear scan of the list would.
+class MoleculeIndex(object):
+    def __init__(self, molecules=None):
+        self.molecules = []
+        self._positions = {}
+        self._by_uid = {}
+        self._by_formula = {}
+        self._by_iupac = {}
+        self._by_name = {}
+        # NameIndex of every known name, only built once relaxed candidates are looked up without close names
+        self._names = None
+        self._without_uid = set()
+        self._without_formula = set()
+        self._without_iupac = set()
+        # Retention time of every position per column, NaN when unknown. Only built once relaxed candidates are
+        # filtered by retention time.
+        self._retention_times = None
+
+        for m in molecules if molecules is not None else []:
+            self.add(m)
+
+    def __len__(self):
+        return len(self.molecules)
+
+    def __iter__(self):
+        return iter(self.molecules)
+
+    def __contains__(self, molecule):
+        return id(molecule) in self._positions
+
+    @property
+    def names(self):
+        # NameIndex of the names of every indexed molecule
+        if self._names is None:
+            self._names = NameIndex(self._by_name)
+        return self._names
+
+    def add(self, molecule: Molecule):
+        if molecule in self:
+            self.update(molecule)
+            return
+        position = len(self.molecules)
+        self.molecules.append(molecule)
+        self._positions[id(molecule)] = position
+        self._without_uid.add(position)
+        self._without_formula.add(position)
+        self._without_iupac.add(position)
+        if self._retention_times is not None:
+            for values in self._retention_times.values():
+                values.append(math.nan)
+        self.update(molecule)
+
+    def update(self, molecule: Molecule):
+        # Must be called every time an indexed molecule is modified (e.g. after merge_with).
+        # Keys are only ever added: stale entries are filtered out when lookups are verified.
+        position = self._positions[id(molecule)]
+
+        _add_to_bucket(self._by_uid, molecule.uid, position)
+        _add_to_bucket(self._by_formula, molecule.formula, position)
+        _add_to_bucket(self._by_iupac, molecule.iupac, position)
+        for name in molecule.known_names:
+            _add_to_bucket(self._by_name, name, position)
+            if self._names is not None:
+                self._names.add(name)
+
+        if molecule.uid is not None:
+            self._without_uid.discard(position)
+        if molecule.formula is not None:
+            self._without_formula.discard(position)
+        if molecule.iupac is not None:
+            self._without_iupac.discard(position)
+        if self._retention_times is not None:
+            self._index_retention_times(position, molecule)
+
+    def _index_retention_times(self, position, molecule):
+        for column, rt in molecule.retention_times.items():
+            values = self._retention_times.get(column)
+            if values is None:
+                values = self._retention_times[column] = array("d", [math.nan]) * len(self.molecules)
+            values[position] = rt if rt is not None else math.nan
+
+    def _strict_candidates(self, molecule):
+        candidates = set()
+        for buckets, key in [
+            (self._by_uid, molecule.uid),
+            (self._by_formula, molecule.formula),
+            (self._by_iupac, molecule.iupac),
+        ]:
+            if key is not None:
+                candidates.update(buckets.get(key, ()))
+        for name in molecule.known_names:
+            candidates.update(self._by_name.get(name, ()))
+        return candidates
+
+    def _relaxed_candidates(self, molecule, close_names=None):
+        candidates = set()
+        for name in molecule.known_names:
+            close = close_names.get(name) if close_names is not None else None
+            if close is None:
+                for candidate_name in self.names.candidates(name):
+                    candidates.update(self._by_name[candidate_name])
+            else:
+                for candidate_name in close:
+                    candidates.update(self._by_name.get(candidate_name, ()))
+
+        # A pair can only be RELAXED if none of uid, formula and IUPAC name is known on both sides
+        for key, missing in [
+            (molecule.uid, self._without_uid),
+            (molecule.formula, self._without_formula),
+            (molecule.iupac, self._without_iupac),
+        ]:
+            if key is not None:
+                candidates &= missing
+        return candidates
+
+    def find_strict(self, molecule: Molecule):
+        match = None
+        comparisons = 0
+        for position in sorted(self._strict_candidates(molecule)):
+            candidate = self.molecules[position]
+            comparisons += 1
+            if are_same_molecules(molecule, candidate) == Equivalence.STRICT:
+                match = candidate
+                break
+        profiler.count("strict comparisons", comparisons)
+        return match
+
+    def _filter_by_retention_times(self, molecule, positions, tolerance):
+        # Drops the candidates whose retention time differs by more than tolerance from the one of molecule on a
+        # column known for both. Candidates sharing no column with molecule are kept.
+        import numpy as np
+
+        if self._retention_times is None:
+            self._retention_times = {}
+            for position, m in enumerate(self.molecules):
+                self._index_retention_times(position, m)
+
+        indices = np.array(positions)
+        keep = np.ones(len(positions), dtype=bool)
+        for column, rt in molecule.retention_times.items():
+            values = self._retention_times.get(column)
+            if values is not None and rt is not None:
+                # Comparisons with NaN are false: unknown retention times never reject a candidate
+                keep &= ~(np.abs(np.frombuffer(values)[indices] - rt) > tolerance)
+        profiler.count("candidates rejected by retention time", len(positions) - int(keep.sum()))
+        return [position for position, kept in zip(positions, keep.tolist()) if kept]
+
+    def iter_relaxed(self, molecule: Molecule, close_names=None, rt_tolerance=None, close_pairs=()):
+        # close_names optionally maps the names of molecule to every name close to them (see CloseNameFinder).
+        # With rt_tolerance, candidates are first filtered by retention time (see _filter_by_retention_times).
+        # close_pairs holds name_pair keys of first names known to be close (e.g. stored match decisions), the names
+        # of such candidates are not compared again.
+        candidate_names = close_names
+        if close_names is None:
+            # Names are only compared with the names of the candidates left once filtered by retention time
+            candidate_names = {name: self.names.candidates(name) for name in molecule.known_names}
+        positions = sorted(self._relaxed_candidates(molecule, candidate_names))
+        if rt_tolerance is not None and positions and molecule.retention_times:
+            positions = self._filter_by_retention_times(molecule, positions, rt_tolerance)
+        if close_names is None:
+            names = {name for position in positions for name in self.molecules[position].known_names}
+            close_names = {
+                name: {c for c in candidates & names if _are_name_close(name, c)}
+                for name, candidates in candidate_names.items()
+            }
+        for position in positions:
+            candidate = self.molecules[position]
+            profiler.count("relaxed comparisons")
+            close = close_names
+            if close_pairs and name_pair(molecule.known_names[0], candidate.known_names[0]) in close_pairs:
+                first_name = molecule.known_names[0]
+                close = {**close_names, first_name: {*close_names.get(first_name, ()), candidate.known_names[0]}}
+            if are_same_molecules(molecule, candidate, close) == Equivalence.RELAXED:
+                yield candidate
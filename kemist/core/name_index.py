@@ -0,0 +1,137 @@
+# Two names are close when one of them matches a substring of the other with at most one edit
+# (see kemist.core.molecule._are_name_close). A single edit leaves at least one half of the pattern
+# untouched, so a close name must either contain one half of the query or have one of its own halves
+# contained in the query. Both conditions are answered from hash maps and the surviving candidates are
+# verified around the exact occurrences of those halves instead of going through fuzzysearch.
+
+
+def halves(name):
+    middle = len(name) // 2
+    return name[:middle], name[middle:]
+
+
+def _is_near_prefix(pattern, text):
+    # True if a prefix of text is at most one edit away from pattern
+    common = 0
+    while common < len(pattern) and common < len(text) and pattern[common] == text[common]:
+        common += 1
+    if common == len(pattern):
+        return True
+    return (
+        text.startswith(pattern[common + 1 :], common + 1)
+        or text.startswith(pattern[common + 1 :], common)
+        or text.startswith(pattern[common:], common + 1)
+    )
+
+
+def is_near_substring(pattern, text):
+    # Same semantics as fuzzysearch.find_near_matches(pattern, text, max_l_dist=1) returning a match
+    if len(pattern) <= 1:
+        return True
+    if len(pattern) > len(text) + 1:
+        return False
+
+    left, right = halves(pattern)
+    start = text.find(left)
+    while start != -1:
+        if _is_near_prefix(right, text[start + len(left) :]):
+            return True
+        start = text.find(left, start + 1)
+
+    reversed_left = left[::-1]
+    start = text.find(right)
+    while start != -1:
+        if _is_near_prefix(reversed_left, text[start - 1 :: -1] if start > 0 else ""):
+            return True
+        start = text.find(right, start + 1)
+    return False
+
+
+def _are_name_close(a, b):
+    return is_near_substring(a, b) or is_near_substring(b, a)
+
+
+def _trigrams(name):
+    return {name[i : i + 3] for i in range(len(name) - 2)}
+
+
+def _short_pieces(name):
+    # Substrings of one and two characters, the halves of names of up to 5 characters have no trigram
+    return {name[i : i + length] for length in [1, 2] for i in range(len(name) - length + 1)}
+
+
+class NameIndex(object):
+    def __init__(self, names=None):
+        self._names = set()
+        self._by_trigram = {}
+        self._by_short_piece = {}
+        self._by_half = {}
+        self._half_lengths = {}
+
+        for name in names if names is not None else []:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def add(self, name):
+        if name in self._names:
+            return
+        self._names.add(name)
+
+        for trigram in _trigrams(name):
+            self._by_trigram.setdefault(trigram, set()).add(name)
+        for piece in _short_pieces(name):
+            self._by_short_piece.setdefault(piece, set()).add(name)
+
+        for half in halves(name):
+            self._by_half.setdefault(half, set()).add(name)
+            self._half_lengths[len(half)] = self._half_lengths.get(len(half), 0) + 1
+
+    def _names_containing(self, piece):
+        # Not to be modified, may be a posting set of the index
+        if not piece:
+            return self._names
+        if len(piece) < 3:
+            return self._by_short_piece.get(piece, set())
+
+        postings = sorted((self._by_trigram.get(trigram, set()) for trigram in _trigrams(piece)), key=len)
+        return {name for name in postings[0].intersection(*postings[1:]) if piece in name}
+
+    def _names_contained_in(self, query):
+        contained = set()
+        for length in self._half_lengths:
+            for start in range(len(query) - length + 1):
+                contained.update(self._by_half.get(query[start : start + length], ()))
+        return contained
+
+    def _names_containing_half(self, name):
+        found = set()
+        for half in halves(name):
+            found.update(self._names_containing(half))
+        return found
+
+    def candidates(self, name):
+        # Superset of close_names(name), computed without any fuzzy comparison
+        return self._names_contained_in(name) | self._names_containing_half(name)
+
+    def close_names(self, name):
+        # Each kind of candidate is only verified in the direction it was found for, a name close in the other
+        # direction is a candidate of both kinds
+        close = {
+            candidate
+            for candidate in self._names_contained_in(name)
+            if len(candidate) <= len(name) + 1 and is_near_substring(candidate, name)
+        }
+        close.update(
+            candidate
+            for candidate in self._names_containing_half(name)
+            if candidate not in close and len(candidate) >= len(name) - 1 and is_near_substring(name, candidate)
+        )
+        return close
@@ -0,0 +1,69 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from kemist.core import logger, profiler
+from kemist.core.name_index import NameIndex, _are_name_close
+
+DEFAULT_BLOCK_SIZE = 256
+
+
+def _verify_block(block):
+    # Runs in a worker process, keeps the candidates that are actually close to each name
+    return [[c for c in candidates if _are_name_close(name, c)] for name, candidates in block]
+
+
+# Computes which names are close to each other on several processes ahead of relaxed matching, in the calling process
+# with a single job.
+# Closeness only depends on the two names compared, merging with the result (see are_same_molecules) therefore takes
+# exactly the decisions the serial merge takes, in the same order, while confirmations stay in the calling process.
+# Candidate pairs are blocked by the halves and trigrams of the NameIndex, which never miss a close pair, and names
+# are sorted so that a block mostly holds names sharing a prefix.
+class CloseNameFinder(object):
+    def __init__(self, jobs, block_size=DEFAULT_BLOCK_SIZE):
+        self.jobs = jobs
+        self.block_size = block_size
+        self._executor = None
+
+    def _map(self, blocks):
+        if self.jobs <= 1:
+            return map(_verify_block, blocks)
+        if self._executor is None:
+            # Workers are spawned rather than forked as the database writer thread may hold locks
+            logger.debug(f"Starting {self.jobs} matching processes")
+            self._executor = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor.map(_verify_block, blocks)
+
+    def verify(self, candidates):
+        # Returns {name: set of the candidates close to name} for candidates mapping names to candidate names
+        # (e.g. Database.find_name_candidates)
+        pairs = [(name, sorted(names)) for name, names in sorted(candidates.items())]
+        profiler.count("fuzzy comparisons", sum(len(names) for _, names in pairs))
+
+        blocks = [pairs[i : i + self.block_size] for i in range(0, len(pairs), self.block_size)]
+        verified = {}
+        for block, close in zip(blocks, self._map(blocks)):
+            for (name, _), close_candidates in zip(block, close):
+                verified[name] = set(close_candidates)
+        return verified
+
+    def find(self, names, keep=None):
+        # Returns, for every name of names, the set of the names of names close to it.
+        # keep(name, other_name) optionally tells whether a pair of candidates is worth comparing.
+        names = sorted(set(names))
+        index = NameIndex(names)
+
+        # A pair of names is only verified once
+        candidates = {
+            name: {c for c in index.candidates(name) if c > name and (keep is None or keep(name, c))} for name in names
+        }
+        close_names = {name: {name} for name in names}
+        for name, close in self.verify(candidates).items():
+            for other in close:
+                close_names[name].add(other)
+                close_names[other].add(name)
+        return close_names
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
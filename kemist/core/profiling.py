@@ -0,0 +1,151 @@
+import contextlib
+import functools
+import threading
+import time
+
+from kemist.core.logging_utils import logger
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class _Span(object):
+    __slots__ = ("profiler", "name", "path", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        stack.append(self.name)
+        self.path = tuple(stack)
+        self.profiler._open(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler._close(self.path, time.perf_counter() - self.start)
+        self.profiler._stack().pop()
+
+
+# Nested timing spans and counters of a run. Spans nest per thread: a span opened in a worker thread is a root span.
+# Everything is a no-op until the profiler is enabled, hot paths only pay for a method call and an attribute check.
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.spans = {}
+        self.counters = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _open(self, path):
+        # Spans are listed in the order they are first opened
+        with self._lock:
+            self.spans.setdefault(path, [0, 0.0])
+
+    def _close(self, path, seconds):
+        with self._lock:
+            span = self.spans[path]
+            span[0] += 1
+            span[1] += seconds
+
+    def span(self, name):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        # Decorator recording every call of the function as a span
+        def decorate(function):
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Span(self, name):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorate
+
+    def count(self, counter, increment=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + increment
+
+    def _count_statement(self, _):
+        self.count("sql statements")
+
+    def trace(self, connection):
+        # Counts the statements executed by a sqlite3 connection opened while profiling
+        if self.enabled:
+            connection.set_trace_callback(self._count_statement)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "spans": [
+                    {"path": "/".join(path), "calls": calls, "seconds": seconds}
+                    for path, (calls, seconds) in self.spans.items()
+                ],
+                "counters": dict(self.counters),
+            }
+
+    def summary(self):
+        with self._lock:
+            # Every span is listed under its parent, siblings in the order they were first opened
+            order = {path: i for i, path in enumerate(self.spans)}
+            paths = sorted(self.spans, key=lambda path: [order[path[: i + 1]] for i in range(len(path))])
+            labels = ["  " * (len(path) - 1) + path[-1] for path in paths]
+            width = max([len(label) for label in labels] + [len(c) for c in self.counters] + [20])
+            lines = [f"{'span':<{width}} {'calls':>8} {'total (s)':>10} {'mean (ms)':>10}"]
+            for label, path in zip(labels, paths):
+                calls, seconds = self.spans[path]
+                mean = 1000 * seconds / calls if calls else 0.0
+                lines.append(f"{label:<{width}} {calls:>8} {seconds:>10.3f} {mean:>10.3f}")
+            lines.append(f"{'counter':<{width}} {'value':>8}")
+            for counter, value in self.counters.items():
+                lines.append(f"{counter:<{width}} {value:>8}")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
+
+
+@contextlib.contextmanager
+def profile_session(json_path=None, cprofile_path=None):
+    # Profiles the block, logs a summary once it is done and optionally writes it as JSON.
+    # cprofile_path additionally records the block with cProfile, the file can be read with pstats.
+    profiler.reset()
+    profiler.enabled = True
+    python_profiler = None
+    if cprofile_path is not None:
+        import cProfile
+
+        python_profiler = cProfile.Profile()
+        python_profiler.enable()
+    try:
+        yield profiler
+    finally:
+        if python_profiler is not None:
+            python_profiler.disable()
+            python_profiler.dump_stats(cprofile_path)
+        profiler.enabled = False
+        logger.info(f"Profile:\n{profiler.summary()}")
+        if json_path is not None:
+            import json
+
+            with open(json_path, "w") as file:
+                json.dump(profiler.as_dict(), file, indent=2)
@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from kemist.core import logger, profiler
+
+DAY = 24 * 60 * 60
+DEFAULT_TTL = 90 * DAY
+DEFAULT_NEGATIVE_TTL = 7 * DAY
+DEFAULT_MAX_ENTRIES = 200000
+
+_MISSING = object()
+
+
+# Persistent cache of resolver answers keyed by (identifier, representation).
+# Unresolvable identifiers are cached too (negative caching) but expire sooner than resolved ones.
+# Once the cache holds more than max_entries, the least recently used entries are evicted.
+class ResolverCache(object):
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        logger.debug(f"Opening resolver cache {path}")
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS "resolver_cache" (
+                "identifier"	TEXT NOT NULL,
+                "representation"	TEXT NOT NULL,
+                "value"	TEXT,
+                "created"	REAL NOT NULL,
+                "last_access"	REAL NOT NULL,
+                PRIMARY KEY("identifier","representation")
+            );
+            CREATE INDEX IF NOT EXISTS "resolver_cache_last_access" ON "resolver_cache" ("last_access");
+        """
+        )
+        (self._size,) = self.connection.execute("SELECT COUNT(*) FROM resolver_cache").fetchone()
+
+    def _is_expired(self, value, created, now):
+        return now - created > (self.ttl if value is not None else self.negative_ttl)
+
+    def get(self, identifier, representation, default=_MISSING):
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value, created FROM resolver_cache WHERE identifier=? AND representation=?",
+                [identifier, representation],
+            ).fetchone()
+            if row is None or self._is_expired(row[0], row[1], now):
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE resolver_cache SET last_access=? WHERE identifier=? AND representation=?",
+                [now, identifier, representation],
+            )
+            self.connection.commit()
+        return json.loads(row[0]) if row[0] is not None else None
+
+    def set(self, identifier, representation, value):
+        now = time.time()
+        with self._lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM resolver_cache WHERE identifier=? AND representation=?", [identifier, representation]
+            ).fetchone()
+            self.connection.execute(
+                """
+                INSERT INTO resolver_cache (identifier, representation, value, created, last_access)
+                VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(identifier, representation) DO UPDATE SET
+                    value=excluded.value, created=excluded.created, last_access=excluded.last_access
+                """,
+                [identifier, representation, json.dumps(value) if value is not None else None, now, now],
+            )
+            if exists is None:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+            self.connection.commit()
+
+    def _evict(self, count):
+        logger.debug(f"Evicting {count} entries from the resolver cache")
+        self.connection.execute(
+            "DELETE FROM resolver_cache WHERE rowid IN (SELECT rowid FROM resolver_cache ORDER BY last_access LIMIT ?)",
+            [count],
+        )
+        self._size -= count
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            entries, negative, fresh = self.connection.execute(
+                """
+                SELECT COUNT(*), COUNT(*) - COUNT(value),
+                    COALESCE(SUM(created >= CASE WHEN value IS NULL THEN ? ELSE ? END), 0)
+                FROM resolver_cache
+                """,
+                [now - self.negative_ttl, now - self.ttl],
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "negative_entries": negative,
+            "expired_entries": entries - fresh,
+            "max_entries": self.max_entries,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM resolver_cache")
+            self.connection.commit()
+            self.connection.execute("VACUUM")
+            self._size = 0
+
+    def close(self):
+        self.connection.close()
+
+
+class CachedResolver(object):
+    def __init__(self, resolve, cache: ResolverCache):
+        self.resolve = resolve
+        self.cache = cache
+
+    def __call__(self, identifier, representation):
+        value = self.cache.get(identifier, representation)
+        if value is not _MISSING:
+            profiler.count("cir cache hits")
+            logger.debug(f"Resolver cache hit for {identifier} ({representation})")
+            return value
+
+        profiler.count("cir cache misses")
+        value = self.resolve(identifier, representation)
+        self.cache.set(identifier, representation, value)
+        return value
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+# Per-column sorted retention times. A window rt ± tolerance is answered with two binary searches and
+# many windows are answered at once with numpy.searchsorted.
+class RetentionTimeIndex(object):
+    def __init__(self, rows=()):
+        grouped = {}
+        for column, uid, rt in rows:
+            uids, rts = grouped.setdefault(column, ([], []))
+            uids.append(uid)
+            rts.append(rt)
+
+        self._columns = {}
+        for column, (uids, rts) in grouped.items():
+            rts = np.asarray(rts, dtype=np.float64)
+            order = np.argsort(rts, kind="stable")
+            self._columns[column] = (rts[order], np.asarray(uids, dtype=np.int64)[order])
+
+    def __contains__(self, column):
+        return column in self._columns
+
+    def __len__(self):
+        return sum(len(rts) for rts, _ in self._columns.values())
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def windows(self, column, rts, tolerance):
+        # Returns the [start, end) positions of every window in the sorted arrays of column
+        values, _ = self._columns[column]
+        rts = np.asarray(rts, dtype=np.float64)
+        return (
+            np.searchsorted(values, rts - tolerance, side="left"),
+            np.searchsorted(values, rts + tolerance, side="right"),
+        )
+
+    def search(self, column, rt, tolerance):
+        values, uids = self._columns[column]
+        start, end = self.windows(column, rt, tolerance)
+        return uids[start:end], values[start:end]
+
+    def search_many(self, column, rts, tolerance):
+        # Returns flat arrays (query indices, uids, retention times), sorted by query then retention time
+        values, uids = self._columns[column]
+        starts, ends = self.windows(column, np.atleast_1d(rts), tolerance)
+        counts = ends - starts
+        queries = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + offsets
+        return queries, uids[positions], values[positions]
@@ -1 +1,20 @@
-from .database import Database
+import importlib
+
+# Imported on first access, see kemist.core
+_LAZY_ATTRIBUTES = {
+    "Database": ".database",
+    "FederatedDatabase": ".federation",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
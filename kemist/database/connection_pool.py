@@ -0,0 +1,70 @@
+import pathlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kemist.core import logger, profiler
+
+DEFAULT_BUSY_TIMEOUT = 5.0
+
+
+# Connections to a database file in WAL mode shared by several threads. Each thread reads through its own read-only
+# connection while every write runs, one at a time, on a single writer thread owning the only read-write connection.
+# Readers are in autocommit mode so that they never keep an old snapshot of the database opened.
+class ConnectionPool(object):
+    def __init__(self, path, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        if path == ":memory:" or str(path).startswith("file::memory:"):
+            raise RuntimeError("Pooled connections need a database file")
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._readers = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="kemist-db-writer", initializer=self._open_writer
+        )
+        self._writer_connection = self._writer.submit(lambda: self._local.connection).result()
+
+    def _open_writer(self):
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        if connection.execute("PRAGMA journal_mode = WAL").fetchone()[0] != "wal":
+            logger.warning(f"Could not enable WAL journaling on {self.path}, readers may be blocked by writes")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        profiler.trace(connection)
+        self._local.connection = connection
+        self._local.is_writer = True
+
+    def _open_reader(self):
+        uri = f"{pathlib.Path(self.path).absolute().as_uri()}?mode=ro"
+        connection = sqlite3.connect(
+            uri, uri=True, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+        )
+        profiler.trace(connection)
+        with self._lock:
+            self._readers.append(connection)
+        return connection
+
+    def in_writer(self):
+        return getattr(self._local, "is_writer", False)
+
+    def connection(self):
+        # The writer connection on the writer thread, a read-only connection of the calling thread otherwise
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._open_reader()
+        return connection
+
+    def write(self, function, *args, **kwargs):
+        # Runs function on the writer thread once the writes queued before it are done and returns its result.
+        # Writes issued from the writer thread itself run immediately.
+        if self.in_writer():
+            return function(*args, **kwargs)
+        return self._writer.submit(function, *args, **kwargs).result()
+
+    def close(self):
+        self._writer.submit(self._writer_connection.close).result()
+        self._writer.shutdown()
+        with self._lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers.clear()
@@ -1,59 +1,441 @@
+import contextlib
+import functools
 import sqlite3
 
-from kemist.core import Molecule, StorageUnit
-from kemist.core import logger
+from kemist.core import DeferredRelation, Molecule, StorageUnit
+from kemist.core import logger, profiler
+from kemist.core import monoisotopic_mass, parse_formula
+from kemist.core import halves, is_near_substring
 
 import kemist.database.build_request as requests
+import kemist.database.migrations as migrations
+from kemist.database.connection_pool import ConnectionPool, DEFAULT_BUSY_TIMEOUT
 
+RELATIONS = ("names", "rts")
+DEFAULT_SEARCH_LIMIT = 10
+# Number of candidates per result of search_names compared with the query
+SEARCH_CANDIDATES = 100
+# Number of names whose substrings are looked up at once by find_name_candidates
+CLOSE_NAMES_CHUNK = 1000
+BULK_LOAD_PRAGMAS = [("cache_size", -64000), ("synchronous", "OFF"), ("temp_store", "MEMORY")]
 
-class Database(object):
-    def __init__(self, path):
-        logger.debug(f"Connecting to {path}")
-        self.connection = sqlite3.connect(path)
-        self.cursor = self.connection.cursor()
 
-    def _molecule_from_req(self, req, req_args):
-        res = self.cursor.execute(req, req_args)
-        molecules = [
-            Molecule(uid, iupac, formula, on_libview, mode) for uid, iupac, formula, on_libview, mode in res.fetchall()
-        ]
+def _fts_string(text):
+    # FTS5 string, matching text as a whole (a substring with the trigram tokenizer)
+    return '"' + text.replace('"', '""') + '"'
 
-        for m in molecules:
-            res = self.cursor.execute("SELECT name FROM molecule_names WHERE molecule_uid=?", [m.uid])
-            for (name,) in res.fetchall():
-                m.known_names.append(name)
 
-            res = self.cursor.execute(
-                "SELECT retention_time, column FROM molecule_retention_times WHERE molecule_uid=?", [m.uid]
+def _half_match(half, other_half):
+    # FTS5 query of the names containing half, and one of the trigrams of other_half when one edit of other_half
+    # (which changes at most 3 trigrams) always leaves one. None when half has no trigram.
+    if len(half) < 3:
+        return None
+    trigrams = sorted({other_half[i : i + 3] for i in range(len(other_half) - 2)})
+    if len(trigrams) < 4:
+        return _fts_string(half)
+    return f"{_fts_string(half)} AND ({' OR '.join(_fts_string(trigram) for trigram in trigrams)})"
+
+
+def _contained_halves(name):
+    # Substrings of name that can be a half of a name matching a substring of name with at most one edit
+    longest = (len(name) + 2) // 2
+    return {name[i : i + length] for length in range(longest + 1) for i in range(len(name) - length + 1)}
+
+
+def _serialized_write(method):
+    # In pooled mode, runs the method on the writer thread of the pool
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        if self._pool is None:
+            return method(self, *args, **kwargs)
+        return self._pool.write(method, self, *args, **kwargs)
+
+    return write
+
+
+class Database(object):
+    # With pooled=True the database is switched to WAL journaling, every thread reads through its own read-only
+    # connection and writes are serialized on a dedicated writer connection (see ConnectionPool).
+    # Otherwise a single connection is used by the thread that opened the database.
+    def __init__(self, path, pooled=False, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        logger.debug(f"Connecting to {path}{' (pooled)' if pooled else ''}")
+        self._pool = None
+        if pooled:
+            self._pool = ConnectionPool(path, busy_timeout)
+        else:
+            self._connection = sqlite3.connect(path, timeout=busy_timeout)
+            profiler.trace(self._connection)
+            self._cursor = self._connection.cursor()
+        # Whether the trigram index of the names exists, see search_names
+        self._name_search = None
+        self._relation_loaders = {
+            "names": ("known_names", self._load_names),
+            "rts": ("retention_times", self._load_retention_times),
+        }
+        self._migrate()
+
+    @property
+    def connection(self):
+        return self._connection if self._pool is None else self._pool.connection()
+
+    @property
+    def cursor(self):
+        return self._cursor if self._pool is None else self.connection.cursor()
+
+    def close(self):
+        if self._pool is None:
+            self._connection.close()
+        else:
+            self._pool.close()
+
+    @_serialized_write
+    def _migrate(self):
+        version = migrations.get_schema_version(self.connection)
+        migrations.migrate(self.connection)
+        if version <= migrations.MIGRATIONS.index(migrations.MOLECULE_MASSES):
+            # Masses of the molecules written before they were stored
+            self.refresh_masses()
+
+    def _molecule_from_req(self, req, req_args, prefetch=()):
+        # Hydrates molecules in one query. Relations listed in prefetch ("names", "rts") are fetched right away by
+        # re-using req as a sub-query, the others are loaded for all the molecules at once the first time one of
+        # them accesses it.
+        rows = self.connection.execute(req, req_args).fetchall()
+        if not rows:
+            return []
+
+        names = {}
+        if "names" in prefetch:
+            res = self.connection.execute(
+                f"SELECT molecule_uid, name FROM molecule_names WHERE molecule_uid IN (SELECT uid FROM ({req})) "
+                f"ORDER BY rowid",
+                req_args,
+            )
+            for uid, name in res:
+                names.setdefault(uid, []).append(name)
+
+        retention_times = {}
+        if "rts" in prefetch:
+            res = self.connection.execute(
+                f"SELECT molecule_uid, column, retention_time FROM molecule_retention_times "
+                f"WHERE molecule_uid IN (SELECT uid FROM ({req}))",
+                req_args,
+            )
+            for uid, column, rt in res:
+                retention_times.setdefault(uid, {})[column] = rt
+
+        molecules = {}
+        for uid, iupac, formula, on_libview, mode in rows:
+            molecules[uid] = Molecule(
+                uid, iupac, formula, on_libview, mode, names.get(uid), retention_times.get(uid)
             )
+        molecules = list(molecules.values())
 
-            for rt, column in res.fetchall():
-                m.retention_times[column] = rt
+        for relation in RELATIONS:
+            if relation not in prefetch:
+                attribute, load = self._relation_loaders[relation]
+                DeferredRelation(attribute, molecules, load)
 
         return molecules
 
+    def _fill_relation_uids(self, uids):
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS "relation_uids" ("uid" INTEGER PRIMARY KEY)')
+        self.connection.execute("DELETE FROM temp.relation_uids")
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO temp.relation_uids (uid) VALUES(?)", ((uid,) for uid in uids)
+        )
+
+    def _load_names(self, uids):
+        self._fill_relation_uids(uids)
+        names = {}
+        res = self.connection.execute(
+            "SELECT molecule_uid, name FROM molecule_names WHERE molecule_uid IN (SELECT uid FROM temp.relation_uids) "
+            "ORDER BY rowid"
+        )
+        for uid, name in res.fetchall():
+            names.setdefault(uid, []).append(name)
+        return names
+
+    def _load_retention_times(self, uids):
+        self._fill_relation_uids(uids)
+        retention_times = {}
+        res = self.connection.execute(
+            "SELECT molecule_uid, column, retention_time FROM molecule_retention_times "
+            "WHERE molecule_uid IN (SELECT uid FROM temp.relation_uids)"
+        )
+        for uid, column, rt in res.fetchall():
+            retention_times.setdefault(uid, {})[column] = rt
+        return retention_times
+
+    @_serialized_write
     def make_structure(self):
         requests.make_database_structure(self.connection, self.cursor)
+        self._name_search = None
 
-    def get_molecules(self):
-        return self._molecule_from_req("SELECT uid, iupac, formula, in_libview, mode FROM molecules", [])
+    @profiler.timed("get_molecules")
+    def get_molecules(self, prefetch=()):
+        return self._molecule_from_req("SELECT uid, iupac, formula, in_libview, mode FROM molecules", [], prefetch)
 
-    def get_storage_units(self):
-        storage_units = []
+    @profiler.timed("find_molecules")
+    def find_molecules(self, molecules, uids=(), prefetch=()):
+        # Returns, in uid order, every molecule sharing a uid, formula, IUPAC name or known name with one of
+        # molecules (i.e. every molecule that may be a STRICT match) and the molecules listed in uids
+        keys = [("uid", uid) for uid in uids]
+        for m in molecules:
+            keys.extend((kind, key) for kind, key in [("uid", m.uid), ("formula", m.formula), ("iupac", m.iupac)])
+            keys.extend(("name", name) for name in m.known_names)
 
-        res = self.cursor.execute("SELECT name FROM storage_units")
-        for (name,) in res.fetchall():
-            logger.debug(f"Fetching storage content for {name}")
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS "lookup_keys" ("kind" TEXT NOT NULL, "key")')
+        self.connection.execute("DELETE FROM temp.lookup_keys")
+        self.connection.executemany(
+            "INSERT INTO temp.lookup_keys (kind, key) VALUES(?, ?)", (k for k in keys if k[1] is not None)
+        )
+        return self._molecule_from_req(
+            """
+            SELECT uid, iupac, formula, in_libview, mode FROM molecules
+            WHERE uid IN (SELECT key FROM temp.lookup_keys WHERE kind = 'uid')
+                OR formula IN (SELECT key FROM temp.lookup_keys WHERE kind = 'formula')
+                OR iupac IN (SELECT key FROM temp.lookup_keys WHERE kind = 'iupac')
+                OR uid IN (
+                    SELECT molecule_uid FROM molecule_names
+                    WHERE name IN (SELECT key FROM temp.lookup_keys WHERE kind = 'name')
+                )
+            ORDER BY uid
+            """,
+            [],
+            prefetch,
+        )
 
-            request = "SELECT uid, iupac, formula, in_libview, mode FROM molecules/n"
-            request += "WHERE uid IN ("
-            request += "SELECT molecule_uid FROM molecule_storage WHERE storage_name = ?"
-            request += ")"
+    def iter_retention_times(self, columns=None):
+        if columns is None:
+            return self.connection.execute(
+                "SELECT column, molecule_uid, retention_time FROM molecule_retention_times ORDER BY column"
+            )
+        return self.connection.execute(
+            f"SELECT column, molecule_uid, retention_time FROM molecule_retention_times "
+            f"WHERE column IN ({', '.join('?' for _ in columns)}) ORDER BY column",
+            list(columns),
+        )
 
-            stored_molecules = self._molecule_from_req(request, [name])
+    def get_retention_times(self, uids):
+        # {uid: {column: retention_time}} of the molecules of uids having retention times
+        return self._load_retention_times(uids)
+
+    def iter_masses(self):
+        # Streams (uid, mass, mode, charge) rows of the molecules with a known mass
+        return self.connection.execute(
+            """
+            SELECT mm.molecule_uid, mm.mass, m.mode, mm.charge
+            FROM molecule_masses mm JOIN molecules m ON m.uid = mm.molecule_uid
+            WHERE mm.mass IS NOT NULL
+            """
+        )
 
-            storage_units.append(StorageUnit(name, stored_molecules))
-        return storage_units
+    @profiler.timed("refresh_masses")
+    @_serialized_write
+    def refresh_masses(self):
+        with self._bulk_load() as connection:
+            return self._refresh_masses(connection)
+
+    def _refresh_masses(self, connection, uids=None):
+        # (Re)computes the masses of the molecules whose formula changed since their mass was computed,
+        # optionally only among uids
+        request = """
+            SELECT m.uid, m.formula FROM molecules m
+            LEFT JOIN molecule_masses mm ON mm.molecule_uid = m.uid
+            WHERE m.formula IS NOT NULL AND mm.formula IS NOT m.formula
+        """
+        if uids is not None:
+            connection.execute('CREATE TEMP TABLE IF NOT EXISTS "mass_uids" ("uid" INTEGER PRIMARY KEY)')
+            connection.execute("DELETE FROM temp.mass_uids")
+            connection.executemany("INSERT OR IGNORE INTO temp.mass_uids (uid) VALUES(?)", ((uid,) for uid in uids))
+            request += " AND m.uid IN (SELECT uid FROM temp.mass_uids)"
+
+        mass_rows = []
+        for uid, formula in connection.execute(request).fetchall():
+            try:
+                mass_rows.append((uid, formula, monoisotopic_mass(formula), parse_formula(formula)[1]))
+            except ValueError as e:
+                logger.warning(f"Can't compute the mass of molecule {uid}: {e}")
+                mass_rows.append((uid, formula, None, 0))
+
+        written = connection.executemany(
+            """
+            INSERT INTO molecule_masses (molecule_uid, formula, mass, charge) VALUES(?, ?, ?, ?)
+            ON CONFLICT(molecule_uid) DO UPDATE SET
+                formula=excluded.formula, mass=excluded.mass, charge=excluded.charge
+            """,
+            mass_rows,
+        ).rowcount
+        profiler.count("rows written", written)
+        logger.debug(f"Computed {len(mass_rows)} molecule masses")
+        return len(mass_rows)
+
+    @profiler.timed("get_storage_units")
+    def get_storage_units(self, prefetch=()):
+        # Stored molecules are hydrated once, a molecule stored in several units is shared by them
+        molecules = self._molecule_from_req(
+            "SELECT uid, iupac, formula, in_libview, mode FROM molecules "
+            "WHERE uid IN (SELECT molecule_uid FROM molecule_storage) ORDER BY uid",
+            [],
+            prefetch,
+        )
+        molecules = {m.uid: m for m in molecules}
+
+        res = self.connection.execute("SELECT name FROM storage_units")
+        storage_units = {name: StorageUnit(name) for (name,) in res}
+        res = self.connection.execute("SELECT storage_name, molecule_uid FROM molecule_storage ORDER BY molecule_uid")
+        for storage_name, uid in res:
+            storage_units[storage_name].molecules.append(molecules[uid])
+        return list(storage_units.values())
+
+    @profiler.timed("locate")
+    def locate(self, names):
+        # {name: names of the storage units holding the molecule known by this name} for each of names.
+        # Names of unknown or unstored molecules map to an empty list.
+        names = list(names)
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS "located_names" ("name" TEXT PRIMARY KEY)')
+        self.connection.execute("DELETE FROM temp.located_names")
+        self.connection.executemany("INSERT OR IGNORE INTO temp.located_names (name) VALUES(?)", ((n,) for n in names))
+        res = self.connection.execute(
+            """
+            SELECT l.name, s.storage_name FROM temp.located_names l
+            JOIN molecule_names n ON n.name = l.name
+            JOIN molecule_storage s ON s.molecule_uid = n.molecule_uid
+            ORDER BY l.name, s.storage_name
+            """
+        )
+        locations = {name: [] for name in names}
+        for name, storage_name in res:
+            locations[name].append(storage_name)
+        return locations
+
+    @profiler.timed("search_names")
+    def search_names(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        # Returns up to limit (name, molecule_uid, similarity) of the known names containing query with at most one
+        # edit (see kemist.core.name_index), exact substrings first then by difflib similarity.
+        # A close name contains query or one of its halves, which the trigram index finds as phrases. Names are
+        # read shortest first: the similarity of a name containing query only depends on its length, so the limit
+        # names containing query are exactly the best ones. Names containing a half are read up to
+        # SEARCH_CANDIDATES candidates per result. Names are compared case-sensitively, like every name lookup.
+        import difflib
+
+        query = query.strip()
+        candidates = limit * SEARCH_CANDIDATES
+        left, right = halves(query)
+        if len(query) >= 3 and self._has_name_search():
+            # The trigram index ignores case: names containing query as is are read first, then the ones containing it
+            # in another case, which may still be one edit away
+            request = """
+                SELECT n.name, n.molecule_uid FROM molecule_names_fts f JOIN molecule_names n ON n.rowid = f.rowid
+                WHERE molecule_names_fts MATCH ? AND instr(n.name, ?) > 0 ORDER BY length(n.name), n.name LIMIT ?
+            """
+            lookups = [
+                (_fts_string(query), query, limit),
+                (_fts_string(query), "", candidates),
+                (_half_match(left, right), "", candidates),
+                (_half_match(right, left), "", candidates),
+            ]
+        else:
+            # Shorter queries have no trigram and SQLite older than 3.34 no trigram index, names are scanned
+            request = (
+                "SELECT name, molecule_uid FROM molecule_names WHERE instr(name, ?) > 0 "
+                "ORDER BY length(name), name LIMIT ?"
+            )
+            lookups = [(query, limit)]
+            if len(query) >= 3:
+                lookups += [(half, candidates) for half in [left, right] if len(half) >= 3]
+
+        rows = []
+        for parameters in lookups:
+            if len(rows) >= limit:
+                # Enough names contain query, misspelled names would be ranked after them
+                break
+            if parameters[0] is not None:
+                rows += self.connection.execute(request, parameters).fetchall()
+
+        matches = {}
+        for name, uid in rows:
+            if name not in matches and is_near_substring(query, name):
+                matches[name] = (uid, difflib.SequenceMatcher(None, query, name).ratio())
+        ranked = sorted(matches.items(), key=lambda item: (query not in item[0], -item[1][1], item[0]))
+        return [(name, uid, similarity) for name, (uid, similarity) in ranked[:limit]]
+
+    @profiler.timed("find_name_candidates")
+    def find_name_candidates(self, names):
+        # Returns {name: {known_name: molecule_uid}} of the known names that may be close to each of names (see
+        # kemist.core.name_index), a superset of the close names found without reading every known name.
+        # A known name containing a name with one edit contains one of its halves, found by the trigram index (names
+        # are scanned for halves without trigram). A known name contained in a name with one edit has one of its own
+        # halves in the name, found by looking up the substrings of the name in molecule_name_halves.
+        names = sorted(set(names))
+        candidates = {name: {} for name in names}
+
+        scanned = {}
+        for name in names:
+            left, right = halves(name)
+            for half, other_half in [(left, right), (right, left)]:
+                if len(half) >= 3 and self._has_name_search():
+                    rows = self.connection.execute(
+                        """
+                        SELECT n.name, n.molecule_uid FROM molecule_names_fts f
+                        JOIN molecule_names n ON n.rowid = f.rowid WHERE molecule_names_fts MATCH ?
+                        """,
+                        (_half_match(half, other_half),),
+                    )
+                else:
+                    if half not in scanned:
+                        scanned[half] = self.connection.execute(
+                            "SELECT name, molecule_uid FROM molecule_names WHERE instr(name, ?) > 0", (half,)
+                        ).fetchall()
+                    rows = scanned[half]
+                candidates[name].update((known, uid) for known, uid in rows if len(known) >= len(name) - 1)
+
+        # Names of a chunk share many substrings, each one is looked up once
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS "name_pieces" ("piece" TEXT NOT NULL)')
+        for start in range(0, len(names), CLOSE_NAMES_CHUNK):
+            chunk = names[start : start + CLOSE_NAMES_CHUNK]
+            self.connection.execute("DELETE FROM temp.name_pieces")
+            self.connection.executemany(
+                "INSERT INTO temp.name_pieces (piece) VALUES(?)",
+                ((piece,) for piece in set().union(*map(_contained_halves, chunk))),
+            )
+            res = self.connection.execute(
+                """
+                SELECT h.half, n.name, n.molecule_uid FROM temp.name_pieces p
+                CROSS JOIN molecule_name_halves h ON h.half = p.piece
+                JOIN molecule_names n ON n.name = h.name
+                """
+            )
+            by_half = {}
+            for half, known, uid in res:
+                by_half.setdefault(half, []).append((known, uid))
+            for name in chunk:
+                for half in _contained_halves(name) & by_half.keys():
+                    candidates[name].update((known, uid) for known, uid in by_half[half] if len(known) <= len(name) + 1)
+        return candidates
+
+    def _has_name_search(self):
+        if self._name_search is None:
+            self._name_search = migrations.has_name_search(self.connection)
+        return self._name_search
+
+    def get_match_decisions(self):
+        # {(name, other_name): same} for every stored decision, see kemist.core.name_pair
+        res = self.connection.execute("SELECT name, other_name, same FROM match_decisions")
+        return {(name, other_name): bool(same) for name, other_name, same in res}
+
+    @_serialized_write
+    def store_match_decisions(self, decisions):
+        with self._bulk_load() as connection:
+            written = connection.executemany(
+                """
+                INSERT INTO match_decisions (name, other_name, same) VALUES(?, ?, ?)
+                ON CONFLICT(name, other_name) DO UPDATE SET same=excluded.same
+                """,
+                ((name, other_name, int(same)) for (name, other_name), same in decisions.items()),
+            ).rowcount
+            profiler.count("rows written", written)
 
     def get_known_retention_times(self):
         res = self.cursor.execute("SELECT DISTINCT column FROM molecule_retention_times")
@@ -63,88 +445,169 @@ class Database(object):
 
         return names
 
-    def update_all_molecules(self, molecules):
-        for m in molecules:
-            if m.uid is None:
-                self._add_molecule(m)
-            else:
-                self._update_molecule(m)
-        self.connection.commit()
-
-    def update_all_storage_units(self, storage_units):
-        for s in storage_units:
-            self.cursor.execute("INSERT OR IGNORE INTO storage_units (name) VALUES(?)", [s.name])
-            for m in s.molecules:
-                if m.uid is None:
-                    logger.error(f"Can't add an unknow molecule to storage. Skipping {m.known_names[0]}...")
-                    continue
-
-                self.cursor.execute(
-                    "INSERT OR IGNORE INTO molecule_storage (molecule_uid, storage_name) VALUES(?, ?)", [m.uid, s.name]
-                )
+    def iter_export_rows(self, rt_columns):
+        # Streams (name, iupac, formula, in_libview, mode, *retention_times) rows, retention times are pivoted
+        # into one column per entry of rt_columns by SQLite. The name is the first one known for the molecule.
+        pivot = ", MAX(CASE WHEN rt.column = ? THEN rt.retention_time END)" * len(rt_columns)
+        return self.connection.execute(
+            f"""
+            SELECT n.name, m.iupac, m.formula, m.in_libview, m.mode{pivot}
+            FROM molecules m
+            LEFT JOIN (
+                SELECT molecule_uid, name, MIN(rowid) FROM molecule_names GROUP BY molecule_uid
+            ) n ON n.molecule_uid = m.uid
+            LEFT JOIN molecule_retention_times rt ON rt.molecule_uid = m.uid
+            GROUP BY m.uid
+            ORDER BY m.uid
+            """,
+            rt_columns,
+        )
 
+    @contextlib.contextmanager
+    def _bulk_load(self):
+        # Runs the block in a single explicit transaction with PRAGMAs tuned for large writes.
+        # The journal is kept in memory only for the duration of the load, WAL databases keep their journal.
         self.connection.commit()
-
-    def _add_molecule(self, m: Molecule):
-        if m.uid is not None:
-            logger.error(f"{m.known_names[0]} already exists in database (uid: {m.uid}). Skipping it")
-            return
-
-        self.cursor.execute(
-            "INSERT INTO molecules (iupac, formula, in_libview, mode) VALUES(?, ?, ?, ?)",
-            [m.iupac, m.formula, m.is_on_libview, m.mode],
+        previous_pragmas = {
+            pragma: self.connection.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma, _ in BULK_LOAD_PRAGMAS
+        }
+        for pragma, value in BULK_LOAD_PRAGMAS:
+            self.connection.execute(f"PRAGMA {pragma} = {value}")
+
+        previous_journal_mode = self.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        if previous_journal_mode != "wal":
+            self.connection.execute("PRAGMA journal_mode = MEMORY")
+
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            yield self.connection
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+        finally:
+            if previous_journal_mode != "wal":
+                self.connection.execute(f"PRAGMA journal_mode = {previous_journal_mode}")
+            for pragma, value in previous_pragmas.items():
+                self.connection.execute(f"PRAGMA {pragma} = {value}")
+
+    def _next_molecule_uid(self):
+        # Mirrors AUTOINCREMENT so that uids can be assigned before a bulk insert and never re-used
+        (max_uid,) = self.connection.execute("SELECT COALESCE(MAX(uid), 0) FROM molecules").fetchone()
+        sequence = self.connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'molecules'").fetchone()
+        return max(max_uid, sequence[0] if sequence is not None else 0) + 1
+
+    def _name_owners(self, connection, names):
+        # {name: molecule_uid} of the names already in the database
+        connection.execute('CREATE TEMP TABLE IF NOT EXISTS "written_names" ("name" TEXT PRIMARY KEY)')
+        connection.execute("DELETE FROM temp.written_names")
+        connection.executemany("INSERT OR IGNORE INTO temp.written_names (name) VALUES(?)", ((n,) for n in names))
+        res = connection.execute(
+            "SELECT n.name, n.molecule_uid FROM temp.written_names w JOIN molecule_names n ON n.name = w.name"
         )
-        m.uid = self.cursor.lastrowid
+        return dict(res.fetchall())
 
-        for name in m.known_names:
-            self.cursor.execute("INSERT INTO molecule_names (name, molecule_uid) VALUES(?, ?)", [name, m.uid])
+    @profiler.timed("update_all_molecules")
+    @_serialized_write
+    def update_all_molecules(self, molecules):
+        # New molecules whose names belong to another molecule are skipped and keep a None uid, names are unique.
+        # Names of existing molecules that belong to another one are ignored.
+        molecules = list(molecules)
+        with self._bulk_load() as connection:
+            next_uid = self._next_molecule_uid()
+            owners = self._name_owners(connection, {n for m in molecules for n in m.known_names})
+            molecule_rows = []
+            name_rows = []
+            retention_time_rows = []
+
+            for m in molecules:
+                if m.uid is None:
+                    if not m.known_names:
+                        logger.error(f"Can't add a molecule without name. Skipping it...")
+                        continue
+                    taken = [n for n in m.known_names if n in owners]
+                    if taken:
+                        logger.error(
+                            f"{taken[0]} already belongs to molecule {owners[taken[0]]}. Skipping {m.known_names[0]}..."
+                        )
+                        continue
+                    m.uid = next_uid
+                    next_uid += 1
+                for name in m.known_names:
+                    owners.setdefault(name, m.uid)
+
+                molecule_rows.append((m.uid, m.iupac, m.formula, m.is_on_libview, m.mode))
+                name_rows.extend((name, m.uid) for name in m.known_names)
+                retention_time_rows.extend((m.uid, column, value) for column, value in m.retention_times.items())
+
+            written = connection.executemany(
+                """
+                INSERT INTO molecules (uid, iupac, formula, in_libview, mode) VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(uid) DO UPDATE SET
+                    iupac=COALESCE(excluded.iupac, iupac),
+                    formula=COALESCE(excluded.formula, formula),
+                    in_libview=COALESCE(excluded.in_libview, in_libview),
+                    mode=COALESCE(excluded.mode, mode)
+                """,
+                molecule_rows,
+            ).rowcount
+            written += connection.executemany(
+                "INSERT INTO molecule_names (name, molecule_uid) VALUES(?, ?) ON CONFLICT(name) DO NOTHING",
+                name_rows,
+            ).rowcount
+            written += connection.executemany(
+                """
+                INSERT INTO molecule_retention_times (molecule_uid, column, retention_time) VALUES(?, ?, ?)
+                ON CONFLICT(molecule_uid, column) DO UPDATE SET retention_time=excluded.retention_time
+                """,
+                retention_time_rows,
+            ).rowcount
+            profiler.count("rows written", written)
+            self._refresh_masses(connection, [row[0] for row in molecule_rows if row[2] is not None])
+            logger.debug(
+                f"Wrote {len(molecule_rows)} molecules, {len(name_rows)} names "
+                f"and {len(retention_time_rows)} retention times"
+            )
 
-        for column, value in m.retention_times.items():
-            self.cursor.execute(
-                "INSERT INTO molecule_retention_times (molecule_uid, column, retention_time) VALUES(?, ?, ?)",
-                [m.uid, column, value],
+    @profiler.timed("update_all_storage_units")
+    @_serialized_write
+    def update_all_storage_units(self, storage_units):
+        # Molecules without a uid are looked up by their first name in the database
+        with self._bulk_load() as connection:
+            storage_rows = []
+            for s in storage_units:
+                for m in s.molecules:
+                    if m.uid is not None or m.known_names:
+                        storage_rows.append((s.name, m.uid, m.known_names[0] if m.known_names else None))
+
+            connection.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS "storage_rows" '
+                '("storage_name" TEXT NOT NULL, "uid" INTEGER, "name" TEXT)'
             )
-        return m
-
-    def _update_molecule(self, m: Molecule):
-        if m.uid is None:
-            logger.error(f"{m.known_names[0]} does not exist in database. Skipping it")
-            return
-
-        for name in m.known_names:
-            self.cursor.execute("INSERT OR IGNORE INTO molecule_names (name, molecule_uid) VALUES(?, ?)", [name, m.uid])
-        for column, value in m.retention_times.items():
-            self.cursor.execute(
-                "INSERT OR IGNORE INTO molecule_retention_times (molecule_uid, column, retention_time) VALUES(?, ?, ?)",
-                [m.uid, column, value],
+            connection.execute("DELETE FROM temp.storage_rows")
+            connection.executemany(
+                "INSERT INTO temp.storage_rows (storage_name, uid, name) VALUES(?, ?, ?)", storage_rows
             )
 
-        if m.iupac is not None or m.formula is not None or m.is_on_libview is not None:
-            req = "UPDATE molecules SET "
-            request_args = []
-
-            if m.iupac is not None:
-                req += "iupac=?"
-                request_args.append(m.iupac)
-
-            if m.formula is not None:
-                if m.iupac is not None:
-                    req += ", "
-                req += "formula=?"
-                request_args.append(m.formula)
-
-            if m.is_on_libview is not None:
-                if m.iupac is not None or m.formula is not None:
-                    req += ", "
-                req += "in_libview=?"
-                request_args.append(m.is_on_libview)
-
-            if m.mode is not None:
-                if m.iupac is not None or m.formula is not None or m.is_on_libview is not None:
-                    req += ", "
-                req += "mode=?"
-                request_args.append(m.mode)
-
-            req += " WHERE uid=?"
-            request_args.append(m.uid)
-            self.cursor.execute(req, request_args)
+            unknown = connection.execute(
+                """
+                SELECT r.name FROM temp.storage_rows r
+                WHERE r.uid IS NULL AND NOT EXISTS (SELECT 1 FROM molecule_names n WHERE n.name = r.name)
+                """
+            )
+            for (name,) in unknown:
+                logger.error(f"Can't add an unknow molecule to storage. Skipping {name}...")
+
+            written = connection.executemany(
+                "INSERT OR IGNORE INTO storage_units (name) VALUES(?)", ((s.name,) for s in storage_units)
+            ).rowcount
+            written += connection.execute(
+                """
+                INSERT OR IGNORE INTO molecule_storage (molecule_uid, storage_name)
+                SELECT COALESCE(r.uid, n.molecule_uid), r.storage_name FROM temp.storage_rows r
+                LEFT JOIN molecule_names n ON r.uid IS NULL AND n.name = r.name
+                WHERE COALESCE(r.uid, n.molecule_uid) IS NOT NULL
+                ORDER BY r.rowid
+                """
+            ).rowcount
+            profiler.count("rows written", written)
@@ -0,0 +1,159 @@
+import pathlib
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kemist.core import logger, profiler
+from kemist.database.connection_pool import DEFAULT_BUSY_TIMEOUT
+
+DEFAULT_FETCH_SIZE = 1024
+
+# Lookups run against every attached database, {schema} is replaced by the schema of each database. The first
+# parameter of every SELECT is the name of the database the rows come from.
+NAME_LOOKUP = """
+    SELECT ?, k.key, m.uid, m.iupac, m.formula, m.mode
+    FROM temp.federated_keys k
+    JOIN {schema}.molecule_names n ON n.name = k.key
+    JOIN {schema}.molecules m ON m.uid = n.molecule_uid
+"""
+RT_LOOKUP = """
+    SELECT ?, q.query, m.uid,
+        (SELECT name FROM {schema}.molecule_names WHERE molecule_uid = m.uid ORDER BY rowid LIMIT 1),
+        m.formula, m.mode, rt.retention_time
+    FROM temp.federated_rts q
+    JOIN {schema}.molecule_retention_times rt
+        ON rt.column = ? AND rt.retention_time BETWEEN q.rt - ? AND q.rt + ?
+    JOIN {schema}.molecules m ON m.uid = rt.molecule_uid
+"""
+STORAGE_LOOKUP = """
+    SELECT ?, k.key, s.storage_name
+    FROM temp.federated_keys k
+    JOIN {schema}.molecule_names n ON n.name = k.key
+    JOIN {schema}.molecule_storage s ON s.molecule_uid = n.molecule_uid
+"""
+
+
+def get_attach_limit():
+    connection = sqlite3.connect(":memory:")
+    try:
+        return connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:
+        # Connection.getlimit needs Python 3.11, SQLite defaults to 10 attached databases
+        return 10
+    finally:
+        connection.close()
+
+
+# One in-memory connection with up to the SQLite limit of databases attached read-only as db0, db1...
+class _AttachedGroup(object):
+    def __init__(self, databases, busy_timeout):
+        self.names = [name for name, _ in databases]
+        self.connection = sqlite3.connect(
+            ":memory:", uri=True, timeout=busy_timeout, isolation_level=None, check_same_thread=False
+        )
+        profiler.trace(self.connection)
+        for i, (name, path) in enumerate(databases):
+            logger.debug(f"Attaching {name} ({path})")
+            uri = f"{pathlib.Path(path).absolute().as_uri()}?mode=ro"
+            self.connection.execute(f"ATTACH DATABASE ? AS db{i}", (uri,))
+        self.connection.execute('CREATE TEMP TABLE "federated_keys" ("key" TEXT PRIMARY KEY)')
+        self.connection.execute('CREATE TEMP TABLE "federated_rts" ("query" INTEGER NOT NULL, "rt" REAL NOT NULL)')
+
+    def fill(self, keys, rts):
+        self.connection.execute("DELETE FROM temp.federated_keys")
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO temp.federated_keys (key) VALUES(?)", ((key,) for key in keys)
+        )
+        self.connection.execute("DELETE FROM temp.federated_rts")
+        self.connection.executemany("INSERT INTO temp.federated_rts (query, rt) VALUES(?, ?)", enumerate(rts))
+
+    def execute(self, lookup, parameters):
+        # A single UNION ALL of the lookup over every attached database
+        selects = [lookup.format(schema=f"db{i}") for i in range(len(self.names))]
+        arguments = [argument for name in self.names for argument in [name, *parameters]]
+        return self.connection.execute(" UNION ALL ".join(selects), arguments)
+
+    def close(self):
+        self.connection.close()
+
+
+# Read-only view over several Kemist databases. The databases are attached to as few connections as the SQLite
+# limit of attached databases allows, a lookup is a single query per connection and connections are queried in
+# parallel by a thread pool when there are several. Rows are tagged with the name of their database and streamed in
+# no particular order across databases.
+# Lookups only read the tables of the first schema version, databases are not migrated. A federation runs one lookup
+# at a time.
+class FederatedDatabase(object):
+    def __init__(self, databases, attach_limit=None, busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        # databases is a {name: path} dict or a list of (name, path)
+        databases = list(databases.items()) if isinstance(databases, dict) else list(databases)
+        if not databases:
+            raise RuntimeError("A federation needs at least one database")
+        attach_limit = attach_limit if attach_limit is not None else get_attach_limit()
+        self._groups = [
+            _AttachedGroup(databases[i : i + attach_limit], busy_timeout)
+            for i in range(0, len(databases), attach_limit)
+        ]
+        self._executor = None
+        if len(self._groups) > 1:
+            logger.debug(f"Querying {len(databases)} databases through {len(self._groups)} connections")
+            self._executor = ThreadPoolExecutor(max_workers=len(self._groups), thread_name_prefix="kemist-federation")
+
+    @property
+    def names(self):
+        return [name for group in self._groups for name in group.names]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        for group in self._groups:
+            group.close()
+
+    def _stream(self, lookup, parameters=(), keys=(), rts=()):
+        keys, rts = list(keys), list(rts)
+        if self._executor is None:
+            group = self._groups[0]
+            group.fill(keys, rts)
+            yield from group.execute(lookup, parameters)
+            return
+
+        rows = queue.Queue()
+        stop = threading.Event()
+
+        def run(group):
+            try:
+                group.fill(keys, rts)
+                res = group.execute(lookup, parameters)
+                while not stop.is_set() and (chunk := res.fetchmany(DEFAULT_FETCH_SIZE)):
+                    rows.put(chunk)
+            finally:
+                rows.put(None)
+
+        futures = [self._executor.submit(run, group) for group in self._groups]
+        try:
+            running = len(futures)
+            while running:
+                chunk = rows.get()
+                if chunk is None:
+                    running -= 1
+                else:
+                    yield from chunk
+        finally:
+            stop.set()
+            for future in futures:
+                # Re-raises the errors of the workers
+                future.result()
+
+    def find_names(self, names):
+        # Streams (database, name, uid, iupac, formula, mode) of the molecules known by one of names
+        return self._stream(NAME_LOOKUP, keys=names)
+
+    def search_retention_times(self, column, retention_times, tolerance):
+        # Streams (database, query index, uid, first name, formula, mode, retention time) of the molecules eluting
+        # within tolerance of one of retention_times on column
+        return self._stream(RT_LOOKUP, (column, tolerance, tolerance), rts=retention_times)
+
+    def locate(self, names):
+        # Streams (database, name, storage unit) of the molecules known by one of names
+        return self._stream(STORAGE_LOOKUP, keys=names)
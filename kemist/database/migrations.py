@@ -0,0 +1,289 @@
+import sqlite3
+
+import kemist.core as km
+
+# Each migration is a list of statements upgrading the schema by one version, the current version being
+# stored in PRAGMA user_version. Databases created before migrations existed have user_version 0 and
+# already contain the tables of the first migration, which is why it only creates missing objects.
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS clear_molecules_deps
+        BEFORE DELETE
+        ON molecules
+    BEGIN
+        DELETE FROM molecule_names WHERE molecule_uid=OLD.uid;
+        DELETE FROM molecule_retention_times WHERE molecule_uid=OLD.uid;
+        DELETE FROM molecule_storage WHERE molecule_uid=OLD.uid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clear_storage_units_deps
+        BEFORE DELETE
+        ON storage_units
+    BEGIN
+        DELETE FROM molecule_storage WHERE storage_name=OLD.name;
+    END
+    """,
+]
+
+# Keep the trigram index of NAME_SEARCH in sync with molecule_names, which is its external content
+NAME_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS molecule_names_fts_insert
+        AFTER INSERT
+        ON molecule_names
+    BEGIN
+        INSERT INTO molecule_names_fts (rowid, name) VALUES (NEW.rowid, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS molecule_names_fts_delete
+        AFTER DELETE
+        ON molecule_names
+    BEGIN
+        INSERT INTO molecule_names_fts (molecule_names_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS molecule_names_fts_update
+        AFTER UPDATE
+        ON molecule_names
+    BEGIN
+        INSERT INTO molecule_names_fts (molecule_names_fts, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+        INSERT INTO molecule_names_fts (rowid, name) VALUES (NEW.rowid, NEW.name);
+    END
+    """,
+]
+
+BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS "molecules" (
+        "uid"	INTEGER NOT NULL UNIQUE,
+        "iupac"	TEXT,
+        "formula"	TEXT,
+        "in_libview"	INTEGER,
+        "mode"	TEXT,
+        PRIMARY KEY("uid" AUTOINCREMENT)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS "storage_units" (
+        "name"	TEXT NOT NULL UNIQUE,
+        PRIMARY KEY("name")
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS "molecule_names" (
+        "name"	TEXT NOT NULL,
+        "molecule_uid"	INTEGER NOT NULL,
+        FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+        PRIMARY KEY("name")
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS "molecule_retention_times" (
+        "molecule_uid"	INTEGER NOT NULL,
+        "column"	TEXT NOT NULL,
+        "retention_time"	REAL NOT NULL,
+        FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+        PRIMARY KEY("molecule_uid","column")
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS "molecule_storage" (
+        "molecule_uid"	INTEGER NOT NULL,
+        "storage_name"	TEXT NOT NULL,
+        FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+        FOREIGN KEY("storage_name") REFERENCES "storage_units"("name")
+    )
+    """,
+    *CREATE_TRIGGERS,
+]
+
+SECONDARY_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "molecules_formula" ON "molecules" ("formula")',
+    'CREATE INDEX IF NOT EXISTS "molecules_iupac" ON "molecules" ("iupac")',
+    'CREATE INDEX IF NOT EXISTS "molecule_names_molecule_uid" ON "molecule_names" ("molecule_uid")',
+    """
+    CREATE INDEX IF NOT EXISTS "molecule_retention_times_column_retention_time"
+        ON "molecule_retention_times" ("column", "retention_time")
+    """,
+    # molecule_storage is rebuilt with a UNIQUE constraint, dropping the duplicated rows it may contain.
+    # Triggers referencing it are re-created around the rebuild.
+    'DROP TRIGGER IF EXISTS "clear_molecules_deps"',
+    'DROP TRIGGER IF EXISTS "clear_storage_units_deps"',
+    """
+    CREATE TABLE "molecule_storage_new" (
+        "molecule_uid"	INTEGER NOT NULL,
+        "storage_name"	TEXT NOT NULL,
+        FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+        FOREIGN KEY("storage_name") REFERENCES "storage_units"("name"),
+        UNIQUE("molecule_uid","storage_name")
+    )
+    """,
+    """
+    INSERT INTO "molecule_storage_new" (molecule_uid, storage_name)
+        SELECT DISTINCT molecule_uid, storage_name FROM "molecule_storage" ORDER BY rowid
+    """,
+    'DROP TABLE "molecule_storage"',
+    'ALTER TABLE "molecule_storage_new" RENAME TO "molecule_storage"',
+    'CREATE INDEX IF NOT EXISTS "molecule_storage_storage_name" ON "molecule_storage" ("storage_name")',
+    *CREATE_TRIGGERS,
+]
+
+# Monoisotopic masses derived from molecules.formula. The formula they were computed from is kept to only
+# recompute them when it changes, mass is NULL when the formula could not be parsed.
+MOLECULE_MASSES = [
+    """
+    CREATE TABLE "molecule_masses" (
+        "molecule_uid"	INTEGER NOT NULL,
+        "formula"	TEXT NOT NULL,
+        "mass"	REAL,
+        "charge"	INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+        PRIMARY KEY("molecule_uid")
+    )
+    """,
+    'CREATE INDEX "molecule_masses_mass" ON "molecule_masses" ("mass")',
+    """
+    CREATE TRIGGER "clear_molecule_masses"
+        BEFORE DELETE
+        ON molecules
+    BEGIN
+        DELETE FROM molecule_masses WHERE molecule_uid=OLD.uid;
+    END
+    """,
+]
+
+# Answers given to the questions of interactive matching, keyed by the first names of the two molecules
+# (name < other_name). They are applied instead of asking the same question again.
+MATCH_DECISIONS = [
+    """
+    CREATE TABLE "match_decisions" (
+        "name"	TEXT NOT NULL,
+        "other_name"	TEXT NOT NULL,
+        "same"	INTEGER NOT NULL,
+        PRIMARY KEY("name","other_name")
+    )
+    """,
+]
+
+# Full-text index of the known names split in trigrams, see Database.search_names. Existing names are indexed by the
+# rebuild command. The trigram tokenizer needs SQLite 3.34, older versions skip this migration and the index is
+# created the first time the database is opened by a version supporting it.
+NAME_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE "molecule_names_fts" USING fts5(
+        name, content='molecule_names', content_rowid='rowid', tokenize='trigram'
+    )
+    """,
+    *NAME_SEARCH_TRIGGERS,
+    "INSERT INTO molecule_names_fts (molecule_names_fts) VALUES ('rebuild')",
+]
+
+# Both halves of every known name (see kemist.core.name_index), kept in sync with molecule_names by triggers.
+# Database.find_name_candidates looks up the substrings of a name in it, to find the known names contained in the name.
+NAME_HALVES = [
+    """
+    CREATE TABLE "molecule_name_halves" (
+        "half"	TEXT NOT NULL,
+        "name"	TEXT NOT NULL,
+        PRIMARY KEY("half","name")
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER molecule_name_halves_insert
+        AFTER INSERT
+        ON molecule_names
+    BEGIN
+        INSERT OR IGNORE INTO molecule_name_halves (half, name) VALUES
+            (substr(NEW.name, 1, length(NEW.name) / 2), NEW.name),
+            (substr(NEW.name, length(NEW.name) / 2 + 1), NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER molecule_name_halves_delete
+        AFTER DELETE
+        ON molecule_names
+    BEGIN
+        DELETE FROM molecule_name_halves WHERE name = OLD.name AND half IN (
+            substr(OLD.name, 1, length(OLD.name) / 2), substr(OLD.name, length(OLD.name) / 2 + 1)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER molecule_name_halves_update
+        AFTER UPDATE OF name
+        ON molecule_names
+    BEGIN
+        DELETE FROM molecule_name_halves WHERE name = OLD.name AND half IN (
+            substr(OLD.name, 1, length(OLD.name) / 2), substr(OLD.name, length(OLD.name) / 2 + 1)
+        );
+        INSERT OR IGNORE INTO molecule_name_halves (half, name) VALUES
+            (substr(NEW.name, 1, length(NEW.name) / 2), NEW.name),
+            (substr(NEW.name, length(NEW.name) / 2 + 1), NEW.name);
+    END
+    """,
+    """
+    INSERT OR IGNORE INTO molecule_name_halves (half, name)
+    SELECT substr(name, 1, length(name) / 2), name FROM molecule_names
+    UNION ALL
+    SELECT substr(name, length(name) / 2 + 1), name FROM molecule_names
+    """,
+]
+
+MIGRATIONS = [BASE_SCHEMA, SECONDARY_INDEXES, MOLECULE_MASSES, MATCH_DECISIONS, NAME_SEARCH, NAME_HALVES]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def has_trigram_tokenizer(connection):
+    try:
+        connection.execute("CREATE VIRTUAL TABLE temp.trigram_check USING fts5(name, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    connection.execute("DROP TABLE temp.trigram_check")
+    return True
+
+
+def has_name_search(connection):
+    res = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'molecule_names_fts'")
+    return res.fetchone() is not None
+
+
+def _apply(connection, statements, target_version=None):
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        for statement in statements:
+            connection.execute(statement)
+        if target_version is not None:
+            connection.execute(f"PRAGMA user_version = {target_version}")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+
+def migrate(connection):
+    version = get_schema_version(connection)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than the supported one ({SCHEMA_VERSION})")
+
+    connection.commit()
+    name_search_version = MIGRATIONS.index(NAME_SEARCH) + 1
+    for target_version, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        km.logger.debug(f"Migrating database schema to version {target_version}...")
+        if target_version == name_search_version and not has_trigram_tokenizer(connection):
+            km.logger.warning(
+                f"SQLite {sqlite3.sqlite_version} has no trigram tokenizer (needs 3.34), name search will scan names"
+            )
+            statements = []
+        _apply(connection, statements, target_version)
+
+    if version >= name_search_version and not has_name_search(connection) and has_trigram_tokenizer(connection):
+        km.logger.debug(f"Creating the name search index...")
+        _apply(connection, NAME_SEARCH)
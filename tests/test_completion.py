@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+import urllib.error
+
+import kemist.core as core
+
+KNOWN = {
+    ("water", "iupac_name"): "oxidane",
+    ("oxidane", "formula"): "H2O",
+    ("ethanol", "iupac_name"): ["ethanol", "ethyl alcohol"],
+    ("ethanol", "formula"): "C2H6O",
+}
+
+
+class StubResolver(object):
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, identifier, representation):
+        with self._lock:
+            self.calls.append((identifier, representation))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            should_fail = self.failures > 0
+            self.failures -= 1
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if should_fail:
+            raise urllib.error.URLError("connection reset")
+        return KNOWN.get((identifier, representation))
+
+
+def _molecules():
+    return [
+        core.Molecule(known_names=["water"]),
+        core.Molecule(known_names=["ethanol"]),
+        core.Molecule(known_names=["unknown", "h2o"], formula="H2O"),
+        core.Molecule(iupac="oxidane", known_names=["water"]),
+    ]
+
+
+class CompletionTest(unittest.TestCase):
+    def test_same_results_as_sequential_completion(self):
+        expected = _molecules()
+        for m in expected:
+            m.try_to_complete(StubResolver())
+
+        completed = core.MoleculeCompleter(resolve=StubResolver(), max_workers=4).complete(_molecules())
+        self.assertEqual([(m.iupac, m.formula) for m in completed], [(m.iupac, m.formula) for m in expected])
+        self.assertEqual(completed[0].iupac, "oxidane")
+        self.assertEqual(completed[0].formula, "H2O")
+        self.assertEqual(completed[1].iupac, "ethanol")
+        self.assertIsNone(completed[2].iupac)
+
+    def test_concurrency_limit(self):
+        resolver = StubResolver(delay=0.02)
+        molecules = [core.Molecule(known_names=["water"]) for _ in range(12)]
+        core.MoleculeCompleter(resolve=resolver, max_workers=3).complete(molecules)
+        self.assertEqual(resolver.max_running, 3)
+        self.assertTrue(all(m.formula == "H2O" for m in molecules))
+
+    def test_retries(self):
+        resolver = StubResolver(failures=2)
+        completer = core.MoleculeCompleter(resolve=resolver, max_workers=1, retries=2, backoff=0.001)
+        (water,) = completer.complete([core.Molecule(known_names=["water"])])
+        self.assertEqual(water.formula, "H2O")
+        self.assertEqual(len(resolver.calls), 4)
+
+        resolver = StubResolver(failures=5)
+        completer = core.MoleculeCompleter(resolve=resolver, max_workers=1, retries=1, backoff=0.001)
+        with self.assertLogs("kemist", level="ERROR"):
+            (water,) = completer.complete([core.Molecule(known_names=["water"])])
+        self.assertIsNone(water.iupac)
+        self.assertEqual(len(resolver.calls), 2)
+
+    def test_rate_limit(self):
+        limiter = core.completion.RateLimiter(requests_per_second=100)
+        start = time.monotonic()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
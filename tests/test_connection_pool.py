@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import kemist.core as core
+from kemist.database import Database
+
+
+def _batch(prefix, size):
+    return [core.Molecule(known_names=[f"{prefix} {i}"], retention_times={"RT PFP": i / 10}) for i in range(size)]
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "pooled.db")
+        self.database = Database(self.path, pooled=True)
+        self.database.make_structure()
+
+    def tearDown(self):
+        self.database.close()
+        self.folder.cleanup()
+
+    def test_readers_are_read_only(self):
+        self.assertEqual(self.database.connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        with self.assertRaises(sqlite3.OperationalError):
+            self.database.connection.execute("INSERT INTO storage_units (name) VALUES ('fridge')")
+
+        self.database.update_all_molecules(_batch("water", 3))
+        found = self.database.find_molecules(_batch("water", 1), prefetch=("names",))
+        self.assertEqual([m.known_names for m in found], [["water 0"]])
+
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.database.connection))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], self.database.connection)
+
+    def test_concurrent_reads_and_writes(self):
+        def write(prefix):
+            for batch in range(5):
+                self.database.update_all_molecules(_batch(f"{prefix} {batch}", 50))
+
+        def read(_):
+            counts = []
+            for _ in range(20):
+                molecules = self.database.get_molecules(prefetch=("names", "rts"))
+                self.assertTrue(all(m.known_names and m.retention_times for m in molecules))
+                counts.append(len(molecules))
+            return counts
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            writes = [executor.submit(write, f"writer {i}") for i in range(4)]
+            reads = [executor.submit(read, i) for i in range(4)]
+            for future in writes:
+                future.result()
+            for future in reads:
+                # A reader never sees a partial batch
+                self.assertTrue(all(count % 50 == 0 for count in future.result()))
+
+        molecules = self.database.get_molecules()
+        self.assertEqual(len(molecules), 4 * 5 * 50)
+        self.assertEqual(len({m.uid for m in molecules}), len(molecules))
+
+    def test_several_pools(self):
+        def write(database, prefix):
+            for batch in range(5):
+                database.update_all_molecules(_batch(f"{prefix} {batch}", 100))
+
+        other = Database(self.path, pooled=True, busy_timeout=10)
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(write, self.database, "first"), executor.submit(write, other, "second")]
+                for future in futures:
+                    future.result()
+            self.assertEqual(len(other.get_molecules()), 1000)
+        finally:
+            other.close()
+
+    def test_memory_database(self):
+        with self.assertRaises(RuntimeError):
+            Database(":memory:", pooled=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import io
+import unittest
+
+import kemist.apps.csv_loader as loader
+
+MOLECULES = """Name ;IUPAC name;Formula ;MSMS library view;Mode;RT PFP;RT Scherzo
+Biotin ; ;C10H16N2O3S;no ;neg ;3.7 ;2.3
+Choline ; ;C5H14NO ;yes ;both;2.8 ;
+
+Creatinine ; ;C4H7N3O ;yes ;both;abc ;6.7
+Adenine
+Water ;oxidane ;H2O ;no ;pos ;1.0 ;1.5
+"""
+
+STORAGE = """Name;Storage
+Biotin ;Fridge
+Choline;Shelf
+Water ;Fridge
+"""
+
+
+class CsvLoaderTest(unittest.TestCase):
+    def test_load_molecules(self):
+        with self.assertLogs("kemist", level="ERROR") as logs:
+            molecules = loader.load_molecules(io.StringIO(MOLECULES))
+
+        self.assertEqual([m.known_names for m in molecules], [["biotin"], ["choline"], ["water"]])
+        self.assertEqual(molecules[0].formula, "C10H16N2O3S")
+        self.assertIsNone(molecules[0].iupac)
+        self.assertFalse(molecules[0].is_on_libview)
+        self.assertEqual(molecules[0].retention_times, {"RT PFP": 3.7, "RT Scherzo": 2.3})
+        self.assertTrue(molecules[1].is_on_libview)
+        self.assertEqual(molecules[1].retention_times, {"RT PFP": 2.8})
+        self.assertEqual(molecules[2].iupac, "oxidane")
+        self.assertEqual(molecules[2].mode, "pos")
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("Line 5", logs.output[0])
+        self.assertIn("Line 6", logs.output[1])
+
+    def test_batches(self):
+        batches = list(loader.iter_molecule_batches(io.StringIO(MOLECULES), 2))
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+
+        storage_batches = list(loader.iter_storage_batches(io.StringIO(STORAGE), 2))
+        self.assertEqual(
+            [[(su.name, [m.known_names[0] for m in su.molecules]) for su in batch] for batch in storage_batches],
+            [[("fridge", ["biotin"]), ("shelf", ["choline"])], [("fridge", ["water"])]],
+        )
+
+    def test_load_storage_areas(self):
+        storage_units = loader.load_storage_areas(io.StringIO(STORAGE))
+        self.assertEqual([su.name for su in storage_units], ["fridge", "shelf"])
+        self.assertEqual([m.known_names[0] for m in storage_units[0].molecules], ["biotin", "water"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,234 @@
+import pickle
+import random
+import unittest
+
+import kemist.core as core
+from kemist.database import Database
+
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.database = Database(":memory:")
+        self.database.make_structure()
+
+    def test_molecules_round_trip(self):
+        water = core.Molecule(formula="H2O", mode="both", known_names=["water", "dihydrogen oxide"])
+        water.retention_times = {"RT PFP": 1.5, "RT Scherzo": 2.5}
+        ethanol = core.Molecule(iupac="ethanol", is_on_libview=True, known_names=["ethanol"])
+        self.database.update_all_molecules([water, ethanol])
+        self.assertIsNotNone(water.uid)
+        self.assertIsNotNone(ethanol.uid)
+
+        molecules = {m.uid: m for m in self.database.get_molecules()}
+        self.assertEqual(len(molecules), 2)
+        self.assertEqual(molecules[water.uid].known_names, ["water", "dihydrogen oxide"])
+        self.assertEqual(molecules[water.uid].formula, "H2O")
+        self.assertEqual(molecules[water.uid].mode, "both")
+        self.assertEqual(molecules[water.uid].retention_times, {"RT PFP": 1.5, "RT Scherzo": 2.5})
+        self.assertEqual(molecules[ethanol.uid].known_names, ["ethanol"])
+        self.assertEqual(molecules[ethanol.uid].iupac, "ethanol")
+        self.assertEqual(molecules[ethanol.uid].retention_times, {})
+        self.assertEqual(sorted(self.database.get_known_retention_times()), ["RT PFP", "RT Scherzo"])
+
+    def test_update_existing_molecules(self):
+        water = core.Molecule(formula="H2O", known_names=["water"], retention_times={"RT PFP": 1.5})
+        self.database.update_all_molecules([water])
+
+        update = core.Molecule(uid=water.uid, mode="both", known_names=["water", "oxidane"])
+        update.retention_times = {"RT PFP": 1.7, "RT Scherzo": 2.5}
+        ethanol = core.Molecule(known_names=["ethanol"])
+        self.database.update_all_molecules([update, ethanol])
+        self.assertGreater(ethanol.uid, water.uid)
+
+        molecules = {m.uid: m for m in self.database.get_molecules()}
+        self.assertEqual(molecules[water.uid].formula, "H2O")
+        self.assertEqual(molecules[water.uid].mode, "both")
+        self.assertEqual(molecules[water.uid].known_names, ["water", "oxidane"])
+        self.assertEqual(molecules[water.uid].retention_times, {"RT PFP": 1.7, "RT Scherzo": 2.5})
+
+    def test_names_of_other_molecules(self):
+        water = core.Molecule(formula="H2O", known_names=["water"])
+        self.database.update_all_molecules([water])
+
+        # A new molecule is skipped rather than written without its names
+        peroxide = core.Molecule(formula="H2O2", known_names=["water", "hydrogen peroxide"])
+        ethanol = core.Molecule(known_names=["ethanol"])
+        duplicate = core.Molecule(known_names=["ethanol"])
+        update = core.Molecule(uid=water.uid, known_names=["water", "ethanol", "oxidane"])
+        with self.assertLogs("kemist", "ERROR"):
+            self.database.update_all_molecules([peroxide, ethanol, duplicate, update, core.Molecule()])
+        self.assertIsNone(peroxide.uid)
+        self.assertIsNone(duplicate.uid)
+
+        molecules = {m.uid: m for m in self.database.get_molecules()}
+        self.assertEqual(sorted(molecules), [water.uid, ethanol.uid])
+        self.assertEqual(molecules[water.uid].known_names, ["water", "oxidane"])
+        self.assertEqual(molecules[ethanol.uid].known_names, ["ethanol"])
+
+    def test_export_rows(self):
+        water = core.Molecule(formula="H2O", is_on_libview=True, known_names=["water", "oxidane"])
+        water.retention_times = {"RT PFP": 1.5, "RT Scherzo": 2.5}
+        ethanol = core.Molecule(iupac="ethanol", mode="pos", known_names=["ethanol"])
+        ethanol.retention_times = {"RT Scherzo": 3.5}
+        self.database.update_all_molecules([water, ethanol])
+
+        self.assertEqual(
+            list(self.database.iter_export_rows(["RT Scherzo", "RT PFP"])),
+            [("water", None, "H2O", 1, None, 2.5, 1.5), ("ethanol", "ethanol", None, None, "pos", 3.5, None)],
+        )
+        self.assertEqual(
+            list(self.database.iter_export_rows([])),
+            [("water", None, "H2O", 1, None), ("ethanol", "ethanol", None, None, "pos")],
+        )
+
+    def test_empty_database(self):
+        self.assertEqual(self.database.get_molecules(), [])
+
+    def test_lazy_relations(self):
+        molecules = [
+            core.Molecule(formula=f"C{i}H{2 * i}", known_names=[f"name {i}", f"synonym {i}"], retention_times={})
+            for i in range(1, 6)
+        ]
+        for i, m in enumerate(molecules):
+            if i % 2:
+                m.retention_times = {"RT PFP": float(i)}
+        self.database.update_all_molecules(molecules)
+
+        statements = []
+        self.database.connection.set_trace_callback(statements.append)
+        loaded = self.database.get_molecules()
+        self.assertEqual(len(statements), 1)
+
+        loaded[1].known_names = ["renamed"]
+        self.assertEqual(loaded[0].known_names, ["name 1", "synonym 1"])
+        self.assertEqual([m.known_names for m in loaded[2:]], [m.known_names for m in molecules[2:]])
+        self.assertEqual(loaded[1].known_names, ["renamed"])
+        selects = [s for s in statements if s.lstrip().startswith("SELECT")]
+        self.assertEqual(len(selects), 2)
+
+        self.assertEqual([m.retention_times for m in loaded], [m.retention_times for m in molecules])
+        selects = [s for s in statements if s.lstrip().startswith("SELECT")]
+        self.assertEqual(len(selects), 3)
+
+        statements.clear()
+        loaded = self.database.get_molecules(prefetch=("names", "rts"))
+        self.assertEqual(len(statements), 3)
+        self.assertEqual([m.known_names for m in loaded], [m.known_names for m in molecules])
+        self.assertEqual([m.retention_times for m in loaded], [m.retention_times for m in molecules])
+        self.assertEqual(len(statements), 3)
+
+        # Pickling loads deferred relations
+        loaded = pickle.loads(pickle.dumps(self.database.get_molecules()))
+        self.assertEqual([m.known_names for m in loaded], [m.known_names for m in molecules])
+
+    def test_storage_units(self):
+        water = core.Molecule(formula="H2O", known_names=["water", "oxidane"])
+        ethanol = core.Molecule(known_names=["ethanol"])
+        self.database.update_all_molecules([water, ethanol, core.Molecule(known_names=["biotin"])])
+
+        # Molecules are found by uid or by their first name, unknown names are skipped
+        self.database.update_all_storage_units(
+            [
+                core.StorageUnit("fridge", [core.Molecule(known_names=["oxidane"]), core.Molecule(uid=ethanol.uid)]),
+                core.StorageUnit("shelf", [core.Molecule(known_names=["water"]), core.Molecule(known_names=["nope"])]),
+                core.StorageUnit("fridge", [core.Molecule(known_names=["ethanol"])]),
+            ]
+        )
+
+        statements = []
+        self.database.connection.set_trace_callback(statements.append)
+        storage_units = self.database.get_storage_units(prefetch=("names",))
+        self.assertEqual(len(statements), 4)
+        self.assertEqual(
+            [(su.name, [m.known_names[0] for m in su.molecules]) for su in storage_units],
+            [("fridge", ["water", "ethanol"]), ("shelf", ["water"])],
+        )
+        self.assertEqual(
+            self.database.locate(["oxidane", "ethanol", "biotin", "nope"]),
+            {"oxidane": ["fridge", "shelf"], "ethanol": ["fridge"], "biotin": [], "nope": []},
+        )
+
+    def test_search_names(self):
+        water = core.Molecule(formula="H2O", known_names=["water", "oxidane"])
+        glucose = core.Molecule(known_names=["d-glucose", "glucose 6-phosphate"])
+        self.database.update_all_molecules([water, glucose, core.Molecule(known_names=["glucosamine"])])
+
+        self.assertEqual(self.database.search_names("water"), [("water", water.uid, 1.0)])
+        # Substrings first, then names with one edit
+        self.assertEqual(
+            [name for name, _, _ in self.database.search_names("glucose")],
+            ["d-glucose", "glucose 6-phosphate", "glucosamine"],
+        )
+        matches = self.database.search_names("glucse 6")
+        self.assertEqual([(name, uid) for name, uid, _ in matches], [("glucose 6-phosphate", glucose.uid)])
+        self.assertEqual([name for name, _, _ in self.database.search_names("Gluc", 2)], ["d-glucose", "glucosamine"])
+        self.assertEqual([name for name, _, _ in self.database.search_names("ox")], ["oxidane"])
+        self.assertEqual(self.database.search_names("nothing"), [])
+
+        # Names are compared as stored
+        nadh, biotin = core.Molecule(known_names=["NADH"]), core.Molecule(known_names=["Biotin"])
+        self.database.update_all_molecules([nadh, biotin, core.Molecule(known_names=["biotin-x"])])
+        self.assertEqual(self.database.search_names("NADH"), [("NADH", nadh.uid, 1.0)])
+        self.assertEqual(self.database.search_names("Biotin")[0], ("Biotin", biotin.uid, 1.0))
+
+        # The best matches are kept however many names contain the query
+        derivatives = [core.Molecule(known_names=[f"citric acid derivative {i}"]) for i in range(3000)]
+        acid = core.Molecule(known_names=["acid"])
+        self.database.update_all_molecules(derivatives + [acid])
+        self.assertEqual(self.database.search_names("acid", 1), [("acid", acid.uid, 1.0)])
+        self.assertEqual(self.database.search_names("aci", 1)[0][0], "acid")
+
+        # The index follows the names table
+        self.database.connection.execute("DELETE FROM molecules WHERE uid = ?", (water.uid,))
+        self.assertEqual(self.database.search_names("water"), [])
+        self.database.connection.execute("UPDATE molecule_names SET name = 'dextrose' WHERE name = 'd-glucose'")
+        self.assertEqual([name for name, _, _ in self.database.search_names("dextrose")], ["dextrose"])
+
+    def _find_close_names(self, names):
+        candidates = self.database.find_name_candidates(names)
+        return {
+            name: {known: uid for known, uid in known_names.items() if core.molecule._are_name_close(name, known)}
+            for name, known_names in candidates.items()
+        }
+
+    def test_find_name_candidates(self):
+        water = core.Molecule(known_names=["water", "oxidane"])
+        glucose = core.Molecule(known_names=["d-glucose", "glucose 6-phosphate", "ose"])
+        self.database.update_all_molecules([water, glucose])
+        # Names containing the name or contained in it, with one edit
+        names = ["glucose", "wter", "oxidanes", "dose", "nothing"]
+        expected = {
+            "glucose": {"d-glucose": glucose.uid, "glucose 6-phosphate": glucose.uid, "ose": glucose.uid},
+            "wter": {"water": water.uid},
+            "oxidanes": {"oxidane": water.uid},
+            "dose": {"d-glucose": glucose.uid, "glucose 6-phosphate": glucose.uid, "ose": glucose.uid},
+            "nothing": {},
+        }
+        self.assertEqual(self._find_close_names(names), expected)
+
+        # Same names without the trigram index
+        self.database._name_search = False
+        self.assertEqual(self._find_close_names(names), expected)
+        self.database._name_search = None
+
+        # The halves follow the names table
+        self.database.connection.execute("UPDATE molecule_names SET name = 'dextrose' WHERE name = 'd-glucose'")
+        self.database.connection.execute("DELETE FROM molecules WHERE uid = ?", (water.uid,))
+        self.assertEqual(
+            self._find_close_names(["dextros", "wter"]),
+            {"dextros": {"dextrose": glucose.uid, "ose": glucose.uid}, "wter": {}},
+        )
+
+        # No close name is missed
+        rng = random.Random(3)
+        known_names = {"".join(rng.choice("abc d") for _ in range(rng.randint(1, 12))) for _ in range(300)}
+        self.database.update_all_molecules([core.Molecule(known_names=[name]) for name in known_names])
+        index = core.NameIndex(name for m in self.database.get_molecules() for name in m.known_names)
+        names = ["".join(rng.choice("abc d") for _ in range(rng.randint(1, 14))) for _ in range(100)]
+        close_names = self._find_close_names(names)
+        for name in names:
+            self.assertEqual(set(close_names[name]), index.close_names(name), msg=name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import kemist.core as core
+from kemist.database import Database, FederatedDatabase
+
+
+def _fill(path, index):
+    database = Database(path)
+    database.make_structure()
+    water = core.Molecule(formula="H2O", known_names=["water", "oxidane"], retention_times={"RT PFP": 1.0 + index})
+    ethanol = core.Molecule(known_names=[f"ethanol {index}"], retention_times={"RT PFP": 2.0})
+    database.update_all_molecules([water, ethanol])
+    database.update_all_storage_units([core.StorageUnit(f"fridge {index}", [core.Molecule(known_names=["water"])])])
+    database.close()
+
+
+class FederatedDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.databases = []
+        for i in range(5):
+            path = os.path.join(self.folder.name, f"library {i}")
+            _fill(path, i)
+            self.databases.append((f"library {i}", path))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _lookups(self, attach_limit):
+        federation = FederatedDatabase(self.databases, attach_limit)
+        self.assertEqual(federation.names, [name for name, _ in self.databases])
+        results = (
+            sorted(federation.find_names(["oxidane", "ethanol 3", "nope"])),
+            sorted(federation.search_retention_times("RT PFP", [2.0, 9.0], 0.5)),
+            sorted(federation.locate(["oxidane", "ethanol 1"])),
+        )
+        federation.close()
+        return results
+
+    def test_lookups(self):
+        names, rts, locations = self._lookups(None)
+        self.assertEqual(
+            names,
+            [
+                ("library 0", "oxidane", 1, None, "H2O", None),
+                ("library 1", "oxidane", 1, None, "H2O", None),
+                ("library 2", "oxidane", 1, None, "H2O", None),
+                ("library 3", "ethanol 3", 2, None, None, None),
+                ("library 3", "oxidane", 1, None, "H2O", None),
+                ("library 4", "oxidane", 1, None, "H2O", None),
+            ],
+        )
+        self.assertEqual(
+            rts,
+            [
+                ("library 0", 0, 2, "ethanol 0", None, None, 2.0),
+                ("library 1", 0, 1, "water", "H2O", None, 2.0),
+                ("library 1", 0, 2, "ethanol 1", None, None, 2.0),
+                ("library 2", 0, 2, "ethanol 2", None, None, 2.0),
+                ("library 3", 0, 2, "ethanol 3", None, None, 2.0),
+                ("library 4", 0, 2, "ethanol 4", None, None, 2.0),
+            ],
+        )
+        self.assertEqual(locations, [(f"library {i}", "oxidane", f"fridge {i}") for i in range(5)])
+
+    def test_more_databases_than_attached(self):
+        # Databases are spread over 3 connections queried in parallel
+        self.assertEqual(self._lookups(2), self._lookups(None))
+
+    def test_stop_streaming(self):
+        federation = FederatedDatabase(self.databases, 1)
+        rows = federation.locate(["water"])
+        self.assertEqual(len(next(rows)), 3)
+        rows.close()
+        self.assertEqual(len(list(federation.locate(["water"]))), 5)
+        federation.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import kemist.apps as kapps
+import kemist.core as core
+from kemist.database import Database
+
+PREFIXES = ["", "", "l-", "d-"]
+SUFFIXES = ["", "", " 2", "-d", "s"]
+NAMES = ["water", "waer", "ethanol", "methanol", "glucose", "glucos", "biotin", "choline", "adenine", "adenosine"]
+
+
+def _random_batches(rng, batch_count, batch_size):
+    return [
+        [
+            core.Molecule(
+                formula=rng.choice([None, None, None, "H2O", "C2H6O", "C6H12O6"]),
+                iupac=rng.choice([None, None, None, "oxidane"]),
+                known_names=[rng.choice(PREFIXES) + rng.choice(NAMES) + rng.choice(SUFFIXES)],
+                retention_times={"RT PFP": round(rng.uniform(1, 10), 1)},
+            )
+            for _ in range(batch_size)
+        ]
+        for _ in range(batch_count)
+    ]
+
+
+def _scenario():
+    rng = random.Random(5)
+    return _random_batches(rng, 3, 10), _random_batches(rng, 3, 10)
+
+
+def _content(database):
+    return sorted(
+        (m.uid, m.iupac, m.formula, m.known_names, sorted(m.retention_times.items()))
+        for m in database.get_molecules()
+    )
+
+
+def _merge_with_full_reload(database, batches):
+    # Reference merge, against every molecule of the database
+    for new_molecules in batches:
+        existing_molecules = core.MoleculeIndex(database.get_molecules())
+        updated = kapps.KemistDb._merge_in_existing_molecule_list(new_molecules, existing_molecules)
+        database.update_all_molecules(updated)
+
+
+class KemistDbTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.environment = mock.patch.dict(os.environ, {"HOME": self.home.name})
+        self.environment.start()
+        self.kemist_db = kapps.KemistDb()
+
+    def tearDown(self):
+        self.environment.stop()
+        self.home.cleanup()
+
+    def _create(self, name, batches, jobs=1):
+        self.kemist_db.create(name, batches, [], None, False, jobs)
+        return Database(self.kemist_db.config.get_database_path(name))
+
+    def test_incremental_update_matches_full_reload(self):
+        for confirm in [kapps.strict_confirm, kapps.relaxed_confirm]:
+            with mock.patch.object(kapps, "confirm", confirm):
+                initial, update = _scenario()
+                incremental = self._create(f"incremental_{confirm.__name__}", initial)
+                self.kemist_db.update(f"incremental_{confirm.__name__}", update, [], None)
+
+                initial, update = _scenario()
+                full = self._create(f"full_{confirm.__name__}", initial)
+                existing_molecules = core.MoleculeIndex(full.get_molecules())
+                for new_molecules in update:
+                    updated = kapps.KemistDb._merge_in_existing_molecule_list(new_molecules, existing_molecules)
+                    full.update_all_molecules(updated)
+
+                self.assertEqual(_content(incremental), _content(full))
+
+    def test_create_matches_full_reload(self):
+        # Batches are only merged with the molecules of the database they may match
+        for confirm in [kapps.strict_confirm, kapps.relaxed_confirm]:
+            with mock.patch.object(kapps, "confirm", confirm):
+                initial, update = _scenario()
+                batches = self._create(f"batches_{confirm.__name__}", initial + update)
+
+                initial, update = _scenario()
+                full = self._create(f"reload_{confirm.__name__}", [])
+                _merge_with_full_reload(full, initial + update)
+                self.assertEqual(_content(batches), _content(full))
+
+    def test_parallel_matching(self):
+        def interactive_confirm(prompt):
+            prompts.append(prompt)
+            return len(prompts) % 3 != 0
+
+        def review(ranked_questions):
+            return {core.name_pair(n, o): interactive_confirm(f"{n} {o}") for n, o, _ in ranked_questions}
+
+        for confirm in [kapps.relaxed_confirm, interactive_confirm]:
+            contents = []
+            for jobs in [1, 2]:
+                prompts = []
+                with mock.patch.object(kapps, "confirm", confirm), mock.patch.object(kapps, "review", review):
+                    initial, update = _scenario()
+                    name = f"{confirm.__name__}_{jobs}"
+                    database = self._create(name, initial, jobs)
+                    self.kemist_db.update(name, update, [], None, jobs)
+                contents.append((_content(database), prompts))
+            self.assertEqual(contents[0], contents[1])
+        self.assertGreater(len(prompts), 3)
+
+    def test_stored_decisions(self):
+        def review(ranked_questions):
+            reviewed.append([(n, o) for n, o, _ in ranked_questions])
+            return {core.name_pair(n, o): n != "glucos" and o != "glucos" for n, o, _ in ranked_questions}
+
+        def interactive_confirm(prompt):
+            prompts.append(prompt)
+            return False
+
+        initial = [[core.Molecule(known_names=["water"]), core.Molecule(known_names=["glucose"])]]
+        update = [[core.Molecule(known_names=["waer"]), core.Molecule(known_names=["glucos"])]]
+        reviewed, prompts = [], []
+        with mock.patch.object(kapps, "confirm", interactive_confirm), mock.patch.object(kapps, "review", review):
+            database = self._create("decisions", initial)
+            self.kemist_db.update("decisions", update, [], None)
+            # The whole batch is reviewed at once and nothing is asked again afterwards
+            self.assertEqual(reviewed, [[("glucos", "glucose"), ("waer", "water")]])
+            self.assertEqual(prompts, [])
+            self.assertEqual(database.get_match_decisions(), {("glucos", "glucose"): False, ("waer", "water"): True})
+
+        self.assertEqual(
+            sorted(m.known_names for m in database.get_molecules()), [["glucos"], ["glucose"], ["water", "waer"]]
+        )
+
+    def test_review_copies_only_the_batch(self):
+        rng = random.Random(1)
+        names = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(12)) for _ in range(200)]
+        misspelled = "x" + names[0][1:]
+
+        def batches():
+            yield [core.Molecule(known_names=[name]) for name in names]
+            copy.reset_mock()
+            yield [core.Molecule(known_names=[misspelled])]
+
+        def review(ranked_questions):
+            reviewed.extend((n, o) for n, o, _ in ranked_questions)
+            return {core.name_pair(n, o): True for n, o, _ in ranked_questions}
+
+        reviewed = []
+        with mock.patch.object(kapps, "confirm", kapps.interactive_confirm), mock.patch.object(kapps, "review", review):
+            with mock.patch.object(core.Molecule, "copy", autospec=True, side_effect=core.Molecule.copy) as copy:
+                self._create("review", batches())
+        # The dry run of the second batch copies its molecule and its candidate, not the whole library
+        self.assertEqual(copy.call_count, 2)
+        self.assertEqual(reviewed, [(misspelled, names[0])])
+
+    def test_pending_questions(self):
+        self._create("pending", [[core.Molecule(known_names=["water"]), core.Molecule(known_names=["glucose"])]])
+        update = [[core.Molecule(known_names=["waer"]), core.Molecule(known_names=["glucos"])]]
+        pending = os.path.join(self.home.name, "pending.csv")
+        with mock.patch.object(kapps, "confirm", kapps.interactive_confirm):
+            self.kemist_db.update("pending", update, [], None, pending=pending)
+            with open(pending) as file:
+                rows = [line.split(";") for line in file.read().splitlines()]
+            self.assertEqual(rows[0], kapps.MATCH_DECISION_HEADERS)
+            self.assertEqual(
+                sorted((row[0], row[1], row[3]) for row in rows[1:]), [("glucos", "glucose", ""), ("waer", "water", "")]
+            )
+            database = Database(self.kemist_db.config.get_database_path("pending"))
+            self.assertEqual(len(database.get_molecules()), 2)
+
+            with open(pending, "w") as file:
+                file.write("Name;Other name;Similarity;Same\nwaer;water;0.89;yes\nglucos;glucose;0.92;No\n")
+            with open(pending) as file, mock.patch.object(kapps, "review") as review:
+                self.kemist_db.update("pending", update, [], None, decisions_file=file)
+            review.assert_not_called()
+        self.assertEqual(
+            sorted(m.known_names for m in database.get_molecules()), [["glucos"], ["glucose"], ["water", "waer"]]
+        )
+
+    def test_close_names_pruned_by_retention_time(self):
+        database = Database(":memory:")
+        database.make_structure()
+        water = core.Molecule(known_names=["water"], retention_times={"RT PFP": 1.0})
+        watre = core.Molecule(known_names=["watre"], retention_times={"RT PFP": 5.0})
+        database.update_all_molecules([water, watre])
+        batch = [
+            core.Molecule(known_names=["waer"], retention_times={"RT PFP": 1.1}),
+            core.Molecule(known_names=["wter"], retention_times={"RT PFP": 9.0}),
+        ]
+
+        finder = core.CloseNameFinder(1)
+        with mock.patch.object(finder, "verify", wraps=finder.verify) as verify:
+            close_names, relaxed_uids = kapps.KemistDb._batch_close_names(database, batch, finder, 0.5)
+        # Candidates rejected by retention time are never compared
+        self.assertEqual(verify.call_args.args[0], {"waer": {"water": water.uid}, "wter": {}})
+        self.assertEqual(close_names, {"waer": {"waer", "water"}, "wter": {"wter"}})
+        self.assertEqual(relaxed_uids, {water.uid})
+
+        close_names, relaxed_uids = kapps.KemistDb._batch_close_names(database, batch, finder)
+        self.assertEqual(close_names["waer"], {"waer", "wter", "water", "watre"})
+        self.assertEqual(relaxed_uids, {water.uid, watre.uid})
+
+    def test_interactive_review(self):
+        questions = [("water", "waer", 0.9), ("glucose", "glucos", 0.9), ("biotin", "biotine", 0.9), ("a", "b", 0.0)]
+        # y and n in any case, A and R only in upper case
+        with mock.patch("builtins.input", side_effect=["Y", " n ", "a", "R"]) as ask:
+            decisions = kapps.interactive_review(questions)
+        self.assertEqual(ask.call_count, 4)
+        self.assertEqual(
+            decisions,
+            {
+                core.name_pair("water", "waer"): True,
+                core.name_pair("glucose", "glucos"): False,
+                core.name_pair("biotin", "biotine"): False,
+                core.name_pair("a", "b"): False,
+            },
+        )
+
+    def test_storage_update(self):
+        database = self._create("storage", [[core.Molecule(formula="H2O", known_names=["water"])]])
+        storage = [core.StorageUnit("fridge", [core.Molecule(known_names=["water"])])]
+        self.kemist_db.update("storage", [], [storage], None)
+        self.assertEqual(
+            database.connection.execute("SELECT molecule_uid, storage_name FROM molecule_storage").fetchall(),
+            [(1, "fridge")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["cirpy", "fuzzysearch", "numpy", "sqlite3", "argformat"]
+
+RUNNER = """
+import json, sys
+sys.argv = sys.argv[1:]
+from kemist.apps.entry_points import kemist_db
+kemist_db()
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class LazyImportsTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.environment = dict(os.environ, HOME=self.home.name, PYTHONPATH=REPOSITORY)
+        self.environment.pop("XDG_DATA_HOME", None)
+        self.environment.pop("XDG_CONFIG_HOME", None)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def _imported_modules(self, *arguments):
+        process = subprocess.run(
+            [sys.executable, "-c", RUNNER, "kemist-db", *arguments],
+            env=self.environment,
+            cwd=REPOSITORY,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return set(json.loads(process.stdout.splitlines()[-1]))
+
+    def test_config_commands(self):
+        modules = self._imported_modules("list")
+        self.assertEqual([m for m in HEAVY_MODULES if m in modules], [])
+
+    def test_strict_update(self):
+        molecules = os.path.join(REPOSITORY, "data", "db1.csv")
+        self._imported_modules("create", "db", "-m", molecules, "--make-default")
+        modules = self._imported_modules("update", "-m", molecules)
+        self.assertEqual([m for m in ["cirpy", "fuzzysearch", "numpy", "argformat"] if m in modules], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import random
+import unittest
+
+import kemist.core as core
+from kemist.database import Database
+
+WATER = 18.0105646863
+
+
+class FormulaTest(unittest.TestCase):
+    def test_parse_formula(self):
+        self.assertEqual(core.parse_formula("C10H16N2O3S"), ({"C": 10, "H": 16, "N": 2, "O": 3, "S": 1}, 0))
+        self.assertEqual(core.parse_formula("C5H14NO+"), ({"C": 5, "H": 14, "N": 1, "O": 1}, 1))
+        self.assertEqual(core.parse_formula("(CH3)3N"), ({"C": 3, "H": 9, "N": 1}, 0))
+        self.assertEqual(core.parse_formula("Ca[OH]2"), ({"Ca": 1, "O": 2, "H": 2}, 0))
+        self.assertEqual(core.parse_formula("CuSO4·5H2O"), ({"Cu": 1, "S": 1, "O": 9, "H": 10}, 0))
+        self.assertEqual(core.parse_formula("SO4-2"), ({"S": 1, "O": 4}, -2))
+
+        for formula in ["", "2H2O", "H2O)", "(H2O", "Xx2", "h2o", "C6H12O6?"]:
+            with self.assertRaises(ValueError):
+                core.parse_formula(formula)
+
+    def test_masses(self):
+        self.assertAlmostEqual(core.monoisotopic_mass("H2O"), WATER, places=6)
+        self.assertAlmostEqual(core.monoisotopic_mass("C6H12O6"), 180.0633881, places=6)
+        self.assertAlmostEqual(core.monoisotopic_mass("C5H14NO+"), 104.1070, places=4)
+
+    def test_adducts(self):
+        self.assertEqual([a for a, _ in core.adduct_mzs(WATER, "pos")], ["[M+H]+"])
+        self.assertAlmostEqual(core.adduct_mzs(WATER, "pos")[0][1], 19.0178, places=4)
+        self.assertAlmostEqual(core.adduct_mzs(WATER, "neg")[0][1], 17.0033, places=4)
+        self.assertEqual([a for a, _ in core.adduct_mzs(WATER, "both")], ["[M+H]+", "[M-H]-"])
+        self.assertEqual([a for a, _ in core.adduct_mzs(WATER, "")], ["[M+H]+", "[M-H]-"])
+        self.assertEqual(core.adduct_mzs(104.107, "both", 1), [("[M]+", 104.107)])
+
+
+class MassIndexTest(unittest.TestCase):
+    def test_search_many(self):
+        rng = random.Random(3)
+        rows = [(uid, rng.uniform(50, 800), rng.choice(["pos", "neg", "both", None]), 0) for uid in range(1000)]
+        rows.append((1000, None, "pos", 0))
+        index = core.MassIndex(rows)
+        self.assertEqual(len(index), sum(2 if mode in ["both", None] else 1 for _, _, mode, _ in rows[:-1]))
+
+        adducts = [
+            (mz, uid, adduct) for uid, mass, mode, _ in rows[:-1] for adduct, mz in core.adduct_mzs(mass, mode)
+        ]
+        queries = [rng.choice(adducts)[0] * (1 + rng.uniform(-8, 8) * 1e-6) for _ in range(50)] + [10.0]
+        indices, uids, found_adducts, mzs = index.search_many(queries, 5)
+        self.assertEqual(indices.tolist(), sorted(indices.tolist()))
+        for i, query in enumerate(queries):
+            found = sorted(
+                (mz, uid, adduct)
+                for q, uid, adduct, mz in zip(indices.tolist(), uids.tolist(), found_adducts.tolist(), mzs.tolist())
+                if q == i
+            )
+            tolerance = query * 5e-6
+            self.assertEqual(found, sorted(a for a in adducts if query - tolerance <= a[0] <= query + tolerance))
+
+
+class DatabaseMassesTest(unittest.TestCase):
+    def setUp(self):
+        self.database = Database(":memory:")
+        self.database.make_structure()
+
+    def _masses(self):
+        return {uid: (mass, charge) for uid, mass, _, charge in self.database.iter_masses()}
+
+    def test_masses_follow_formulas(self):
+        water = core.Molecule(formula="H2O", mode="both", known_names=["water"])
+        ethanol = core.Molecule(known_names=["ethanol"])
+        unknown = core.Molecule(formula="C6H6Qz", known_names=["mystery"])
+        self.database.update_all_molecules([water, ethanol, unknown])
+        self.assertEqual(list(self._masses()), [water.uid])
+        self.assertAlmostEqual(self._masses()[water.uid][0], WATER, places=6)
+
+        # Unchanged formulas are not recomputed
+        self.assertEqual(self.database.refresh_masses(), 0)
+        self.database.update_all_molecules([core.Molecule(uid=water.uid, formula="H2O", known_names=["oxidane"])])
+        self.assertEqual(self.database.refresh_masses(), 0)
+
+        self.database.update_all_molecules([core.Molecule(uid=ethanol.uid, formula="C2H6O", known_names=["ethanol"])])
+        self.assertAlmostEqual(self._masses()[ethanol.uid][0], 46.0418648, places=6)
+
+        # Masses of formulas written behind the database's back are caught up by refresh_masses
+        self.database.connection.execute("UPDATE molecules SET formula = 'D2O' WHERE uid = ?", [water.uid])
+        self.assertEqual(self.database.refresh_masses(), 1)
+        self.assertAlmostEqual(self._masses()[water.uid][0], 20.0231, places=4)
+
+        self.database.connection.execute("DELETE FROM molecules WHERE uid = ?", [water.uid])
+        self.assertNotIn(water.uid, self._masses())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import kemist.core as core
+import kemist.database.migrations as migrations
+from kemist.database import Database
+
+LEGACY_SCHEMA = """
+CREATE TABLE "molecules" (
+    "uid" INTEGER NOT NULL UNIQUE, "iupac" TEXT, "formula" TEXT, "in_libview" INTEGER, "mode" TEXT,
+    PRIMARY KEY("uid" AUTOINCREMENT)
+);
+CREATE TABLE "storage_units" ("name" TEXT NOT NULL UNIQUE, PRIMARY KEY("name"));
+CREATE TABLE "molecule_names" (
+    "name" TEXT NOT NULL, "molecule_uid" INTEGER NOT NULL,
+    FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"), PRIMARY KEY("name")
+);
+CREATE TABLE "molecule_retention_times" (
+    "molecule_uid" INTEGER NOT NULL, "column" TEXT NOT NULL, "retention_time" REAL NOT NULL,
+    FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"), PRIMARY KEY("molecule_uid","column")
+);
+CREATE TABLE "molecule_storage" (
+    "molecule_uid" INTEGER NOT NULL, "storage_name" TEXT NOT NULL,
+    FOREIGN KEY("molecule_uid") REFERENCES "molecules"("uid"),
+    FOREIGN KEY("storage_name") REFERENCES "storage_units"("name")
+);
+CREATE TRIGGER clear_molecules_deps BEFORE DELETE ON molecules
+BEGIN
+    DELETE FROM molecule_names WHERE molecule_uid=OLD.uid;
+    DELETE FROM molecule_retention_times WHERE molecule_uid=OLD.uid;
+    DELETE FROM molecule_storage WHERE molecule_uid=OLD.uid;
+END;
+CREATE TRIGGER clear_storage_units_deps BEFORE DELETE ON storage_units
+BEGIN
+    DELETE FROM molecule_storage WHERE storage_name=OLD.name;
+END;
+INSERT INTO molecules (iupac, formula, in_libview, mode) VALUES (NULL, 'H2O', 1, 'both'), ('ethanol', NULL, 0, 'pos');
+INSERT INTO molecule_names (name, molecule_uid) VALUES ('water', 1), ('oxidane', 1), ('ethanol', 2);
+INSERT INTO molecule_retention_times (molecule_uid, column, retention_time) VALUES (1, 'RT PFP', 1.5);
+INSERT INTO storage_units (name) VALUES ('fridge'), ('shelf');
+INSERT INTO molecule_storage (molecule_uid, storage_name) VALUES (1, 'fridge'), (1, 'fridge'), (2, 'shelf');
+"""
+
+
+class MigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "legacy.db")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_upgrade_legacy_database(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(LEGACY_SCHEMA)
+        connection.close()
+
+        database = Database(self.path)
+        connection = database.connection
+        self.assertEqual(migrations.get_schema_version(connection), migrations.SCHEMA_VERSION)
+
+        molecules = {m.uid: m for m in database.get_molecules()}
+        self.assertEqual(molecules[1].known_names, ["water", "oxidane"])
+        self.assertEqual(molecules[1].retention_times, {"RT PFP": 1.5})
+        self.assertEqual(molecules[2].iupac, "ethanol")
+        self.assertEqual(
+            connection.execute("SELECT molecule_uid, storage_name FROM molecule_storage").fetchall(),
+            [(1, "fridge"), (2, "shelf")],
+        )
+        with self.assertRaises(sqlite3.IntegrityError):
+            connection.execute("INSERT INTO molecule_storage (molecule_uid, storage_name) VALUES (2, 'shelf')")
+
+        self.assertEqual([(name, uid) for name, uid, _ in database.search_names("oxidan")], [("oxidane", 1)])
+        self.assertEqual(database.find_name_candidates(["ethanols"]), {"ethanols": {"ethanol": 2}})
+
+        masses = {uid: mass for uid, mass, _, _ in database.iter_masses()}
+        self.assertEqual(list(masses), [1])
+        self.assertAlmostEqual(masses[1], 18.0105646863, places=6)
+
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT uid FROM molecules WHERE formula = 'H2O'").fetchall()
+        self.assertIn("molecules_formula", plan[0][3])
+        plan = connection.execute("EXPLAIN QUERY PLAN DELETE FROM molecule_names WHERE molecule_uid = 1").fetchall()
+        self.assertIn("molecule_names_molecule_uid", plan[0][3])
+
+        connection.execute("DELETE FROM molecules WHERE uid = 1")
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM molecule_names").fetchone(), (1,))
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM molecule_storage").fetchone(), (1,))
+        connection.execute("DELETE FROM storage_units WHERE name = 'shelf'")
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM molecule_storage").fetchone(), (0,))
+
+    def test_without_trigram_tokenizer(self):
+        # SQLite older than 3.34
+        with mock.patch.object(migrations, "has_trigram_tokenizer", return_value=False):
+            database = Database(self.path)
+            database.make_structure()
+            oxidane, water = core.Molecule(known_names=["oxidane"]), core.Molecule(known_names=["water"])
+            database.update_all_molecules([oxidane, water])
+            self.assertEqual(migrations.get_schema_version(database.connection), migrations.SCHEMA_VERSION)
+            self.assertFalse(migrations.has_name_search(database.connection))
+            self.assertEqual([name for name, _, _ in database.search_names("oxidan")], ["oxidane"])
+            self.assertEqual([name for name, _, _ in database.search_names("oxdane")], ["oxidane"])
+            database.close()
+
+        database = Database(self.path)
+        self.assertTrue(migrations.has_name_search(database.connection))
+        self.assertEqual([name for name, _, _ in database.search_names("oxdane")], ["oxidane"])
+        database.close()
+
+    def test_newer_database(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(f"PRAGMA user_version = {migrations.SCHEMA_VERSION + 1}")
+        connection.close()
+        with self.assertRaises(RuntimeError):
+            Database(self.path)
+
+    def test_migrations_are_idempotent(self):
+        database = Database(self.path)
+        database.make_structure()
+        migrations.migrate(database.connection)
+        self.assertEqual(migrations.get_schema_version(database.connection), migrations.SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import unittest
+from unittest import mock
+
+import kemist.core as core
+
+
+def _random_molecules(rng, count):
+    names = ["water", "waer", "ethanol", "methanol", "glucose", "glucos", "biotin", "choline", "adenine", "adenosine"]
+    molecules = []
+    for _ in range(count):
+        molecules.append(
+            core.Molecule(
+                uid=rng.choice([None, None, 1, 2, 3]),
+                formula=rng.choice([None, None, "H2O", "C2H6O"]),
+                iupac=rng.choice([None, None, "oxidane", "ethanol"]),
+                known_names=rng.sample(names, rng.randint(1, 2)),
+            )
+        )
+    return molecules
+
+
+class MoleculeIndexTest(unittest.TestCase):
+    def test_find_strict(self):
+        water = core.Molecule(formula="H2O", known_names=["water"])
+        ethanol = core.Molecule(uid=2, known_names=["ethanol"])
+        index = core.MoleculeIndex([water, ethanol])
+
+        self.assertIs(index.find_strict(core.Molecule(formula="H2O")), water)
+        self.assertIs(index.find_strict(core.Molecule(known_names=["ethanol"])), ethanol)
+        self.assertIsNone(index.find_strict(core.Molecule(uid=3, known_names=["ethanol"])))
+        self.assertIsNone(index.find_strict(core.Molecule(known_names=["waer"])))
+        # Strict lookups never index names for relaxed matching
+        self.assertIsNone(index._names)
+        self.assertEqual(list(index.iter_relaxed(core.Molecule(known_names=["waer"]))), [water])
+        index.add(core.Molecule(known_names=["wter"]))
+        self.assertIn("wter", index.names)
+
+    def test_update_after_merge(self):
+        water = core.Molecule(known_names=["water"])
+        index = core.MoleculeIndex([water])
+        self.assertIsNone(index.find_strict(core.Molecule(formula="H2O", known_names=["oxidane"])))
+
+        water.merge_with(core.Molecule(formula="H2O", known_names=["dihydrogen oxide"]))
+        index.update(water)
+        self.assertIs(index.find_strict(core.Molecule(formula="H2O", known_names=["oxidane"])), water)
+        self.assertIs(index.find_strict(core.Molecule(known_names=["dihydrogen oxide"])), water)
+        self.assertEqual(list(index.iter_relaxed(core.Molecule(formula="H2O", known_names=["wate"]))), [])
+
+    def test_retention_time_filter(self):
+        close = core.Molecule(known_names=["water"], retention_times={"RT PFP": 1.5, "RT Scherzo": 4.0})
+        far = core.Molecule(known_names=["watre"], retention_times={"RT PFP": 3.0})
+        unknown = core.Molecule(known_names=["wate"], retention_times={"RT C18": 9.0})
+        index = core.MoleculeIndex([close, far, unknown])
+
+        query = core.Molecule(known_names=["waer"], retention_times={"RT PFP": 1.7, "RT Scherzo": 4.1})
+        self.assertEqual(list(index.iter_relaxed(query)), [close, far, unknown])
+        self.assertEqual(list(index.iter_relaxed(query, rt_tolerance=0.5)), [close, unknown])
+        self.assertEqual(list(index.iter_relaxed(query, rt_tolerance=0.05)), [unknown])
+        # Names of candidates rejected by retention time are not compared
+        are_name_close = core.molecule_index._are_name_close
+        with mock.patch("kemist.core.molecule_index._are_name_close", wraps=are_name_close) as compare:
+            list(index.iter_relaxed(query, rt_tolerance=0.5))
+        self.assertNotIn("watre", {c.args[1] for c in compare.call_args_list})
+        without_rt = core.Molecule(known_names=["waer"])
+        self.assertEqual(list(index.iter_relaxed(without_rt, rt_tolerance=0.05)), [close, far, unknown])
+
+        # Molecules added or merged afterwards are filtered too
+        late = core.Molecule(known_names=["waters"], retention_times={"RT PFP": 8.0})
+        index.add(late)
+        unknown.merge_with(core.Molecule(retention_times={"RT PFP": 1.6}))
+        index.update(unknown)
+        self.assertEqual(list(index.iter_relaxed(query, rt_tolerance=0.5)), [close, unknown])
+
+    def test_close_pairs(self):
+        water = core.Molecule(known_names=["water"])
+        glucose = core.Molecule(formula="C6H12O6", known_names=["glucose"])
+        index = core.MoleculeIndex([water, glucose])
+        close_pairs = {core.name_pair("waer", "water"), core.name_pair("glucose", "glucos")}
+
+        # Names of known pairs are not compared again, but conflicting formulas still tell molecules apart
+        with mock.patch("kemist.core.molecule._are_name_close", side_effect=AssertionError):
+            waer = core.Molecule(known_names=["waer"])
+            self.assertEqual(list(index.iter_relaxed(waer, close_pairs=close_pairs)), [water])
+            glucos = core.Molecule(formula="C6H12O7", known_names=["glucos"])
+            self.assertEqual(list(index.iter_relaxed(glucos, close_pairs=close_pairs)), [])
+
+    def test_same_results_as_linear_scan(self):
+        rng = random.Random(42)
+        existing = _random_molecules(rng, 60)
+        index = core.MoleculeIndex(existing)
+
+        for m in _random_molecules(rng, 60):
+            strict = next(filter(lambda e: core.are_same_molecules(m, e) == core.Equivalence.STRICT, existing), None)
+            relaxed = [e for e in existing if core.are_same_molecules(m, e) == core.Equivalence.RELAXED]
+            self.assertIs(index.find_strict(m), strict)
+            # Close names are found by the NameIndex, fuzzysearch is never called
+            with mock.patch("kemist.core.molecule._are_name_close", side_effect=AssertionError):
+                self.assertEqual(list(index.iter_relaxed(m)), relaxed)
+
+
+if __name__ == "__main__":
+    unittest.main()
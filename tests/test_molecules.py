@@ -77,6 +77,47 @@ class MoleculesTest(unittest.TestCase):
         self.assertEqual(core.are_same_molecules(m1, m2), core.Equivalence.RELAXED)
         self.assertEqual(core.are_same_molecules(m2, m1), core.Equivalence.RELAXED)
 
+    def test_slots(self):
+        m = core.Molecule(known_names=["water"])
+        with self.assertRaises(AttributeError):
+            m.color = "blue"
+        m.known_names = ["oxidane", "water"]
+        self.assertIsInstance(m.known_names, core.NameList)
+        self.assertEqual(m.known_names, ["oxidane", "water"])
+
+
+class NameListTest(unittest.TestCase):
+    def test_membership_follows_mutations(self):
+        size = core.NameList.INDEXED_LENGTH * 2
+        names = core.NameList(f"name {i}" for i in range(size))
+        reference = list(names)
+        self.assertIn("name 3", names)
+        self.assertNotIn("water", names)
+        self.assertNotIn(["unhashable"], names)
+
+        for mutate in [
+            lambda l: l.append("water"),
+            lambda l: l.extend(["water", "oxidane"]),
+            lambda l: l.insert(0, "ice"),
+            lambda l: l.remove("water"),
+            lambda l: l.pop(),
+            lambda l: l.pop(0),
+            lambda l: l.__setitem__(1, "steam"),
+            lambda l: l.__setitem__(slice(2, 5), ["a", "b"]),
+            lambda l: l.__delitem__(slice(0, 3)),
+            lambda l: l.__delitem__(-1),
+            lambda l: l.__iadd__(["name 3"]),
+        ]:
+            mutate(names)
+            mutate(reference)
+            self.assertEqual(names, reference)
+            for name in set(reference) | {"water", "oxidane", "ice", "steam", "a", "b", "name 0", "name 3"}:
+                self.assertEqual(name in names, name in reference, name)
+
+        names.clear()
+        self.assertNotIn("name 3", names)
+        self.assertEqual(names, [])
+
 
 if __name__ == "__main__":
     unittest.main()
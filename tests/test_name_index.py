@@ -0,0 +1,43 @@
+import random
+import unittest
+
+import kemist.core as core
+import kemist.core.molecule
+
+
+def _random_name(rng):
+    return "".join(rng.choice("abcde-") for _ in range(rng.randint(1, 9)))
+
+
+class NameIndexTest(unittest.TestCase):
+    def test_close_names(self):
+        index = core.NameIndex(["water", "dihydrogen oxide", "ethanol", "methanol", "glucose"])
+        self.assertEqual(index.close_names("waer"), {"water"})
+        self.assertEqual(index.close_names("ethanol"), {"ethanol", "methanol"})
+        self.assertEqual(index.close_names("hydrogen"), {"dihydrogen oxide"})
+        self.assertEqual(index.close_names("d-glucose monohydrate"), {"glucose"})
+        self.assertEqual(index.close_names("biotin"), set())
+
+    def test_same_results_as_fuzzysearch(self):
+        rng = random.Random(7)
+        names = {_random_name(rng) for _ in range(200)}
+        index = core.NameIndex(names)
+        self.assertEqual(len(index), len(names))
+
+        for _ in range(100):
+            query = _random_name(rng)
+            expected = {name for name in names if core.molecule._are_name_close(query, name)}
+            self.assertTrue(index.close_names(query) <= index.candidates(query))
+            self.assertEqual(index.close_names(query), expected)
+
+    def test_near_substring(self):
+        rng = random.Random(3)
+        for _ in range(3000):
+            a, b = _random_name(rng), _random_name(rng)
+            self.assertEqual(
+                core.name_index._are_name_close(a, b), core.molecule._are_name_close(a, b), msg=f"{a!r} {b!r}"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import random
+import unittest
+
+import kemist.core as core
+import kemist.core.molecule
+
+
+def _random_name(rng):
+    return "".join(rng.choice("abcde-") for _ in range(rng.randint(1, 9)))
+
+
+class CloseNameFinderTest(unittest.TestCase):
+    def test_same_results_as_fuzzysearch(self):
+        rng = random.Random(11)
+        names = [_random_name(rng) for _ in range(150)]
+        known_names = {_random_name(rng) for _ in range(150)}
+
+        expected_close_names = {
+            name: {other for other in names if core.molecule._are_name_close(name, other)} for name in names
+        }
+        expected_known_names = {
+            name: {other for other in known_names if core.molecule._are_name_close(name, other)} for name in names
+        }
+        for jobs in [1, 2]:
+            finder = core.CloseNameFinder(jobs=jobs, block_size=16)
+            try:
+                close_names = finder.find(names)
+                known_index = core.NameIndex(known_names)
+                verified = finder.verify({name: known_index.candidates(name) for name in names})
+            finally:
+                finder.close()
+
+            self.assertEqual(close_names, expected_close_names)
+            self.assertEqual(verified, expected_known_names)
+
+if __name__ == "__main__":
+    unittest.main()
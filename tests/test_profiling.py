@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import pstats
+import tempfile
+import unittest
+
+import kemist.core as core
+from kemist.core.profiling import Profiler
+from kemist.database import Database
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span("outer"):
+            profiler.count("calls")
+        self.assertEqual(profiler.timed("timed")(lambda x: x + 1)(1), 2)
+        self.assertEqual(profiler.as_dict(), {"spans": [], "counters": {}})
+
+    def test_nested_spans(self):
+        profiler = Profiler()
+        profiler.enabled = True
+        inner = profiler.timed("inner")(lambda: profiler.count("calls", 2))
+        with profiler.span("outer"):
+            inner()
+            inner()
+        with profiler.span("other"):
+            with profiler.span("inner"):
+                pass
+
+        profile = profiler.as_dict()
+        self.assertEqual(
+            [(s["path"], s["calls"]) for s in profile["spans"]],
+            [("outer", 1), ("outer/inner", 2), ("other", 1), ("other/inner", 1)],
+        )
+        self.assertEqual(profile["counters"], {"calls": 4})
+        self.assertEqual(
+            [line.split()[0] for line in profiler.summary().splitlines()],
+            ["span", "outer", "inner", "other", "inner", "counter", "calls"],
+        )
+
+
+class ProfileSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        core.logger.setLevel(logging.WARNING)
+
+    def tearDown(self):
+        core.logger.setLevel(logging.INFO)
+        self.folder.cleanup()
+
+    def test_database_counters(self):
+        json_path = os.path.join(self.folder.name, "profile.json")
+        cprofile_path = os.path.join(self.folder.name, "profile.prof")
+        with core.profile_session(json_path, cprofile_path):
+            database = Database(":memory:")
+            database.make_structure()
+            database.update_all_molecules(
+                [core.Molecule(formula="H2O", known_names=["water", "oxidane"], retention_times={"RT PFP": 1.5})]
+            )
+            database.get_molecules()
+        self.assertFalse(core.profiler.enabled)
+
+        with open(json_path) as file:
+            profile = json.load(file)
+        # Masses are refreshed when the schema is migrated
+        self.assertEqual(
+            [s["path"] for s in profile["spans"]], ["refresh_masses", "update_all_molecules", "get_molecules"]
+        )
+        # 1 molecule, 2 names, 1 retention time and 1 mass
+        self.assertEqual(profile["counters"]["rows written"], 5)
+        self.assertGreater(profile["counters"]["sql statements"], 0)
+        self.assertTrue(pstats.Stats(cprofile_path).total_calls > 0)
+
+        # Nothing is recorded once the session is over
+        database.get_molecules()
+        self.assertEqual(len(core.profiler.as_dict()["spans"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
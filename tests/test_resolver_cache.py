@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import kemist.core as core
+
+
+class CountingResolver(object):
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = 0
+
+    def __call__(self, identifier, representation):
+        self.calls += 1
+        return self.answers.get((identifier, representation))
+
+
+class ResolverCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_positive_and_negative_caching(self):
+        resolver = CountingResolver({("ethanol", "iupac_name"): ["ethanol", "ethyl alcohol"]})
+        cache = core.ResolverCache(self.path)
+        cached = core.CachedResolver(resolver, cache)
+
+        for _ in range(3):
+            self.assertEqual(cached("ethanol", "iupac_name"), ["ethanol", "ethyl alcohol"])
+            self.assertIsNone(cached("unobtainium", "iupac_name"))
+        self.assertEqual(resolver.calls, 2)
+        cache.close()
+
+        cached = core.CachedResolver(resolver, core.ResolverCache(self.path))
+        self.assertIsNone(cached("unobtainium", "iupac_name"))
+        self.assertEqual(resolver.calls, 2)
+
+        stats = cached.cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["negative_entries"], 1)
+        self.assertEqual(stats["expired_entries"], 0)
+
+        cached.cache.clear()
+        self.assertEqual(cached.cache.stats()["entries"], 0)
+
+    def test_completer_cache(self):
+        resolver = CountingResolver({("water", "iupac_name"): "oxidane", ("oxidane", "formula"): "H2O"})
+        completer = core.MoleculeCompleter(resolve=resolver, cache=core.ResolverCache(self.path))
+        molecules = [core.Molecule(known_names=["water"]) for _ in range(2)]
+        completer.complete(molecules[:1])
+        completer.complete(molecules[1:])
+        self.assertEqual([m.formula for m in molecules], ["H2O", "H2O"])
+        self.assertEqual(resolver.calls, 2)
+
+    def test_expiry(self):
+        resolver = CountingResolver({("water", "iupac_name"): "oxidane"})
+        cached = core.CachedResolver(resolver, core.ResolverCache(self.path, ttl=60, negative_ttl=-1))
+        cached("water", "iupac_name")
+        cached("unobtainium", "iupac_name")
+        self.assertEqual(cached.cache.stats()["expired_entries"], 1)
+
+        cached("water", "iupac_name")
+        cached("unobtainium", "iupac_name")
+        self.assertEqual(resolver.calls, 3)
+
+    def test_lru_eviction(self):
+        cache = core.ResolverCache(self.path, max_entries=2)
+        cache.set("a", "formula", "A")
+        cache.set("b", "formula", "B")
+        self.assertEqual(cache.get("a", "formula"), "A")
+        cache.set("c", "formula", "C")
+
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.get("a", "formula"), "A")
+        self.assertEqual(cache.get("b", "formula", default="missing"), "missing")
+        self.assertEqual(cache.get("c", "formula"), "C")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import random
+import unittest
+
+import kemist.core as core
+
+
+class RetentionTimeIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.rows = [(rng.choice(["RT PFP", "RT Scherzo"]), uid, round(rng.uniform(0, 10), 2)) for uid in range(500)]
+        self.index = core.RetentionTimeIndex(self.rows)
+
+    def _brute_force(self, column, rt, tolerance):
+        return sorted((r, uid) for c, uid, r in self.rows if c == column and rt - tolerance <= r <= rt + tolerance)
+
+    def test_search(self):
+        self.assertEqual(sorted(self.index.columns), ["RT PFP", "RT Scherzo"])
+        self.assertEqual(len(self.index), 500)
+        self.assertNotIn("RT C18", self.index)
+
+        uids, rts = self.index.search("RT PFP", 5.0, 0.2)
+        self.assertEqual(sorted(zip(rts.tolist(), uids.tolist())), self._brute_force("RT PFP", 5.0, 0.2))
+        uids, rts = self.index.search("RT PFP", 50.0, 0.2)
+        self.assertEqual(len(uids), 0)
+
+    def test_search_many(self):
+        queries = [0.0, 2.5, 2.5, 7.31, 11.0]
+        indices, uids, rts = self.index.search_many("RT Scherzo", queries, 0.1)
+        self.assertEqual(indices.tolist(), sorted(indices.tolist()))
+        for i, rt in enumerate(queries):
+            found = sorted((r, u) for q, u, r in zip(indices.tolist(), uids.tolist(), rts.tolist()) if q == i)
+            self.assertEqual(found, self._brute_force("RT Scherzo", rt, 0.1))
+
+    def test_empty(self):
+        index = core.RetentionTimeIndex([])
+        self.assertEqual(index.columns, [])
+        indices, uids, rts = core.RetentionTimeIndex([("RT PFP", 1, 1.0)]).search_many("RT PFP", [], 0.1)
+        self.assertEqual(len(indices), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+
+import kemist.core as core
+from kemist.apps.kemist_client import KemistClient, connect_to_server
+from kemist.apps.kemist_query import QueryIndexes
+from kemist.apps.kemist_server import KemistServer
+from kemist.database import Database
+
+
+class KemistServerTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "library")
+        self.socket_path = os.path.join(self.folder.name, "library.sock")
+        database = Database(self.path)
+        database.make_structure()
+        water = core.Molecule(formula="H2O", known_names=["water"], mode="+", retention_times={"RT PFP": 1.0})
+        ethanol = core.Molecule(formula="C2H6O", known_names=["ethanol"], mode="+", retention_times={"RT PFP": 2.0})
+        database.update_all_molecules([water, ethanol])
+        database.update_all_storage_units([core.StorageUnit("fridge", [core.Molecule(known_names=["water"])])])
+        database.close()
+
+        self.server = KemistServer(self.path)
+        self.thread = threading.Thread(target=self.server.run, args=(self.socket_path, 0))
+        self.thread.start()
+        self.assertTrue(self.server.ready.wait(10))
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.stop()
+            self.thread.join()
+        self.folder.cleanup()
+
+    def _local_answer(self, request):
+        database = Database(self.path)
+        response = QueryIndexes(database).answer(request)
+        database.close()
+        return json.loads(json.dumps(response))
+
+    def test_answers(self):
+        client = connect_to_server(self.socket_path)
+        self.assertIsNotNone(client)
+        requests = [
+            {"verb": "rt", "column": "RT PFP", "retention_times": [1.05, 3.0], "tolerance": 0.1},
+            {"verb": "mass", "mzs": [19.0178], "ppm": 10.0},
+            {"verb": "locate", "names": ["Water", "ethanol"]},
+            {"verb": "search", "queries": ["ethnol"], "limit": 10},
+        ]
+        for request in requests:
+            self.assertEqual(client.request(request), self._local_answer(request))
+        self.assertEqual(client.request(requests), [self._local_answer(request) for request in requests])
+
+        http = KemistClient(url=f"http://127.0.0.1:{self.server.port}")
+        self.assertEqual(http.request(requests[2]), self._local_answer(requests[2]))
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.server.port}") as response:
+            self.assertEqual(json.loads(response.read()), {"database": self.path})
+
+    def test_errors(self):
+        client = KemistClient(self.socket_path)
+        request = {"verb": "rt", "column": "RT C18", "retention_times": [], "tolerance": 1}
+        self.assertIn("error", client.request(request))
+        self.assertIn("error", client.request({"verb": "mass"}))
+        self.assertIn("error", client.request({"verb": "nope"}))
+        self.assertIn("error", client.request([1])[0])
+
+        # Fields of the wrong type, over the socket and over HTTP
+        http = KemistClient(url=f"http://127.0.0.1:{self.server.port}")
+        requests = [
+            {"verb": "rt", "column": "RT PFP", "retention_times": [1.0], "tolerance": None},
+            {"verb": "locate", "names": [1]},
+            {"verb": "mass", "mzs": "nope", "ppm": 10.0},
+        ]
+        for request in requests:
+            self.assertIn("error", client.request(request))
+            self.assertIn("error", http.request(request))
+
+        # Unexpected failures are answered as errors too, and the server keeps answering on the same connection
+        with mock.patch.object(self.server.indexes, "answer", side_effect=ZeroDivisionError):
+            self.assertIn("error", client.request(requests[1]))
+            self.assertIn("error", http.request(requests[1]))
+        self.assertEqual(client.request({"verb": "locate", "names": ["water"]})["rows"], [["water", "fridge"]])
+
+    def test_reload(self):
+        client = KemistClient(self.socket_path)
+        request = {"verb": "rt", "column": "RT PFP", "retention_times": [3.0], "tolerance": 0.1}
+        self.assertEqual(client.request(request)["rows"], [])
+
+        database = Database(self.path)
+        methanol = core.Molecule(formula="CH4O", known_names=["methanol"], retention_times={"RT PFP": 3.0})
+        database.update_all_molecules([methanol])
+        database.close()
+        self.assertEqual(len(client.request(request)["rows"]), 1)
+
+    def test_single_server(self):
+        with self.assertRaises(RuntimeError):
+            KemistServer(self.path).run(self.socket_path)
+
+    def test_no_server(self):
+        self.assertIsNone(connect_to_server(os.path.join(self.folder.name, "other.sock")))
+        self.server.stop()
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertIsNone(connect_to_server(self.socket_path))
+
+
+if __name__ == "__main__":
+    unittest.main()